@@ -0,0 +1,41 @@
+"""GiST indexes on measurements and layer extents
+
+Revision ID: a7c9e1f3b562
+Revises: f6b8d0e2a451
+Create Date: 2026-10-18 14:20:33.904127
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c9e1f3b562'
+down_revision: Union[str, None] = 'f6b8d0e2a451'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Tables created with create_all may already have GeoAlchemy2's implicit index
+    op.execute('DROP INDEX IF EXISTS idx_measurements_geometry')
+    op.create_index('ix_measurements_geometry', 'measurements', ['geometry'], unique=False, postgresql_using='gist')
+
+    op.add_column('layers', sa.Column('extent', geoalchemy2.types.Geometry(geometry_type='POLYGON', srid=4326, spatial_index=False, from_text='ST_GeomFromEWKT', name='geometry'), nullable=True))
+    op.execute("""
+        UPDATE layers
+        SET extent = ST_MakeEnvelope(
+            (bbox->>0)::float8, (bbox->>1)::float8, (bbox->>2)::float8, (bbox->>3)::float8, 4326
+        )
+        WHERE CASE WHEN json_typeof(bbox) = 'array' THEN json_array_length(bbox) = 4 ELSE false END
+    """)
+    op.create_index('ix_layers_extent', 'layers', ['extent'], unique=False, postgresql_using='gist')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_layers_extent', table_name='layers', postgresql_using='gist')
+    op.drop_column('layers', 'extent')
+    op.drop_index('ix_measurements_geometry', table_name='measurements', postgresql_using='gist')
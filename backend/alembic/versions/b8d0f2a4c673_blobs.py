@@ -0,0 +1,40 @@
+"""Content-addressed blobs shared by layers
+
+Revision ID: b8d0f2a4c673
+Revises: a7c9e1f3b562
+Create Date: 2026-10-18 16:05:41.218734
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b8d0f2a4c673'
+down_revision: Union[str, None] = 'a7c9e1f3b562'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('path', sa.String(length=512), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    # Existing layers keep their own files (blob_sha256 stays NULL)
+    op.add_column('layers', sa.Column('blob_sha256', sa.String(length=64), nullable=True))
+    op.create_foreign_key('fk_layers_blob_sha256', 'layers', 'blobs', ['blob_sha256'], ['sha256'])
+    op.create_index(op.f('ix_layers_blob_sha256'), 'layers', ['blob_sha256'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_layers_blob_sha256'), table_name='layers')
+    op.drop_constraint('fk_layers_blob_sha256', 'layers', type_='foreignkey')
+    op.drop_column('layers', 'blob_sha256')
+    op.drop_table('blobs')
@@ -0,0 +1,39 @@
+"""Vector layer features table
+
+Revision ID: c3e5a7b9d125
+Revises: b2d4f6a8c013
+Create Date: 2026-10-18 11:20:05.913482
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e5a7b9d125'
+down_revision: Union[str, None] = 'b2d4f6a8c013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('layer_features',
+    sa.Column('id', sa.BigInteger(), nullable=False),
+    sa.Column('layer_id', sa.Integer(), nullable=False),
+    sa.Column('properties', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+    sa.Column('geom', geoalchemy2.types.Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False, from_text='ST_GeomFromEWKT', name='geometry'), nullable=False),
+    sa.ForeignKeyConstraint(['layer_id'], ['layers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_layer_features_layer_id'), 'layer_features', ['layer_id'], unique=False)
+    op.create_index('ix_layer_features_geom', 'layer_features', ['geom'], unique=False, postgresql_using='gist')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_layer_features_geom', table_name='layer_features', postgresql_using='gist')
+    op.drop_index(op.f('ix_layer_features_layer_id'), table_name='layer_features')
+    op.drop_table('layer_features')
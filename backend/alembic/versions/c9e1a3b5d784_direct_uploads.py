@@ -0,0 +1,28 @@
+"""Direct multipart uploads to object storage
+
+Revision ID: c9e1a3b5d784
+Revises: b8d0f2a4c673
+Create Date: 2026-10-18 18:27:09.530611
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9e1a3b5d784'
+down_revision: Union[str, None] = 'b8d0f2a4c673'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('upload_sessions', sa.Column('storage_upload_id', sa.String(length=1024), nullable=True))
+    op.add_column('upload_sessions', sa.Column('part_size', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('upload_sessions', 'part_size')
+    op.drop_column('upload_sessions', 'storage_upload_id')
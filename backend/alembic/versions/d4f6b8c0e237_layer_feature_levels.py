@@ -0,0 +1,37 @@
+"""Simplified vector geometries per zoom level
+
+Revision ID: d4f6b8c0e237
+Revises: c3e5a7b9d125
+Create Date: 2026-10-18 12:05:41.207319
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import geoalchemy2
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4f6b8c0e237'
+down_revision: Union[str, None] = 'c3e5a7b9d125'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('layer_feature_levels',
+    sa.Column('feature_id', sa.BigInteger(), nullable=False),
+    sa.Column('zoom', sa.SmallInteger(), nullable=False),
+    sa.Column('layer_id', sa.Integer(), nullable=False),
+    sa.Column('geom', geoalchemy2.types.Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False, from_text='ST_GeomFromEWKT', name='geometry'), nullable=False),
+    sa.ForeignKeyConstraint(['feature_id'], ['layer_features.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['layer_id'], ['layers.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('feature_id', 'zoom')
+    )
+    op.create_index('ix_layer_feature_levels_layer_zoom', 'layer_feature_levels', ['layer_id', 'zoom'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_layer_feature_levels_layer_zoom', table_name='layer_feature_levels')
+    op.drop_table('layer_feature_levels')
@@ -0,0 +1,32 @@
+"""Unique project membership per user
+
+Revision ID: e5a7c9d1f349
+Revises: d4f6b8c0e237
+Create Date: 2026-10-18 12:41:17.530864
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5a7c9d1f349'
+down_revision: Union[str, None] = 'd4f6b8c0e237'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keep the most recent row of any duplicated membership
+    op.execute("""
+        DELETE FROM project_members a
+        USING project_members b
+        WHERE a.project_id = b.project_id AND a.user_id = b.user_id AND a.id < b.id
+    """)
+    op.create_unique_constraint('uq_project_members_project_user', 'project_members', ['project_id', 'user_id'])
+
+
+def downgrade() -> None:
+    op.drop_constraint('uq_project_members_project_user', 'project_members', type_='unique')
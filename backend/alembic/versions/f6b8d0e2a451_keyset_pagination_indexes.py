@@ -0,0 +1,32 @@
+"""Indexes for keyset pagination of projects, layers and measurements
+
+Revision ID: f6b8d0e2a451
+Revises: e5a7c9d1f349
+Create Date: 2026-10-18 13:52:09.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6b8d0e2a451'
+down_revision: Union[str, None] = 'e5a7c9d1f349'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_projects_created_at_id', 'projects', ['created_at', 'id'], unique=False)
+    op.create_index('ix_projects_owner_created_at_id', 'projects', ['owner_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_layers_project_created_at_id', 'layers', ['project_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_measurements_project_created_at_id', 'measurements', ['project_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_measurements_project_created_at_id', table_name='measurements')
+    op.drop_index('ix_layers_project_created_at_id', table_name='layers')
+    op.drop_index('ix_projects_owner_created_at_id', table_name='projects')
+    op.drop_index('ix_projects_created_at_id', table_name='projects')
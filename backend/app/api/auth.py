@@ -2,33 +2,41 @@ from datetime import timedelta
 from typing import Any
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import schemas, models
 from app.api import deps
-from app.core import security
+from app.core import hashing, security
 from app.core.config import settings
 
 router = APIRouter()
 
 
 @router.post("/login", response_model=schemas.auth.Token)
-def login_access_token(
-    db: Session = Depends(deps.get_db), form_data: OAuth2PasswordRequestForm = Depends()
+async def login_access_token(
+    db: AsyncSession = Depends(deps.get_db), form_data: OAuth2PasswordRequestForm = Depends()
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
     if not user:
          # Generic error message to prevent enumeration
          raise HTTPException(status_code=400, detail="Incorrect username or password")
     
-    if not security.verify_password(form_data.password, user.hashed_password):
+    # Password checks run in the hashing process pool
+    valid, new_hash = await hashing.verify_password(form_data.password, user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
         
     if not user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
+
+    if new_hash:
+        # Work factor changed since this hash was made
+        user.hashed_password = new_hash
+        await db.commit()
         
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     return {
@@ -40,16 +48,16 @@ def login_access_token(
 
 
 @router.post("/register", response_model=schemas.user.User)
-def register_user(
+async def register_user(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     user_in: schemas.user.UserCreate,
 ) -> Any:
     """
     Create new user. 
     Note: In production this should be protected to Admin only.
     """
-    user = db.query(models.User).filter(models.User.username == user_in.username).first()
+    user = await db.scalar(select(models.User).where(models.User.username == user_in.username))
     if user:
         raise HTTPException(
             status_code=400,
@@ -58,7 +66,7 @@ def register_user(
     
     # Check email only if provided
     if user_in.email:
-        user_email = db.query(models.User).filter(models.User.email == user_in.email).first()
+        user_email = await db.scalar(select(models.User).where(models.User.email == user_in.email))
         if user_email:
             raise HTTPException(
                 status_code=400,
@@ -68,12 +76,12 @@ def register_user(
     user_obj = models.User(
         username=user_in.username,
         email=user_in.email,
-        hashed_password=security.get_password_hash(user_in.password),
+        hashed_password=await hashing.hash_password(user_in.password),
         full_name=user_in.full_name,
         role=user_in.role or models.UserRole.USER,
         is_active=True,
     )
     db.add(user_obj)
-    db.commit()
-    db.refresh(user_obj)
+    await db.commit()
+    await db.refresh(user_obj)
     return user_obj
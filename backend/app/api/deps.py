@@ -1,48 +1,62 @@
-from typing import Generator, Optional
-from fastapi import Depends, HTTPException, status
+from datetime import datetime
+from typing import AsyncGenerator, List, Optional, Tuple
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
 from pydantic import ValidationError
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
 from app.core import security
+from app.core.cache import RedisCache, TTLCache
 from app.core.config import settings
-from app.database import SessionLocal
+from app.core.principals import get_principal_cache, principal_from_fields
+from app.models.project import ProjectMemberRole
+from app.database import AsyncSessionLocal
+from app.utils.pagination import decode_cursor
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"/api/auth/login"
 )
 
 
-def get_db() -> Generator:
-    try:
-        db = SessionLocal()
+async def get_db() -> AsyncGenerator[AsyncSession, None]:
+    # Sync services (app.services) run on it through ``await db.run_sync(...)``
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
+async def get_current_user(
+    db: AsyncSession = Depends(get_db), token: str = Depends(reusable_oauth2)
 ) -> models.User:
+    cache = get_principal_cache()
+    cached = cache.get(token) if cache else None
+    if cached is not None:
+        # No SELECT: a read-only Principal with the same fields as the User
+        return principal_from_fields(cached)
+
     try:
         payload = jwt.decode(
             token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
         )
         token_data = schemas.auth.TokenPayload(**payload)
-    except (JWTError, ValidationError):
+        user_id = int(token_data.sub)
+    except (JWTError, ValidationError, TypeError, ValueError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Could not validate credentials",
         )
-    user = db.query(models.User).filter(models.User.id == int(token_data.sub)).first()
+    generation = cache.generation(user_id) if cache else 0
+    user = await db.get(models.User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    if cache:
+        cache.set(token, user, generation, expires_at=payload.get("exp"))
     return user
 
 
-def get_current_active_user(
+async def get_current_active_user(
     current_user: models.User = Depends(get_current_user),
 ) -> models.User:
     if not current_user.is_active:
@@ -50,7 +64,7 @@ def get_current_active_user(
     return current_user
 
 
-def get_current_active_superuser(
+async def get_current_active_superuser(
     current_user: models.User = Depends(get_current_user),
 ) -> models.User:
     if not current_user.is_superuser:
@@ -58,3 +72,158 @@ def get_current_active_superuser(
             status_code=400, detail="The user doesn't have enough privileges"
         )
     return current_user
+
+
+def parse_bbox(bbox: Optional[str]) -> Optional[List[float]]:
+    """Parse a `minx,miny,maxx,maxy` query parameter"""
+    if bbox is None:
+        return None
+    try:
+        values = [float(v) for v in bbox.split(",")]
+    except ValueError:
+        values = []
+    if len(values) != 4 or values[0] > values[2] or values[1] > values[3]:
+        raise HTTPException(status_code=422, detail="bbox must be minx,miny,maxx,maxy")
+    return values
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """Decode a `cursor` query parameter (see app.utils.pagination)"""
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Invalid cursor")
+
+
+def not_modified(request: Request, etag: str) -> bool:
+    """True if the client already has this representation (If-None-Match)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in tags or "*" in tags
+
+
+# Project permissions. The caller's effective role on a project is resolved
+# with one query (project LEFT JOIN its membership row), memoized on the
+# request's session and cached briefly across requests. Like principals,
+# cached roles live in Redis with AUTH_CACHE_URL and are guarded by a
+# per-membership generation bumped on every change (and a per-project one
+# bumped when the project is deleted), so all workers stop using a revoked
+# role at once; without it, other processes keep it for
+# up to PROJECT_ROLE_CACHE_TTL seconds.
+ROLE_RANK = {
+    ProjectMemberRole.VIEWER: 1,
+    ProjectMemberRole.EDITOR: 2,
+    ProjectMemberRole.OWNER: 3,
+}
+
+_NO_ROLE = ""  # Cached "project exists but no access"
+_project_roles = None
+
+
+def _project_role_cache():
+    global _project_roles
+    if _project_roles is None:
+        if settings.AUTH_CACHE_URL:
+            _project_roles = RedisCache(settings.AUTH_CACHE_URL, prefix="geovisor:roles:")
+        else:
+            _project_roles = TTLCache(maxsize=10000, ttl=settings.PROJECT_ROLE_CACHE_TTL)
+    return _project_roles
+
+
+async def _load_project_role(
+    db: AsyncSession, project_id: int, user: models.User
+) -> Tuple[Optional[models.Project], Optional[ProjectMemberRole]]:
+    result = await db.execute(
+        select(models.Project, models.ProjectMember.role)
+        .outerjoin(
+            models.ProjectMember,
+            and_(
+                models.ProjectMember.project_id == models.Project.id,
+                models.ProjectMember.user_id == user.id,
+            ),
+        )
+        .where(models.Project.id == project_id)
+    )
+    row = result.first()
+    if row is None:
+        return None, None
+    project, member_role = row
+    if user.is_superuser or project.owner_id == user.id:
+        return project, ProjectMemberRole.OWNER
+    return project, member_role
+
+
+async def get_project_role(
+    db: AsyncSession, project_id: int, user: models.User, load_project: bool = False
+) -> Tuple[Optional[models.Project], Optional[ProjectMemberRole]]:
+    """
+    (project, effective role) of a user on a project; the role is None
+    without access. Raises 404 if the project doesn't exist. The project
+    is only loaded when needed or asked for (``load_project``).
+    """
+    memo = db.info.setdefault("project_roles", {})
+    key = (project_id, user.id)
+    if key in memo:
+        project, role = memo[key]
+        if project is None and load_project:
+            project = await db.get(models.Project, project_id)
+            memo[key] = (project, role)
+        return project, role
+
+    cache = _project_role_cache()
+    cache_key = f"{project_id}:{user.id}"
+    # Read before loading the role, so a concurrent change wins
+    generation = [cache.counter(f"gen:{project_id}"), cache.counter(f"gen:{cache_key}")]
+    cached = cache.get(cache_key)
+    if cached is not None and cached["gen"] == generation:
+        role = ProjectMemberRole(cached["role"]) if cached["role"] else None
+        project = await db.get(models.Project, project_id) if load_project else None
+        if project is not None or not load_project:
+            memo[key] = (project, role)
+            return project, role
+
+    project, role = await _load_project_role(db, project_id, user)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    cache.set(
+        cache_key, {"gen": generation, "role": role.value if role else _NO_ROLE},
+        ttl=settings.PROJECT_ROLE_CACHE_TTL,
+    )
+    memo[key] = (project, role)
+    return project, role
+
+
+async def require_project_role(
+    db: AsyncSession, project_id: int, user: models.User, minimum: ProjectMemberRole
+) -> ProjectMemberRole:
+    """Effective role of the user, 400 if below ``minimum``"""
+    _, role = await get_project_role(db, project_id, user)
+    if role is None or ROLE_RANK[role] < ROLE_RANK[minimum]:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return role
+
+
+async def get_project_for_user(
+    db: AsyncSession, project_id: int, user: models.User, minimum: ProjectMemberRole
+) -> models.Project:
+    """Project the user has at least ``minimum`` role on (404 / 400 otherwise)"""
+    project, role = await get_project_role(db, project_id, user, load_project=True)
+    if project is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    if role is None or ROLE_RANK[role] < ROLE_RANK[minimum]:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return project
+
+
+def invalidate_project_roles(project_id: int, user_id: Optional[int] = None) -> None:
+    """
+    Forget cached roles, in every worker, after a membership change (the
+    role of ``user_id``) or the deletion of the project (every role).
+    """
+    key = f"gen:{project_id}" if user_id is None else f"gen:{project_id}:{user_id}"
+    # Generations must outlive the entries they guard
+    _project_role_cache().incr(key, ttl=settings.PROJECT_ROLE_CACHE_TTL * 2)
@@ -1,21 +1,30 @@
-import shutil
+import logging
 import os
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from sqlalchemy.orm import Session
+from typing import Any, List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request, Response
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
 from uuid import uuid4
 
 from app import models, schemas
 from app.api import deps
+from app.models.project import ProjectMemberRole
 from app.core.config import settings
 from app.models.layer import LayerType, LayerFormat
+from app.services import blobs, ingest, thumbnails, uploads
+from app.services.storage import get_storage
+from app.utils.files import remove_stored_file
+from app.utils.pagination import NDJSON_MEDIA_TYPE, keyset, ndjson_encoder, split_page, stream_scalars
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 @router.post("/projects/{project_id}/layers/", response_model=schemas.layer.Layer)
-def create_upload_layer(
+async def create_upload_layer(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     project_id: int,
     file: UploadFile = File(...),
     name: str = Form(...),
@@ -28,40 +37,31 @@ def create_upload_layer(
     Upload a file and create a new layer for a project.
     """
     # 1. Check Project Permissions
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-
-    # 2. Prepare File Path
-    # Use UUID to prevent filename collisions
-    file_ext = os.path.splitext(file.filename)[1]
-    safe_filename = f"{uuid4()}{file_ext}"
-    
-    # Ensure upload directory exists
-    # If path starts with ../ resolve it relative to backend root or absolute
-    # For simplicity assuming CWD is backend root
-    upload_dir = settings.UPLOAD_DIR
-    if not os.path.isabs(upload_dir):
-        upload_dir = os.path.join(os.getcwd(), upload_dir)
-    
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    file_location = os.path.join(upload_dir, safe_filename)
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
 
-    # 3. Save File
+    # 2. Save File to a temporary path (size limit and checksum are
+    # handled while copying)
+    file_ext = os.path.splitext(file.filename)[1]
+    tmp_location = uploads.partial_path(str(uuid4()))
     try:
-        with open(file_location, "wb+") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-    except Exception as e:
-        print(e)
+        file_size, sha256 = await run_in_threadpool(
+            uploads.save_stream, file.file, tmp_location, settings.MAX_UPLOAD_SIZE
+        )
+    except uploads.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
+    except Exception:
+        logger.exception("Could not save upload %s", file.filename)
         raise HTTPException(status_code=500, detail="Could not save file")
 
-    # 4. Create DB Record
-    # Calculate size
-    file_size = os.path.getsize(file_location)
+    # 3. Store it by content: identical files share one blob
+    try:
+        file_location = await db.run_sync(blobs.acquire, sha256, file_size, file_ext)
+        await run_in_threadpool(blobs.store, tmp_location, file_location, sha256)
+    except BaseException:
+        await run_in_threadpool(remove_stored_file, tmp_location)
+        raise
 
+    # 4. Create DB Record
     layer = models.Layer(
         name=name,
         description=description,
@@ -71,66 +71,158 @@ def create_upload_layer(
         file_path=file_location,
         file_size=file_size,
         original_filename=file.filename,
-        # Default metadata
-        layer_metadata={} 
+        blob_sha256=sha256,
+        layer_metadata={"sha256": sha256}
     )
     
     db.add(layer)
-    db.commit()
-    db.refresh(layer)
+    await db.commit()
+
+    # 5. Queue processing (metadata, conversions, ...) in the background
+    await db.run_sync(ingest.enqueue_ingest, layer)
+    await db.refresh(layer)
     
     return layer
 
 @router.get("/projects/{project_id}/layers/", response_model=List[schemas.layer.Layer])
-def read_project_layers(
+async def read_project_layers(
     *,
-    db: Session = Depends(deps.get_db),
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db),
     project_id: int,
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, gt=0),
+    cursor: Optional[str] = None,
+    bbox: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
-    Retrieve layers for a specific project.
+    Retrieve layers for a specific project, oldest first. Paginate with
+    the `X-Next-Cursor` response header as `cursor`; `format=ndjson`
+    streams all (remaining) layers instead. With `bbox` (minx,miny,maxx,maxy
+    in WGS84) only layers whose extent intersects it are returned, plus
+    layers without a known extent.
     """
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.VIEWER)
         
-    layers = db.query(models.Layer).filter(
-        models.Layer.project_id == project_id
-    ).offset(skip).limit(limit).all()
-    
+    query = select(models.Layer).where(models.Layer.project_id == project_id)
+    bounds = deps.parse_bbox(bbox)
+    if bounds:
+        query = query.where(or_(
+            models.Layer.extent.is_(None),
+            func.ST_Intersects(models.Layer.extent, func.ST_MakeEnvelope(*bounds, 4326)),
+        ))
+    after = deps.parse_cursor(cursor)
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_scalars(keyset(query, models.Layer, after), ndjson_encoder(schemas.layer.Layer)),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+
+    rows = (await db.scalars(keyset(query, models.Layer, after, limit, skip))).all()
+    layers, next_cursor = split_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return layers
 
 @router.delete("/layers/{layer_id}", response_model=schemas.layer.Layer)
-def delete_layer(
+async def delete_layer(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     layer_id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Delete a layer and its file.
     """
-    layer = db.query(models.Layer).filter(models.Layer.id == layer_id).first()
+    layer = await db.get(models.Layer, layer_id)
     if not layer:
         raise HTTPException(status_code=404, detail="Layer not found")
         
-    # Check project permissions via relationship
-    project = db.query(models.Project).filter(models.Project.id == layer.project_id).first()
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    await deps.require_project_role(db, layer.project_id, current_user, ProjectMemberRole.EDITOR)
     
-    # Delete physical file
-    if layer.file_path and os.path.exists(layer.file_path):
-        try:
-            os.remove(layer.file_path)
-        except Exception:
-            pass # Continue deleting record even if file deletion fails
-            
-    db.delete(layer)
-    db.commit()
+    await db.run_sync(blobs.release, blobs.reference_counts([layer]))
+    await db.delete(layer)
+    await db.commit()
+    # Only once the row is gone, so a failed commit leaves the layer whole
+    await run_in_threadpool(blobs.remove_layer_files, layer)
     return layer
+
+@router.get("/layers/{layer_id}/jobs", response_model=List[schemas.job.Job])
+async def read_layer_jobs(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Processing jobs of a layer with their progress, retries and timings.
+    """
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    await deps.require_project_role(db, layer.project_id, current_user, ProjectMemberRole.VIEWER)
+
+    jobs = (await db.scalars(select(models.Job).where(
+        models.Job.layer_id == layer_id
+    ).order_by(models.Job.id))).all()
+    return jobs
+
+
+@router.get("/layers/{layer_id}/thumbnail")
+async def read_layer_thumbnail(
+    *,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    v: Optional[str] = None,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    PNG preview of a layer, rendered at ingest. Its version is
+    `layer_metadata.thumbnail`: requested with `?v=<version>` the image
+    is cacheable forever, otherwise it must be revalidated (ETag).
+    """
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    await deps.require_project_role(db, layer.project_id, current_user, ProjectMemberRole.VIEWER)
+
+    version = (layer.layer_metadata or {}).get("thumbnail")
+    if not version or not layer.thumbnail_path or not os.path.exists(layer.thumbnail_path):
+        raise HTTPException(status_code=404, detail="Thumbnail not available")
+
+    etag = f'"{version}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": thumbnails.VERSIONED_CACHE if v == version else thumbnails.LATEST_CACHE,
+    }
+    if deps.not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(layer.thumbnail_path, media_type=thumbnails.MEDIA_TYPE, headers=headers)
+
+@router.get("/layers/{layer_id}/download")
+async def download_layer_file(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Redirect to the layer's original file: a presigned storage URL with
+    object storage (the download bypasses the API), /static otherwise.
+    Both support range requests.
+    """
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    await deps.require_project_role(db, layer.project_id, current_user, ProjectMemberRole.VIEWER)
+
+    storage = get_storage()
+    key = storage.key_for(layer.file_path)
+    url = await run_in_threadpool(storage.download_url, key, layer.original_filename)
+    return RedirectResponse(url or f"/static/{key}", status_code=307)
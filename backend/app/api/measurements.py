@@ -1,15 +1,75 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException, Body
+import json
+import logging
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from app import models, schemas
 from app.api import deps
+from app.models.project import ProjectMemberRole, touch_project
+from app.services import measurements as engine, profile, volume
+from app.services.vector import is_valid_geometry
+from app.utils.pagination import (
+    GEOJSON_MEDIA_TYPE,
+    GEOJSON_SEQ_MEDIA_TYPE,
+    NDJSON_MEDIA_TYPE,
+    keyset,
+    ndjson_encoder,
+    split_page,
+    stream_feature_collection,
+    stream_scalars,
+)
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+
+def validation_message(error: ValidationError) -> str:
+    first = error.errors()[0]
+    location = ".".join(str(part) for part in first["loc"])
+    return f"{location}: {first['msg']}" if location else first["msg"]
+
+
+def write_in_savepoints(
+    db: Session, rows: List[Dict[str, Any]], write: Callable[[Session, List[Dict[str, Any]]], Any]
+) -> List[Any]:
+    """
+    Write all rows in one savepoint. If the database rejects the batch,
+    retry row by row so only the offending rows fail. Returns, per row,
+    the write result or the exception.
+    """
+    try:
+        with db.begin_nested():
+            result = write(db, rows)
+        return list(result) if result is not None else [None] * len(rows)
+    except SQLAlchemyError:
+        pass
+    outcomes: List[Any] = []
+    for row in rows:
+        try:
+            with db.begin_nested():
+                result = write(db, [row])
+            outcomes.append(result[0] if result else None)
+        except SQLAlchemyError as e:
+            outcomes.append(e)
+    return outcomes
+
+
+def bulk_result(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+    items = sorted(items, key=lambda item: item["index"])
+    failed = sum(1 for item in items if item.get("error"))
+    return {"succeeded": len(items) - failed, "failed": failed, "items": items}
 
 @router.post("/projects/{project_id}/measurements/", response_model=schemas.measurement.Measurement)
-def create_measurement(
+async def create_measurement(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     project_id: int,
     measurement_in: schemas.measurement.MeasurementCreate,
     current_user: models.User = Depends(deps.get_current_active_user),
@@ -17,83 +77,419 @@ def create_measurement(
     """
     Create a new measurement for a project.
     """
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
 
     # Convert GeoJSON to WKT for PostGIS
     from shapely.geometry import shape
     try:
-        print(f"DEBUG: Processing geometry type: {type(measurement_in.geometry)}")
         wkt_geometry = shape(measurement_in.geometry).wkt
-        print(f"DEBUG: WKT Result: {wkt_geometry[:50]}...")
     except Exception as e:
-        print(f"DEBUG: Geometry Error: {e}")
+        logger.debug("Invalid measurement geometry: %s", e)
         raise HTTPException(status_code=422, detail=f"Invalid geometry: {str(e)}")
 
+    # Values that follow from the geometry are computed here, not trusted
+    resolved = engine.resolve_values([measurement_in])[0]
+    if "error" in resolved:
+        raise HTTPException(status_code=422, detail=resolved["error"])
+
     measurement_data = measurement_in.dict()
+    measurement_data['value'] = resolved["value"]
+    measurement_data['unit'] = resolved["unit"]
     # Ensure we replace the dict with the WKT string
     measurement_data['geometry'] = wkt_geometry
 
-    print("DEBUG: Creating measurement object...")
     measurement = models.Measurement(
         **measurement_data,
-        project_id=project.id
+        project_id=project_id
     )
     db.add(measurement)
     try:
-        db.commit()
+        await db.commit()
     except Exception as e:
-        print(f"DEBUG: Commit Error: {e}")
-        db.rollback()
+        logger.exception("Could not store measurement")
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
         
-    db.refresh(measurement)
+    await db.refresh(measurement)
     return measurement
 
+@router.post("/projects/{project_id}/measurements/compute", response_model=List[schemas.measurement.MeasurementComputeResult])
+async def compute_measurements(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    project_id: int,
+    request_in: schemas.measurement.MeasurementComputeRequest,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Compute geodesic lengths, perimeters and areas of many geometries in
+    one call, without storing them. Results keep the order of the items;
+    invalid items get an `error` instead of a value.
+    """
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.VIEWER)
+
+    results = await run_in_threadpool(
+        engine.compute_values,
+        [(item.geometry, item.measurement_type, item.unit) for item in request_in.items],
+    )
+    return [{"index": index, **result} for index, result in enumerate(results)]
+
+@router.post("/projects/{project_id}/measurements/bulk", response_model=schemas.measurement.MeasurementBulkResult)
+async def create_measurements_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    project_id: int,
+    collection_in: schemas.measurement.MeasurementFeatureCollection,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Create many measurements from a GeoJSON FeatureCollection in a single
+    transaction. Measurement fields are read from each feature's
+    `properties`; invalid features are reported and skipped.
+    """
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
+
+    results: List[Dict[str, Any]] = []
+    valid = []  # (index, MeasurementBulkCreate)
+    for index, feature in enumerate(collection_in.features):
+        try:
+            item = schemas.measurement.MeasurementBulkCreate.model_validate(
+                {**(feature.get("properties") or {}), "geometry": feature.get("geometry")}
+            )
+        except ValidationError as e:
+            results.append({"index": index, "error": validation_message(e)})
+            continue
+        if not is_valid_geometry(item.geometry):
+            results.append({"index": index, "error": "Invalid geometry"})
+            continue
+        valid.append((index, item))
+
+    resolved_values = await run_in_threadpool(engine.resolve_values, [item for _, item in valid])
+    rows, indexes = [], []
+    for (index, item), resolved in zip(valid, resolved_values):
+        if "error" in resolved:
+            results.append({"index": index, "error": resolved["error"]})
+            continue
+        rows.append({
+            "project_id": project_id,
+            "name": item.name,
+            "measurement_type": item.measurement_type,
+            "value": resolved["value"],
+            "unit": resolved["unit"],
+            "data": item.data,
+            "notes": item.notes,
+            "created_by": current_user.id,
+            "geometry": json.dumps(item.geometry),
+        })
+        indexes.append(index)
+
+    # Sync bulk writers run on the request's connection
+    outcomes = await db.run_sync(write_in_savepoints, rows, engine.insert_measurements)
+    for index, outcome in zip(indexes, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"index": index, "error": "Database error"})
+        else:
+            results.append({"index": index, "id": outcome})
+    await db.run_sync(touch_project, project_id)
+    await db.commit()
+    return bulk_result(results)
+
+@router.patch("/projects/{project_id}/measurements/bulk", response_model=schemas.measurement.MeasurementBulkResult)
+async def update_measurements_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    project_id: int,
+    collection_in: schemas.measurement.MeasurementFeatureCollection,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Update many measurements of a project. Each feature carries the
+    measurement `id` and only the fields to change (`geometry` and/or
+    `properties`); values are recomputed when the geometry or unit changes.
+    """
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
+
+    results: List[Dict[str, Any]] = []
+    changes = []  # (index, id, MeasurementUpdate)
+    for index, feature in enumerate(collection_in.features):
+        properties = dict(feature.get("properties") or {})
+        measurement_id = feature.get("id", properties.pop("id", None))
+        if not isinstance(measurement_id, int):
+            results.append({"index": index, "error": "id is required"})
+            continue
+        if feature.get("geometry") is not None:
+            properties["geometry"] = feature["geometry"]
+        try:
+            item = schemas.measurement.MeasurementUpdate.model_validate(properties)
+        except ValidationError as e:
+            results.append({"index": index, "error": validation_message(e)})
+            continue
+        if item.geometry is not None and not is_valid_geometry(item.geometry):
+            results.append({"index": index, "error": "Invalid geometry"})
+            continue
+        changes.append((index, measurement_id, item))
+
+    existing = await db.run_sync(
+        engine.load_measurements, project_id, [measurement_id for _, measurement_id, _ in changes]
+    )
+    merged = []  # (index, id, new state, geometry changed)
+    for index, measurement_id, item in changes:
+        current = existing.get(measurement_id)
+        if current is None:
+            results.append({"index": index, "error": "Measurement not found"})
+            continue
+        state = {**current, **item.model_dump(exclude_unset=True)}
+        merged.append((index, measurement_id, state, "geometry" in item.model_fields_set))
+
+    inputs = [SimpleNamespace(**state) for _, _, state, _ in merged]
+    rows, indexes = [], []
+    resolved_values = await run_in_threadpool(engine.resolve_values, inputs)
+    for (index, measurement_id, state, geometry_changed), resolved in zip(merged, resolved_values):
+        if "error" in resolved:
+            results.append({"index": index, "error": resolved["error"]})
+            continue
+        rows.append({
+            "_id": measurement_id,
+            "name": state["name"],
+            "value": resolved["value"],
+            "unit": resolved["unit"],
+            "data": state["data"],
+            "notes": state["notes"],
+            "geometry": json.dumps(state["geometry"]) if geometry_changed else None,
+        })
+        indexes.append((index, measurement_id))
+
+    outcomes = await db.run_sync(write_in_savepoints, rows, engine.update_measurements)
+    for (index, measurement_id), outcome in zip(indexes, outcomes):
+        if isinstance(outcome, Exception):
+            results.append({"index": index, "error": "Database error"})
+        else:
+            results.append({"index": index, "id": measurement_id})
+    await db.run_sync(touch_project, project_id)
+    await db.commit()
+    return bulk_result(results)
+
+@router.delete("/projects/{project_id}/measurements/bulk", response_model=schemas.measurement.MeasurementBulkResult)
+async def delete_measurements_bulk(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    project_id: int,
+    delete_in: schemas.measurement.MeasurementBulkDelete,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Delete many measurements of a project with one statement.
+    """
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
+
+    table = models.Measurement.__table__
+    deleted = set(await db.scalars(
+        delete(table)
+        .where(table.c.project_id == project_id, table.c.id.in_(delete_in.ids))
+        .returning(table.c.id)
+    ))
+    await db.run_sync(touch_project, project_id)
+    await db.commit()
+    return bulk_result([
+        {"index": index, "id": measurement_id} if measurement_id in deleted
+        else {"index": index, "error": "Measurement not found"}
+        for index, measurement_id in enumerate(delete_in.ids)
+    ])
+
 @router.get("/projects/{project_id}/measurements/", response_model=List[schemas.measurement.Measurement])
-def read_measurements(
+async def read_measurements(
     *,
-    db: Session = Depends(deps.get_db),
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db),
     project_id: int,
-    skip: int = 0,
-    limit: int = 100,
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, gt=0),
+    cursor: Optional[str] = None,
+    bbox: Optional[str] = None,
+    format: Literal["json", "ndjson", "geojson", "geojsonseq"] = "json",
+    precision: int = Query(7, ge=0, le=15),
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
-    Retrieve measurements for a project.
+    Retrieve measurements for a project, oldest first. Paginate with the
+    `X-Next-Cursor` response header as `cursor`. `bbox` (minx,miny,maxx,maxy
+    in WGS84) keeps the measurements intersecting a viewport.
+    `format=ndjson`, `format=geojson` (FeatureCollection) or
+    `format=geojsonseq` (RFC 8142) stream all (remaining) measurements;
+    GeoJSON is built by PostGIS with `precision` decimal digits.
     """
-    project = db.query(models.Project).filter(models.Project.id == project_id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.VIEWER)
+
+    filters = []
+    bounds = deps.parse_bbox(bbox)
+    if bounds:
+        # Uses the GiST index (ST_Intersects implies &&)
+        filters.append(func.ST_Intersects(models.Measurement.geometry, func.ST_MakeEnvelope(*bounds, 4326)))
+    query = select(models.Measurement).where(models.Measurement.project_id == project_id, *filters)
+    after = deps.parse_cursor(cursor)
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_scalars(keyset(query, models.Measurement, after), ndjson_encoder(schemas.measurement.Measurement)),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    if format in ("geojson", "geojsonseq"):
+        features = keyset(engine.feature_query(project_id, precision).where(*filters), models.Measurement, after)
+        if format == "geojson":
+            return StreamingResponse(stream_feature_collection(features), media_type=GEOJSON_MEDIA_TYPE)
+        return StreamingResponse(
+            # RFC 8142 records: RS, Feature, LF
+            stream_scalars(features, lambda feature: b"\x1e" + feature.encode() + b"\n"),
+            media_type=GEOJSON_SEQ_MEDIA_TYPE,
+        )
 
-    measurements = db.query(models.Measurement).filter(
-        models.Measurement.project_id == project_id
-    ).offset(skip).limit(limit).all()
+    rows = (await db.scalars(keyset(query, models.Measurement, after, limit, skip))).all()
+    measurements, next_cursor = split_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return measurements
 
 @router.delete("/measurements/{id}", response_model=schemas.measurement.Measurement)
-def delete_measurement(
+async def delete_measurement(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Delete a measurement.
     """
-    measurement = db.query(models.Measurement).filter(models.Measurement.id == id).first()
+    measurement = await db.get(models.Measurement, id)
     if not measurement:
         raise HTTPException(status_code=404, detail="Measurement not found")
         
-    project = db.query(models.Project).filter(models.Project.id == measurement.project_id).first()
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    await deps.require_project_role(db, measurement.project_id, current_user, ProjectMemberRole.EDITOR)
 
-    db.delete(measurement)
-    db.commit()
+    await db.delete(measurement)
+    await db.commit()
     return measurement
+
+
+@router.post("/layers/{layer_id}/volume", response_model=schemas.measurement.VolumeResult)
+async def compute_layer_volume(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    volume_in: schemas.measurement.VolumeRequest,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Cut and fill volumes of a DEM or point-cloud layer inside a polygon,
+    against a base plane, a second surface or the lowest point inside the
+    polygon. Cut is the volume of the surface above the base, fill the
+    volume below it and net is cut - fill. With `save`, the result is stored as a volume measurement
+    (value = net volume, details in `data`).
+    """
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    role = ProjectMemberRole.EDITOR if volume_in.save else ProjectMemberRole.VIEWER
+    await deps.require_project_role(db, layer.project_id, current_user, role)
+    if volume_in.base_elevation is not None and volume_in.base_layer_id is not None:
+        raise HTTPException(status_code=422, detail="Give either base_elevation or base_layer_id, not both")
+    if not is_valid_geometry(volume_in.geometry):
+        raise HTTPException(status_code=422, detail="Invalid geometry")
+
+    try:
+        unit = engine.resolve_unit(models.MeasurementType.VOLUME, volume_in.unit)
+        surface = volume.surface_for_layer(layer)
+        if volume_in.base_layer_id is not None:
+            base_layer = await db.get(models.Layer, volume_in.base_layer_id)
+            if not base_layer or base_layer.project_id != layer.project_id:
+                raise HTTPException(status_code=404, detail="Base layer not found")
+            base = {"surface": volume.surface_for_layer(base_layer)}
+        elif volume_in.base_elevation is not None:
+            base = {"plane": volume_in.base_elevation}
+        else:
+            base = {"lowest": True}
+        # Tiles are computed in the volume process pool
+        result = await run_in_threadpool(
+            volume.compute_volume, volume_in.geometry, surface, base, volume_in.resolution
+        )
+    except volume.SurfaceNotReady as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:  # VolumeError, MeasurementError, CRS errors
+        raise HTTPException(status_code=422, detail=str(e))
+
+    factor = engine.VOLUME_UNITS[unit]
+    for key in ("cut", "fill", "net"):
+        result[key] /= factor
+    result["unit"] = unit
+
+    if volume_in.save:
+        measurement = models.Measurement(
+            project_id=layer.project_id,
+            name=volume_in.name,
+            measurement_type=models.MeasurementType.VOLUME,
+            value=result["net"],
+            unit=unit,
+            data={**result, "unit": unit.value, "layer_id": layer.id, "base_layer_id": volume_in.base_layer_id},
+            notes=volume_in.notes,
+            created_by=current_user.id,
+            geometry=func.ST_Force2D(func.ST_SetSRID(func.ST_GeomFromGeoJSON(json.dumps(volume_in.geometry)), 4326)),
+        )
+        db.add(measurement)
+        await db.commit()
+        result["measurement_id"] = measurement.id
+    return result
+
+
+@router.post("/layers/{layer_id}/profile", response_model=schemas.measurement.ProfileResult)
+async def compute_layer_profile(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    profile_in: schemas.measurement.ProfileRequest,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Elevation profile of a DEM or point-cloud layer along a line, sampled
+    at `samples` evenly spaced positions. With `save`, it is stored as an
+    elevation_profile measurement (value = length); `data` keeps the
+    spacing and elevations, from which the positions follow.
+    """
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    role = ProjectMemberRole.EDITOR if profile_in.save else ProjectMemberRole.VIEWER
+    await deps.require_project_role(db, layer.project_id, current_user, role)
+    if not is_valid_geometry(profile_in.geometry):
+        raise HTTPException(status_code=422, detail="Invalid geometry")
+
+    try:
+        unit = engine.resolve_unit(models.MeasurementType.ELEVATION_PROFILE, profile_in.unit)
+        surface = volume.surface_for_layer(layer)
+        result = await run_in_threadpool(
+            profile.compute_profile, profile_in.geometry, surface, profile_in.samples, profile_in.search_radius
+        )
+    except volume.SurfaceNotReady as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:  # ProfileError, VolumeError, MeasurementError, CRS errors
+        raise HTTPException(status_code=422, detail=str(e))
+
+    result["length"] /= engine.LINEAR_UNITS[unit]
+    result["unit"] = unit
+
+    if profile_in.save:
+        data = {key: value for key, value in result.items() if key != "coordinates"}
+        measurement = models.Measurement(
+            project_id=layer.project_id,
+            name=profile_in.name,
+            measurement_type=models.MeasurementType.ELEVATION_PROFILE,
+            value=result["length"],
+            unit=unit,
+            data={**data, "unit": unit.value, "layer_id": layer.id},
+            notes=profile_in.notes,
+            created_by=current_user.id,
+            geometry=func.ST_Force2D(func.ST_SetSRID(func.ST_GeomFromGeoJSON(json.dumps(profile_in.geometry)), 4326)),
+        )
+        db.add(measurement)
+        await db.commit()
+        result["measurement_id"] = measurement.id
+    return result
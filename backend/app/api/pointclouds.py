@@ -0,0 +1,57 @@
+import os
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.api import deps
+from app.models.project import ProjectMemberRole
+from app.services import pointcloud
+
+router = APIRouter()
+
+
+@router.get("/layers/{layer_id}/points")
+async def read_layer_points(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    bbox: Optional[str] = None,
+    max_points: int = Query(1_000_000, gt=0, le=20_000_000),
+    lod: Optional[int] = Query(None, ge=0),
+    intensity: bool = True,
+    classification: bool = True,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> StreamingResponse:
+    """
+    Points of a point-cloud layer as a packed little-endian binary buffer.
+    `bbox` (minx,miny,maxx,maxy) is in the layer's native CRS and `lod` is
+    the deepest octree level to read. See `pointcloud.RESPONSE_HEADER` for
+    the layout.
+    """
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    await deps.require_project_role(db, layer.project_id, current_user, ProjectMemberRole.VIEWER)
+
+    if not layer.processed_path or not os.path.exists(
+        os.path.join(layer.processed_path, pointcloud.OCTREE_FILE)
+    ):
+        raise HTTPException(status_code=409, detail="Point cloud is not processed yet")
+
+    octree = await run_in_threadpool(pointcloud.load_octree, layer.processed_path)
+    selected = await run_in_threadpool(
+        pointcloud.select_points, octree, deps.parse_bbox(bbox), max_points, lod
+    )
+    count = sum(len(points) for points in selected)
+    return StreamingResponse(
+        pointcloud.encode_points(octree, selected, intensity, classification),
+        media_type="application/octet-stream",
+        headers={
+            "X-Point-Count": str(count),
+            "X-Octree-Depth": str(octree.depth),
+        },
+    )
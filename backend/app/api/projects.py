@@ -1,36 +1,64 @@
-from typing import Any, List
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from typing import Any, List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
 
 from app import models, schemas
 from app.api import deps
+from app.models.project import ProjectMemberRole
+from app.services import blobs, uploads
+from app.utils.pagination import NDJSON_MEDIA_TYPE, keyset, ndjson_encoder, split_page, stream_scalars
 
 router = APIRouter()
 
 @router.get("/", response_model=List[schemas.project.Project])
-def read_projects(
-    db: Session = Depends(deps.get_db),
-    skip: int = 0,
-    limit: int = 100,
+async def read_projects(
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db),
+    skip: int = Query(0, ge=0, deprecated=True),
+    limit: int = Query(100, gt=0),
+    cursor: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
-    Retrieve projects owned by current user.
+    Retrieve projects owned by or shared with current user, oldest first.
+    The next page is requested with the `X-Next-Cursor` response header
+    as `cursor`; `format=ndjson` streams all (remaining) projects instead.
     """
-    if current_user.is_superuser:
+    query = select(models.Project)
+    if not current_user.is_superuser:
         # Admins can see all projects (optional behavior)
-        projects = db.query(models.Project).offset(skip).limit(limit).all()
-    else:
-        projects = db.query(models.Project).filter(
-            models.Project.owner_id == current_user.id
-        ).offset(skip).limit(limit).all()
+        query = query.outerjoin(
+            models.ProjectMember,
+            and_(
+                models.ProjectMember.project_id == models.Project.id,
+                models.ProjectMember.user_id == current_user.id,
+            ),
+        ).where(
+            or_(models.Project.owner_id == current_user.id, models.ProjectMember.id.isnot(None))
+        )
+    after = deps.parse_cursor(cursor)
+    if format == "ndjson":
+        return StreamingResponse(
+            stream_scalars(keyset(query, models.Project, after), ndjson_encoder(schemas.project.Project)),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+
+    rows = (await db.scalars(keyset(query, models.Project, after, limit, skip))).all()
+    projects, next_cursor = split_page(rows, limit)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     return projects
 
 
 @router.post("/", response_model=schemas.project.Project)
-def create_project(
+async def create_project(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     project_in: schemas.project.ProjectCreate,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
@@ -43,33 +71,61 @@ def create_project(
         owner_id=current_user.id,
     )
     db.add(project)
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
     return project
 
 
 @router.get("/{id}", response_model=schemas.project.Project)
-def read_project(
+async def read_project(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Get project by ID.
     """
-    project = db.query(models.Project).filter(models.Project.id == id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    project = await deps.get_project_for_user(db, id, current_user, ProjectMemberRole.VIEWER)
     return project
 
 
+@router.get("/{id}/workspace", response_model=schemas.project.ProjectWorkspace)
+async def read_project_workspace(
+    *,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db),
+    id: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get a project with its layers and measurements in one response.
+    Supports conditional requests: the ETag is the project version, which
+    changes with any change to the project, its layers or measurements.
+    """
+    project = await deps.get_project_for_user(db, id, current_user, ProjectMemberRole.VIEWER)
+
+    version = project.updated_at or project.created_at
+    etag = f'"p{project.id}-{version.timestamp():.6f}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if deps.not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Children are loaded with one SELECT ... IN per relationship
+    project = (await db.scalars(
+        select(models.Project)
+        .options(selectinload(models.Project.layers), selectinload(models.Project.measurements))
+        .execution_options(populate_existing=True)
+        .where(models.Project.id == id)
+    )).one()
+    workspace = schemas.project.ProjectWorkspace.model_validate(project)
+    return Response(content=workspace.model_dump_json(), media_type="application/json", headers=headers)
+
+
 @router.put("/{id}", response_model=schemas.project.Project)
-def update_project(
+async def update_project(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     id: int,
     project_in: schemas.project.ProjectUpdate,
     current_user: models.User = Depends(deps.get_current_active_user),
@@ -77,38 +133,114 @@ def update_project(
     """
     Update a project.
     """
-    project = db.query(models.Project).filter(models.Project.id == id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
+    project = await deps.get_project_for_user(db, id, current_user, ProjectMemberRole.OWNER)
     
     update_data = project_in.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(project, field, value)
     
     db.add(project)
-    db.commit()
-    db.refresh(project)
+    await db.commit()
+    await db.refresh(project)
     return project
 
 
 @router.delete("/{id}", response_model=schemas.project.Project)
-def delete_project(
+async def delete_project(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     id: int,
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
     Delete a project.
     """
-    project = db.query(models.Project).filter(models.Project.id == id).first()
-    if not project:
-        raise HTTPException(status_code=404, detail="Project not found")
-    if not current_user.is_superuser and project.owner_id != current_user.id:
-        raise HTTPException(status_code=400, detail="Not enough permissions")
-    
-    db.delete(project)
-    db.commit()
+    project = await deps.get_project_for_user(db, id, current_user, ProjectMemberRole.OWNER)
+
+    # Layers and uploads in progress go with the project
+    layers = (await db.scalars(select(models.Layer).where(models.Layer.project_id == id))).all()
+    upload_sessions = (await db.scalars(
+        select(models.UploadSession).where(models.UploadSession.project_id == id)
+    )).all()
+    await db.run_sync(blobs.release, blobs.reference_counts(layers))
+    await db.delete(project)
+    await db.commit()
+    deps.invalidate_project_roles(id)
+
+    def remove_files() -> None:
+        for layer in layers:
+            blobs.remove_layer_files(layer)
+        for upload in upload_sessions:
+            uploads.discard_upload(upload)
+
+    await run_in_threadpool(remove_files)
     return project
+
+
+@router.get("/{id}/members", response_model=List[schemas.project.ProjectMember])
+async def read_project_members(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    id: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    List the users a project is shared with.
+    """
+    await deps.require_project_role(db, id, current_user, ProjectMemberRole.VIEWER)
+    members = await db.scalars(select(models.ProjectMember).where(models.ProjectMember.project_id == id))
+    return members.all()
+
+
+@router.post("/{id}/members", response_model=schemas.project.ProjectMember)
+async def set_project_member(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    id: int,
+    member_in: schemas.project.ProjectMemberCreate,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Share a project with a user, or change their role.
+    """
+    await deps.require_project_role(db, id, current_user, ProjectMemberRole.OWNER)
+    if not await db.get(models.User, member_in.user_id):
+        raise HTTPException(status_code=404, detail="User not found")
+
+    member = await db.scalar(select(models.ProjectMember).where(
+        models.ProjectMember.project_id == id,
+        models.ProjectMember.user_id == member_in.user_id,
+    ))
+    if member is None:
+        member = models.ProjectMember(project_id=id, user_id=member_in.user_id)
+    member.role = member_in.role
+    db.add(member)
+    await db.commit()
+    await db.refresh(member)
+    deps.invalidate_project_roles(id, member_in.user_id)
+    return member
+
+
+@router.delete("/{id}/members/{user_id}", response_model=schemas.project.ProjectMember)
+async def delete_project_member(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    id: int,
+    user_id: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Stop sharing a project with a user.
+    """
+    await deps.require_project_role(db, id, current_user, ProjectMemberRole.OWNER)
+    member = await db.scalar(select(models.ProjectMember).where(
+        models.ProjectMember.project_id == id,
+        models.ProjectMember.user_id == user_id,
+    ))
+    if not member:
+        raise HTTPException(status_code=404, detail="Member not found")
+
+    await db.delete(member)
+    await db.commit()
+    deps.invalidate_project_roles(id, user_id)
+    return member
@@ -0,0 +1,162 @@
+import os
+from typing import Any, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.api import deps
+from app.models.layer import LayerFormat
+from app.models.project import ProjectMemberRole
+from app.core.config import settings
+from app.services import blobs, raster, vector
+from app.services.tile_cache import get_tile_cache
+
+router = APIRouter()
+
+TILE_MEDIA_TYPES = {"png": "image/png", "webp": "image/webp"}
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+
+def tile_response(etag: str, content: bytes, media_type: str) -> Response:
+    headers = {"ETag": etag, "Cache-Control": settings.TILE_CACHE_CONTROL}
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+async def get_layer_for_tiles(db: AsyncSession, layer_id: int, current_user: models.User) -> models.Layer:
+    layer = await db.get(models.Layer, layer_id)
+    if not layer:
+        raise HTTPException(status_code=404, detail="Layer not found")
+
+    await deps.require_project_role(db, layer.project_id, current_user, ProjectMemberRole.VIEWER)
+    return layer
+
+
+def processed_version(path: Optional[str]) -> Optional[int]:
+    """Modification time of a processed file, None while it does not exist"""
+    if not path:
+        return None
+    try:
+        return int(os.path.getmtime(path))
+    except OSError:
+        return None
+
+
+def check_tile_coords(z: int, x: int, y: int) -> None:
+    if z < 0 or z > 24 or not (0 <= x < (1 << z)) or not (0 <= y < (1 << z)):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+
+@router.get("/layers/{layer_id}/tiles/{z}/{x}/{y}.{fmt}")
+async def read_raster_tile(
+    *,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    z: int,
+    x: int,
+    y: int,
+    fmt: str,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    XYZ (web-mercator) tile of a raster layer, rendered from its COG.
+    """
+    if fmt not in TILE_MEDIA_TYPES:
+        raise HTTPException(status_code=404, detail="Unsupported tile format")
+    check_tile_coords(z, x, y)
+    layer = await get_layer_for_tiles(db, layer_id, current_user)
+    if layer.format != LayerFormat.GEOTIFF:
+        raise HTTPException(status_code=404, detail="Layer is not a raster")
+    # Version of the processed raster, so re-processing invalidates tiles
+    version = await run_in_threadpool(processed_version, layer.processed_path)
+    if version is None:
+        raise HTTPException(status_code=409, detail="Raster is not processed yet")
+
+    etag = f'"r{layer.id}-{version}-{z}-{x}-{y}-{fmt}"'
+    if deps.not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": settings.TILE_CACHE_CONTROL})
+
+    cache = get_tile_cache()
+    # Shared by the layers of one blob: the tiles depend only on the content
+    key = f"{blobs.tile_cache_prefix(layer)}/raster-{version}/{z}/{x}/{y}.{fmt}"
+    # The cache is on disk: keep its reads and writes off the event loop
+    content = await run_in_threadpool(cache.get, key)
+    if content is None:
+        west, south, east, north = raster.tile_bounds_wgs84(z, x, y)
+        bbox = layer.bbox
+        if not bbox or (west <= bbox[2] and east >= bbox[0] and south <= bbox[3] and north >= bbox[1]):
+            stats = (layer.layer_metadata or {}).get("render")
+            # Rendering is CPU bound: keep it off the event loop
+            content = await run_in_threadpool(raster.render_tile, layer.processed_path, z, x, y, fmt, stats)
+        if content is None:
+            content = raster.empty_tile(fmt)
+        await run_in_threadpool(cache.put, key, content)
+    return tile_response(etag, content, TILE_MEDIA_TYPES[fmt])
+
+
+@router.get("/layers/{layer_id}/mvt/{z}/{x}/{y}.pbf")
+async def read_vector_tile(
+    *,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    z: int,
+    x: int,
+    y: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Mapbox Vector Tile of a vector layer, built by PostGIS (ST_AsMVT).
+    """
+    check_tile_coords(z, x, y)
+    layer = await get_layer_for_tiles(db, layer_id, current_user)
+    version = (layer.layer_metadata or {}).get("features_version")
+    if version is None:
+        raise HTTPException(status_code=409, detail="Vector layer is not processed yet")
+
+    etag = f'"v{layer.id}-{version}-{z}-{x}-{y}"'
+    if deps.not_modified(request, etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": settings.TILE_CACHE_CONTROL})
+
+    cache = get_tile_cache()
+    key = f"{layer.id}/mvt-{version}/{z}/{x}/{y}.pbf"
+    content = await run_in_threadpool(cache.get, key)
+    if content is None:
+        levels = ((layer.layer_metadata or {}).get("simplification") or {}).get("levels")
+        content = await db.run_sync(
+            vector.render_mvt, layer.id, z, x, y, level=vector.level_for_zoom(levels, z)
+        )
+        await run_in_threadpool(cache.put, key, content)
+    return tile_response(etag, content, MVT_MEDIA_TYPE)
+
+
+@router.get("/layers/{layer_id}/features")
+async def read_layer_features(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    layer_id: int,
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    resolution: Optional[float] = Query(None, gt=0),
+    bbox: Optional[str] = None,
+    limit: int = Query(10000, gt=0, le=100000),
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Features of a vector layer as GeoJSON, simplified for the display
+    `zoom` (or `resolution` in meters per pixel). Without either, original
+    geometries are returned. `bbox` is minx,miny,maxx,maxy in WGS84.
+    """
+    layer = await get_layer_for_tiles(db, layer_id, current_user)
+    metadata = layer.layer_metadata or {}
+    if metadata.get("features_version") is None:
+        raise HTTPException(status_code=409, detail="Vector layer is not processed yet")
+
+    if zoom is None and resolution is not None:
+        zoom = vector.zoom_for_resolution(resolution)
+    level = vector.level_for_zoom((metadata.get("simplification") or {}).get("levels"), zoom)
+    content = await db.run_sync(
+        vector.features_geojson, layer.id, level=level, bbox=deps.parse_bbox(bbox), limit=limit,
+        precision=vector.precision_for_zoom(zoom),
+    )
+    return Response(content=content, media_type="application/geo+json")
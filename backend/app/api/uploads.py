@@ -0,0 +1,339 @@
+import math
+import os
+from typing import Any, Optional
+from uuid import uuid4
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy import select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from app import models, schemas
+from app.api import deps
+from app.models.project import ProjectMemberRole
+from app.core.config import settings
+from app.services import blobs, ingest, uploads
+from app.services.storage import StorageError, get_storage, part_size_for
+
+router = APIRouter()
+
+LOCK_NOT_AVAILABLE = "55P03"  # PostgreSQL SQLSTATE of a failed NOWAIT lock
+
+
+async def get_upload_session(
+    db: AsyncSession, upload_id: str, current_user: models.User
+) -> models.UploadSession:
+    upload = await db.get(models.UploadSession, upload_id)
+    if not upload:
+        raise HTTPException(status_code=404, detail="Upload not found")
+    if not current_user.is_superuser and upload.user_id != current_user.id:
+        raise HTTPException(status_code=400, detail="Not enough permissions")
+    return upload
+
+
+async def lock_upload_session(db: AsyncSession, upload: models.UploadSession) -> None:
+    """
+    Lock the session row until the request's transaction ends, so one
+    chunk (or the completion) of an upload is handled at a time across
+    every API process. 409 if another request holds it.
+    """
+    try:
+        await db.execute(
+            select(models.UploadSession.id)
+            .where(models.UploadSession.id == upload.id)
+            .with_for_update(nowait=True)
+        )
+    except DBAPIError as e:
+        if getattr(e.orig, "pgcode", None) == LOCK_NOT_AVAILABLE:
+            raise HTTPException(status_code=409, detail="Another chunk is being uploaded")
+        raise
+
+
+@router.post("/projects/{project_id}/uploads/", response_model=schemas.upload.UploadSession)
+async def create_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    project_id: int,
+    upload_in: schemas.upload.UploadInit,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Start a chunked upload. Chunks are then sent with PUT /uploads/{id}?offset=N
+    and the layer is created with POST /uploads/{id}/complete.
+    """
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
+    if upload_in.total_size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    upload = models.UploadSession(
+        id=str(uuid4()),
+        project_id=project_id,
+        user_id=current_user.id,
+        name=upload_in.name,
+        description=upload_in.description,
+        layer_type=upload_in.layer_type,
+        format=upload_in.format,
+        original_filename=upload_in.filename,
+        total_size=upload_in.total_size,
+        received=0,
+        sha256=upload_in.sha256.lower() if upload_in.sha256 else None,
+    )
+    db.add(upload)
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+async def direct_upload_urls(upload: models.UploadSession) -> dict:
+    storage = get_storage()
+    key = uploads.direct_key(upload.id, upload.original_filename)
+    numbers = range(1, math.ceil(upload.total_size / upload.part_size) + 1)
+    urls = await run_in_threadpool(storage.part_urls, key, upload.storage_upload_id, numbers)
+    return {
+        "upload": upload,
+        "part_size": upload.part_size,
+        "parts": [{"part_number": number, "url": url} for number, url in zip(numbers, urls)],
+        "expires_in": settings.S3_PRESIGN_EXPIRES,
+    }
+
+
+async def direct_received_bytes(upload: models.UploadSession) -> int:
+    key = uploads.direct_key(upload.id, upload.original_filename)
+    parts = await run_in_threadpool(get_storage().uploaded_parts, key, upload.storage_upload_id)
+    return sum(part["size"] for part in parts.values())
+
+
+@router.post("/projects/{project_id}/uploads/direct", response_model=schemas.upload.DirectUpload)
+async def create_direct_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    project_id: int,
+    upload_in: schemas.upload.UploadInit,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Start an upload sent straight to object storage: PUT every part to
+    its presigned URL (in parallel, any order), then create the layer
+    with POST /uploads/{id}/complete and the ETag of each part.
+    Needs STORAGE_BACKEND=s3; use chunked uploads otherwise.
+    """
+    await deps.require_project_role(db, project_id, current_user, ProjectMemberRole.EDITOR)
+    if upload_in.total_size > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+    storage = get_storage()
+    if storage.local:
+        raise HTTPException(status_code=409, detail="Direct uploads need object storage, use chunked uploads")
+
+    upload_id = str(uuid4())
+    key = uploads.direct_key(upload_id, upload_in.filename)
+    storage_upload_id = await run_in_threadpool(storage.create_multipart, key)
+    upload = models.UploadSession(
+        id=upload_id,
+        project_id=project_id,
+        user_id=current_user.id,
+        name=upload_in.name,
+        description=upload_in.description,
+        layer_type=upload_in.layer_type,
+        format=upload_in.format,
+        original_filename=upload_in.filename,
+        total_size=upload_in.total_size,
+        received=0,
+        sha256=upload_in.sha256.lower() if upload_in.sha256 else None,
+        storage_upload_id=storage_upload_id,
+        part_size=part_size_for(upload_in.total_size),
+    )
+    db.add(upload)
+    await db.commit()
+    await db.refresh(upload)
+    return await direct_upload_urls(upload)
+
+
+@router.get("/uploads/{upload_id}/parts", response_model=schemas.upload.DirectUpload)
+async def read_direct_upload_parts(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    upload_id: str,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Fresh presigned part URLs of a direct upload, e.g. to resume it after
+    the previous ones expired.
+    """
+    upload = await get_upload_session(db, upload_id, current_user)
+    if not upload.storage_upload_id:
+        raise HTTPException(status_code=409, detail="Not a direct upload")
+    upload.received = await direct_received_bytes(upload)
+    return await direct_upload_urls(upload)
+
+
+@router.get("/uploads/{upload_id}", response_model=schemas.upload.UploadSession)
+async def read_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    upload_id: str,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Get upload status. `received` is the offset to resume from.
+    """
+    upload = await get_upload_session(db, upload_id, current_user)
+    if upload.storage_upload_id:
+        upload.received = await direct_received_bytes(upload)
+    else:
+        upload.received = uploads.received_bytes(upload.id)
+    return upload
+
+
+@router.put("/uploads/{upload_id}", response_model=schemas.upload.UploadSession)
+async def upload_chunk(
+    *,
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db),
+    upload_id: str,
+    offset: int,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Append the raw request body to an upload, starting at `offset`.
+    """
+    upload = await get_upload_session(db, upload_id, current_user)
+    if upload.storage_upload_id:
+        raise HTTPException(status_code=409, detail="Direct upload, send the parts to storage")
+    await lock_upload_session(db, upload)
+    try:
+        received = await uploads.append_chunk(
+            upload.id, offset, upload.total_size, request.stream()
+        )
+    except uploads.OffsetMismatch as e:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Offset mismatch, resume from {e.expected}",
+            headers={"Upload-Offset": str(e.expected)},
+        )
+    except uploads.UploadBusy:
+        raise HTTPException(status_code=409, detail="Another chunk is being uploaded")
+    except uploads.UploadTooLarge:
+        raise HTTPException(status_code=413, detail="Chunk exceeds declared file size")
+
+    upload.received = received
+    await db.commit()
+    await db.refresh(upload)
+    return upload
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=schemas.layer.Layer)
+async def complete_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    upload_id: str,
+    complete_in: Optional[schemas.upload.UploadComplete] = None,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Finish an upload and create its layer. Direct uploads send the ETag
+    of every part.
+    """
+    upload = await get_upload_session(db, upload_id, current_user)
+    if upload.storage_upload_id:
+        return await complete_direct_upload(db, upload, complete_in)
+    await lock_upload_session(db, upload)
+    received = uploads.received_bytes(upload.id)
+    if received != upload.total_size:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Upload incomplete ({received}/{upload.total_size} bytes)",
+            headers={"Upload-Offset": str(received)},
+        )
+
+    file_ext = os.path.splitext(upload.original_filename)[1]
+    tmp_location, sha256 = await run_in_threadpool(uploads.finish_chunked, upload.id)
+    if upload.sha256 and upload.sha256 != sha256:
+        await run_in_threadpool(uploads.discard_chunked, upload.id)
+        await db.delete(upload)
+        await db.commit()
+        raise HTTPException(status_code=422, detail="Checksum mismatch, upload discarded")
+
+    # Identical content already stored is shared instead of kept twice
+    file_location = await db.run_sync(blobs.acquire, sha256, received, file_ext)
+    await run_in_threadpool(blobs.store, tmp_location, file_location, sha256)
+    layer = models.Layer(
+        name=upload.name,
+        description=upload.description,
+        layer_type=upload.layer_type,
+        format=upload.format,
+        project_id=upload.project_id,
+        file_path=file_location,
+        file_size=received,
+        original_filename=upload.original_filename,
+        blob_sha256=sha256,
+        layer_metadata={"sha256": sha256},
+    )
+    db.add(layer)
+    await db.delete(upload)
+    await db.commit()
+
+    await db.run_sync(ingest.enqueue_ingest, layer)
+    await db.refresh(layer)
+    return layer
+
+
+async def complete_direct_upload(
+    db: AsyncSession,
+    upload: models.UploadSession,
+    complete_in: Optional[schemas.upload.UploadComplete],
+) -> models.Layer:
+    storage = get_storage()
+    key = uploads.direct_key(upload.id, upload.original_filename)
+    parts = {part.part_number: part.etag for part in (complete_in.parts if complete_in else [])}
+    count = math.ceil(upload.total_size / upload.part_size)
+    if sorted(parts) != list(range(1, count + 1)):
+        raise HTTPException(status_code=422, detail=f"The ETags of parts 1 to {count} are required")
+    try:
+        await run_in_threadpool(storage.complete_multipart, key, upload.storage_upload_id, parts)
+    except StorageError as e:
+        raise HTTPException(status_code=409, detail=f"Could not complete upload: {e}")
+
+    size = await run_in_threadpool(storage.size, key)
+    if size != upload.total_size:
+        await run_in_threadpool(storage.delete, key)
+        await db.delete(upload)
+        await db.commit()
+        raise HTTPException(status_code=422, detail="Size mismatch, upload discarded")
+
+    # Hashed and stored as a blob by the first ingestion stage
+    sha256 = upload.sha256
+    layer = models.Layer(
+        name=upload.name,
+        description=upload.description,
+        layer_type=upload.layer_type,
+        format=upload.format,
+        project_id=upload.project_id,
+        file_path=storage.local_path(key),
+        file_size=size,
+        original_filename=upload.original_filename,
+        layer_metadata={},
+    )
+    db.add(layer)
+    await db.delete(upload)
+    await db.commit()
+
+    await db.run_sync(ingest.enqueue_ingest, layer, register_blob=True, sha256=sha256)
+    await db.refresh(layer)
+    return layer
+
+
+@router.delete("/uploads/{upload_id}", response_model=schemas.upload.UploadSession)
+async def abort_upload(
+    *,
+    db: AsyncSession = Depends(deps.get_db),
+    upload_id: str,
+    current_user: models.User = Depends(deps.get_current_active_user),
+) -> Any:
+    """
+    Abort an upload and delete the data received so far.
+    """
+    upload = await get_upload_session(db, upload_id, current_user)
+    await run_in_threadpool(uploads.discard_upload, upload)
+    await db.delete(upload)
+    await db.commit()
+    return upload
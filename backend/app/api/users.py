@@ -2,17 +2,18 @@ from typing import Any, List
 
 from fastapi import APIRouter, Body, Depends, HTTPException
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import models, schemas
 from app.api import deps
-from app.core import security
+from app.core import hashing
 
 router = APIRouter()
 
 
 @router.get("/me", response_model=schemas.user.User)
-def read_user_me(
+async def read_user_me(
     current_user: models.User = Depends(deps.get_current_active_user),
 ) -> Any:
     """
@@ -22,9 +23,9 @@ def read_user_me(
 
 
 @router.put("/me", response_model=schemas.user.User)
-def update_user_me(
+async def update_user_me(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db),
     password: str = Body(None),
     full_name: str = Body(None),
     email: str = Body(None),
@@ -33,6 +34,8 @@ def update_user_me(
     """
     Update own user.
     """
+    # current_user may be a cached, read-only principal
+    current_user = await db.get(models.User, current_user.id)
     current_user_data = jsonable_encoder(current_user)
     user_in = schemas.user.UserUpdate(**current_user_data)
     if password is not None:
@@ -43,7 +46,7 @@ def update_user_me(
         user_in.email = email
 
     if password:
-        hashed_password = security.get_password_hash(password)
+        hashed_password = await hashing.hash_password(password)
         current_user.hashed_password = hashed_password
     
     if full_name:
@@ -51,7 +54,7 @@ def update_user_me(
     
     if email:
         # Check if email is already taken
-        user = db.query(models.User).filter(models.User.email == email).first()
+        user = await db.scalar(select(models.User).where(models.User.email == email))
         if user and user.id != current_user.id:
             raise HTTPException(
                 status_code=400,
@@ -60,6 +63,6 @@ def update_user_me(
         current_user.email = email
 
     db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return current_user
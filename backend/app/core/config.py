@@ -9,15 +9,28 @@ class Settings(BaseSettings):
     APP_NAME: str = "GeoVisor"
     APP_VERSION: str = "1.0.0"
     DEBUG: bool = True
+    SQL_ECHO: bool = False  # Log every SQL statement (slow; use /metrics for query stats)
+    METRICS_ENABLED: bool = True  # Prometheus metrics on /metrics
+    METRICS_WORKER_PORT: int = 0  # Metrics port of app.worker processes (0 = disabled)
     
     # Database
     DATABASE_URL: str
+    ASYNC_DATABASE_URL: str = ""  # Defaults to DATABASE_URL with the asyncpg driver
+    DB_POOL_SIZE: int = 20  # Async connections kept per API process
+    DB_MAX_OVERFLOW: int = 20  # Extra connections opened under load
     
     # Security
     SECRET_KEY: str
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     REFRESH_TOKEN_EXPIRE_DAYS: int = 7
+    AUTH_CACHE_TTL: int = 60  # Seconds a resolved user is cached per token (0 = disabled)
+    AUTH_CACHE_MAX_ENTRIES: int = 10000  # In-process cache size
+    AUTH_CACHE_URL: str = ""  # redis://... to share the principal and role caches between workers
+    PROJECT_ROLE_CACHE_TTL: int = 10  # Seconds a resolved project role is reused
+    PASSWORD_HASH_ROUNDS: int = 29000  # pbkdf2_sha256 work factor; older hashes are upgraded on login
+    PASSWORD_HASH_WORKERS: int = 2  # Hashing processes (0 = hash in the request thread)
+    PASSWORD_HASH_MAX_PENDING: int = 32  # Queued + running hashes before login returns 503
     
     # CORS
     ALLOWED_ORIGINS: List[str] = ["http://localhost:5173", "http://localhost:3000"]
@@ -28,6 +41,39 @@ class Settings(BaseSettings):
     PROCESSED_DIR: str = "../data/processed"
     TEMP_DIR: str = "../data/temp"
     
+    # Storage of uploaded files
+    STORAGE_BACKEND: str = "local"  # "local" (UPLOAD_DIR) or "s3" (any S3-compatible service; UPLOAD_DIR is then a cache)
+    # PROCESSED_DIR (COGs, octrees, thumbnails, tile cache) is one volume mounted
+    # by every API and worker host; required with STORAGE_BACKEND=s3
+    SHARED_PROCESSED_DIR: bool = False
+    S3_BUCKET: str = ""
+    S3_PREFIX: str = ""  # Key prefix inside the bucket
+    S3_ENDPOINT_URL: str = ""  # Non-AWS services, e.g. http://minio:9000
+    S3_REGION: str = ""
+    S3_ACCESS_KEY_ID: str = ""  # Empty: default boto3 credential chain
+    S3_SECRET_ACCESS_KEY: str = ""
+    S3_PRESIGN_EXPIRES: int = 3600  # Seconds presigned upload/download URLs stay valid
+    UPLOAD_CACHE_MAX_BYTES: int = 21474836480  # 20GB of local copies of objects kept in UPLOAD_DIR (s3)
+    UPLOAD_PART_SIZE: int = 67108864  # 64MB parts for multipart transfers (minimum 5MB on S3)
+    UPLOAD_PART_CONCURRENCY: int = 8  # Parts transferred in parallel by the API and workers
+    
+    # Background jobs
+    JOB_WORKERS: int = 2  # Worker threads per API process (0 = external worker only)
+    JOB_POLL_INTERVAL: float = 2.0  # Seconds between queue polls when idle
+    JOB_MAX_ATTEMPTS: int = 3
+    JOB_RETRY_DELAY: int = 30  # Seconds, doubled on every retry
+    JOB_STALE_AFTER: int = 1800  # Seconds without heartbeat before a running job is reclaimed
+    
+    # Tiles
+    TILE_CACHE_MAX_BYTES: int = 2147483648  # 2GB on-disk tile cache, shared by the processes using PROCESSED_DIR
+    TILE_CACHE_CONTROL: str = "public, max-age=86400"
+    
+    # Layer previews
+    THUMBNAIL_SIZE: int = 256  # Pixels, longest side
+    
+    # Volumes
+    VOLUME_WORKERS: int = 4  # Processes computing volume tiles (0 = in the request thread)
+    
     # GDAL
     GDAL_DATA: str = "/usr/share/gdal"
     PROJ_LIB: str = "/usr/share/proj"
@@ -0,0 +1,81 @@
+"""
+Password hashing off the request threads.
+
+pbkdf2 is CPU bound: run in AnyIO's threadpool a burst of logins holds
+every thread (and the GIL) and stalls unrelated endpoints. Hashes run in
+a small process pool instead, and at most PASSWORD_HASH_MAX_PENDING of
+them may be queued or running; beyond that callers get ``HashingBusy``
+immediately (503 + Retry-After) instead of waiting in line.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from app.core import security
+from app.core.config import settings
+
+RETRY_AFTER = 1  # Seconds suggested to rejected clients
+
+
+class HashingBusy(Exception):
+    pass
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(max(1, settings.PASSWORD_HASH_MAX_PENDING))
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the API process runs threads, forking it is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASH_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def _submit(fn, *args) -> Future:
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy()
+    pool = _get_pool()
+    try:
+        if pool is None:
+            future: Future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = pool.submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+async def hash_password(password: str) -> str:
+    return await asyncio.wrap_future(_submit(security.get_password_hash, password))
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """(valid, new hash if the stored one uses an outdated work factor)"""
+    return await asyncio.wrap_future(
+        _submit(security.verify_and_update, plain_password, hashed_password)
+    )
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
@@ -0,0 +1,223 @@
+"""
+Prometheus metrics.
+
+Series exported on ``/metrics``:
+
+- HTTP: latency per route template and in-flight requests
+  (``MetricsMiddleware``).
+- SQL: duration of every statement, plus the statement count and total
+  SQL time of each request. Engine events hook every engine, sync and
+  async.
+- Connection pools: checkout wait time (``TimedQueuePool`` /
+  ``TimedAsyncQueuePool``), capacity and connections in use
+  (``track_pool``).
+- Uploads: bytes received and throughput.
+- Jobs: run time per job kind and outcome.
+
+With several server processes, set ``PROMETHEUS_MULTIPROC_DIR`` so that
+``/metrics`` aggregates all of them (see the prometheus_client docs).
+"""
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    start_http_server,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route", "status"],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being served", ["method"],
+    multiprocess_mode="livesum",
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements executed per request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 500),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request", ["route"],
+)
+QUERY_LATENCY = Histogram(
+    "db_query_duration_seconds", "SQL statement duration", ["operation"],
+)
+POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time waiting for a pooled connection", ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use", "Connections checked out of the pool", ["pool"],
+    multiprocess_mode="livesum",
+)
+POOL_CAPACITY = Gauge(
+    "db_pool_capacity", "Pool size plus allowed overflow", ["pool"],
+    multiprocess_mode="livesum",
+)
+UPLOAD_BYTES = Counter(
+    "upload_bytes_total", "Bytes of uploaded files received", ["kind"],
+)
+UPLOAD_THROUGHPUT = Histogram(
+    "upload_throughput_bytes_per_second", "Receive rate of each upload request", ["kind"],
+    buckets=(1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8, 5e8),
+)
+JOB_DURATION = Histogram(
+    "job_duration_seconds", "Background job run time", ["kind", "status"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600),
+)
+
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "COPY"}
+
+
+class RequestStats:
+    """SQL work of the current request; shared with threads and greenlets it spawns"""
+
+    __slots__ = ("queries", "db_seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+
+
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+# SQL statements
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    QUERY_LATENCY.labels(operation if operation in SQL_OPERATIONS else "OTHER").observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(context):
+    starts = context.connection.info.get("query_start_time") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+# Connection pools
+class _TimedCheckout:
+    pool_label = "default"
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            POOL_WAIT.labels(self.pool_label).observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pool_label = "sync"
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pool_label = "async"
+
+
+def track_pool(pool: Pool, size: int, max_overflow: int) -> None:
+    """Export capacity and checked out connections of an engine's pool"""
+    label = getattr(pool, "pool_label", "default")
+    POOL_CAPACITY.labels(label).set(size + max_overflow)
+    in_use = POOL_IN_USE.labels(label)
+
+    # Listeners are kept when the engine recreates its pool (dispose)
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        in_use.inc()
+
+    @event.listens_for(pool, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        in_use.dec()
+
+
+# Uploads and jobs
+def observe_upload(kind: str, size: int, seconds: float) -> None:
+    UPLOAD_BYTES.labels(kind).inc(size)
+    if size and seconds > 0:
+        UPLOAD_THROUGHPUT.labels(kind).observe(size / seconds)
+
+
+def observe_job(kind: str, status: str, seconds: float) -> None:
+    JOB_DURATION.labels(kind, status).observe(seconds)
+
+
+# HTTP
+def _route_label(scope, root_path: str) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (e.g. /static) extend root_path with their mount path
+    mounted = scope.get("root_path", "")[len(root_path):]
+    return mounted or "unmatched"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, in-flight requests and SQL work per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status = 500
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            _request_stats.reset(token)
+            route = _route_label(scope, root_path)
+            REQUEST_LATENCY.labels(method, route, str(status)).observe(elapsed)
+            REQUEST_QUERIES.labels(route).observe(stats.queries)
+            REQUEST_DB_TIME.labels(route).observe(stats.db_seconds)
+
+
+def render_latest() -> bytes:
+    """Exposition of all metrics, aggregated across processes if configured"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,123 @@
+"""
+Cache of authenticated principals for ``deps.get_current_user``.
+
+Resolved users are cached by token ID (SHA-256 of the bearer token), so a
+hit skips both the JWT decoding and the ``users`` query. Entries never
+outlive their token and are dropped when the user changes: every user has
+a generation counter that is bumped after a commit touching the user row
+(see ``app.models.user``), and entries cached under an older generation
+are ignored.
+
+A cache hit yields a ``Principal``: a read-only snapshot of the cached
+columns, not a mapped ``User``, so nothing can trigger a lazy load (the
+password hash is never cached). Handlers that modify the user load the
+row themselves.
+
+With ``AUTH_CACHE_URL`` set, entries and generations live in Redis and
+are shared by all workers; otherwise each process has its own cache and
+other processes see changes after at most ``AUTH_CACHE_TTL`` seconds.
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from app.core.cache import RedisCache, TTLCache
+from app.core.config import settings
+
+# User columns kept in the cache (never the password hash)
+USER_FIELDS = ("id", "username", "email", "full_name", "is_active", "is_superuser", "role", "created_at", "updated_at")
+DATETIME_FIELDS = ("created_at", "updated_at")
+
+
+def token_id(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class PrincipalCache:
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Cached user fields for a token, None on miss"""
+        entry = self.backend.get(f"principal:{token_id(token)}")
+        if entry is None:
+            return None
+        if entry["gen"] != self.generation(entry["user"]["id"]):
+            return None
+        return entry["user"]
+
+    def generation(self, user_id: int) -> int:
+        """Read before loading the user, so a concurrent change wins"""
+        return self.backend.counter(f"user-gen:{user_id}")
+
+    def set(self, token: str, user, generation: int, expires_at: Optional[float] = None) -> None:
+        ttl = self.ttl
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        if ttl <= 0:
+            return
+        data = {}
+        for field in USER_FIELDS:
+            value = getattr(user, field)
+            if field in DATETIME_FIELDS and value is not None:
+                value = value.isoformat()
+            elif field == "role" and value is not None:
+                value = value.value
+            data[field] = value
+        entry = {"gen": generation, "user": data}
+        self.backend.set(f"principal:{token_id(token)}", entry, ttl)
+
+    def invalidate_user(self, user_id: int) -> None:
+        # Generations must outlive the entries they guard
+        self.backend.incr(f"user-gen:{user_id}", ttl=self.ttl * 2)
+
+
+class Principal:
+    """Authenticated user rebuilt from cached fields (USER_FIELDS only)"""
+
+    __slots__ = USER_FIELDS
+
+    def __init__(self, **values):
+        for field in USER_FIELDS:
+            object.__setattr__(self, field, values.get(field))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Principal is read-only; load the User row to change it")
+
+    def __repr__(self):
+        return f"<Principal {self.username}>"
+
+
+def principal_from_fields(data: Dict[str, Any]) -> Principal:
+    """Principal built from cached fields"""
+    from app.models.user import UserRole
+
+    values = dict(data)
+    for field in DATETIME_FIELDS:
+        if values.get(field):
+            values[field] = datetime.fromisoformat(values[field])
+    if values.get("role") is not None:
+        values["role"] = UserRole(values["role"])
+    return Principal(**values)
+
+
+_principal_cache: Optional[PrincipalCache] = None
+_principal_cache_lock = threading.Lock()
+
+
+def get_principal_cache() -> Optional[PrincipalCache]:
+    """Process-wide principal cache, None when disabled (AUTH_CACHE_TTL = 0)"""
+    global _principal_cache
+    if settings.AUTH_CACHE_TTL <= 0:
+        return None
+    with _principal_cache_lock:
+        if _principal_cache is None:
+            if settings.AUTH_CACHE_URL:
+                backend = RedisCache(settings.AUTH_CACHE_URL, prefix="geovisor:auth:")
+            else:
+                backend = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL)
+            _principal_cache = PrincipalCache(backend, settings.AUTH_CACHE_TTL)
+        return _principal_cache
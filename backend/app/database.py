@@ -1,18 +1,50 @@
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
+from app.core.metrics import TimedAsyncQueuePool, TimedQueuePool, track_pool
+
+# Create database engine (sync: scripts, Alembic and job workers)
+SYNC_POOL_SIZE = 5  # SQLAlchemy's defaults, spelled out for the pool metrics
+SYNC_MAX_OVERFLOW = 10
 
-# Create database engine
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    echo=settings.DEBUG
+    pool_size=SYNC_POOL_SIZE,
+    max_overflow=SYNC_MAX_OVERFLOW,
+    poolclass=TimedQueuePool,
+    echo=settings.SQL_ECHO
 )
+track_pool(engine.pool, SYNC_POOL_SIZE, SYNC_MAX_OVERFLOW)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+
+def async_database_url(url: str) -> str:
+    """DATABASE_URL with the asyncpg driver"""
+    return make_url(url).set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+
+
+# Async engine for the API: requests wait on Postgres without holding a thread
+async_engine = create_async_engine(
+    settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    poolclass=TimedAsyncQueuePool,
+    echo=settings.SQL_ECHO
+)
+track_pool(async_engine.sync_engine.pool, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW)
+
+# Objects stay usable after commit: reloading them would need an await
+AsyncSessionLocal = async_sessionmaker(
+    async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False
+)
+
 # Create base class for models
 from app.db_base import Base
 
@@ -1,8 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from app.core import hashing, metrics
 from app.core.config import settings
-from app.database import engine
+from app.database import async_engine, engine
 from app.models import user, project, layer, measurement
+from app.services import volume
+from app.services.storage import get_storage
+from app.utils.file_server import StorageRedirect, UploadFiles
 
 # Create database tables
 # user.Base.metadata.create_all(bind=engine)
@@ -15,9 +20,6 @@ app = FastAPI(
     redoc_url="/redoc"
 )
 
-from fastapi.staticfiles import StaticFiles
-import os
-
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -25,15 +27,67 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
-# Mount static files (uploads)
-upload_dir = settings.UPLOAD_DIR
-if not os.path.isabs(upload_dir):
-    upload_dir = os.path.join(os.getcwd(), upload_dir)
-os.makedirs(upload_dir, exist_ok=True)
+# Request latency, in-flight requests and SQL work per route
+if settings.METRICS_ENABLED:
+    app.add_middleware(metrics.MetricsMiddleware)
+
+# Background job workers (ingestion pipeline)
+job_pool = None
+
+
+@app.on_event("startup")
+def mount_static_files():
+    # Mount static files (uploads): range requests, ETags and precompressed
+    # variants, or redirects to presigned URLs with object storage. Done at
+    # startup so an invalid storage configuration fails the boot, not imports.
+    storage = get_storage()
+    if storage.local:
+        app.mount("/static", UploadFiles(directory=storage.root), name="static")
+    else:
+        app.mount("/static", StorageRedirect(storage), name="static")
+
+
+@app.on_event("startup")
+def start_job_workers():
+    global job_pool
+    from app.services import jobs, ingest  # noqa: F401  (registers job handlers)
+    if settings.JOB_WORKERS > 0:
+        job_pool = jobs.WorkerPool(settings.JOB_WORKERS, settings.JOB_POLL_INTERVAL)
+        job_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    if job_pool is not None:
+        job_pool.stop(timeout=5)
+
+
+@app.on_event("shutdown")
+def stop_hashing_pool():
+    hashing.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_volume_pool():
+    volume.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_database_pool():
+    await async_engine.dispose()
+
+
+@app.exception_handler(hashing.HashingBusy)
+async def hashing_busy_handler(request: Request, exc: hashing.HashingBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Too many authentication requests, retry shortly"},
+        headers={"Retry-After": str(hashing.RETRY_AFTER)},
+    )
 
-app.mount("/static", StaticFiles(directory=upload_dir), name="static")
 
 @app.get("/")
 async def root():
@@ -44,6 +98,15 @@ async def root():
         "docs": "/docs"
     }
 
+
+@app.get("/metrics", include_in_schema=False)
+async def read_metrics():
+    """Prometheus metrics"""
+    if not settings.METRICS_ENABLED:
+        return Response(status_code=404)
+    return Response(content=metrics.render_latest(), headers={"Content-Type": metrics.CONTENT_TYPE_LATEST})
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
@@ -53,14 +116,18 @@ async def health_check():
         "version": settings.APP_VERSION
     }
 
+
 # Import and include routers
-from app.api import auth, users, projects, layers, measurements
+from app.api import auth, users, projects, layers, measurements, uploads, pointclouds, tiles
 # from app.api import analysis
 
 app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(users.router, prefix="/api/users", tags=["Users"])
 app.include_router(projects.router, prefix="/api/projects", tags=["Projects"])
 app.include_router(layers.router, prefix="/api", tags=["Layers"])
+app.include_router(uploads.router, prefix="/api", tags=["Uploads"])
+app.include_router(pointclouds.router, prefix="/api", tags=["Point Clouds"])
+app.include_router(tiles.router, prefix="/api", tags=["Tiles"])
 app.include_router(measurements.router, prefix="/api", tags=["Measurements"])
 # app.include_router(analysis.router, prefix="/api/analysis", tags=["Analysis"])
 
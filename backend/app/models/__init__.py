@@ -1,4 +1,8 @@
 from app.models.user import User, UserRole
 from app.models.project import Project, ProjectMember, ProjectMemberRole
+from app.models.blob import Blob
 from app.models.layer import Layer, LayerType, LayerFormat
 from app.models.measurement import Measurement, MeasurementType, MeasurementUnit
+from app.models.upload import UploadSession
+from app.models.job import Job, JobStatus
+from app.models.feature import LayerFeature, LayerFeatureLevel
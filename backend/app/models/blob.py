@@ -0,0 +1,22 @@
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime
+from sqlalchemy.sql import func
+from app.db_base import Base
+
+
+class Blob(Base):
+    """
+    Uploaded file content, stored once per SHA-256 and shared by every
+    layer made from it. ``ref_count`` is the number of such layers; blobs
+    that drop to zero are removed by a ``blob_gc`` job.
+    """
+    __tablename__ = "blobs"
+    
+    sha256 = Column(String(64), primary_key=True)
+    size = Column(BigInteger, nullable=False)
+    path = Column(String(512), nullable=False)  # <UPLOAD_DIR>/<sha256><ext>
+    ref_count = Column(Integer, nullable=False, default=0)
+    
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    def __repr__(self):
+        return f"<Blob {self.sha256[:12]} ({self.ref_count} refs)>"
@@ -0,0 +1,40 @@
+from sqlalchemy import Column, Integer, BigInteger, SmallInteger, ForeignKey, Index
+from sqlalchemy.dialects.postgresql import JSONB
+from geoalchemy2 import Geometry
+from app.db_base import Base
+
+
+class LayerFeature(Base):
+    """Feature of a vector layer, imported from its file at ingest time"""
+    __tablename__ = "layer_features"
+    __table_args__ = (
+        Index("ix_layer_features_geom", "geom", postgresql_using="gist"),
+    )
+    
+    id = Column(BigInteger, primary_key=True)
+    layer_id = Column(Integer, ForeignKey("layers.id", ondelete="CASCADE"), nullable=False, index=True)
+    properties = Column(JSONB, nullable=True)
+    geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False), nullable=False)
+    
+    def __repr__(self):
+        return f"<LayerFeature {self.id} (layer {self.layer_id})>"
+
+
+class LayerFeatureLevel(Base):
+    """
+    Simplified geometry of a feature for one zoom level. Only stored when
+    simplification actually removes vertices; readers fall back to
+    ``LayerFeature.geom`` otherwise.
+    """
+    __tablename__ = "layer_feature_levels"
+    __table_args__ = (
+        Index("ix_layer_feature_levels_layer_zoom", "layer_id", "zoom"),
+    )
+    
+    feature_id = Column(BigInteger, ForeignKey("layer_features.id", ondelete="CASCADE"), primary_key=True)
+    zoom = Column(SmallInteger, primary_key=True)
+    layer_id = Column(Integer, ForeignKey("layers.id", ondelete="CASCADE"), nullable=False)
+    geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False), nullable=False)
+    
+    def __repr__(self):
+        return f"<LayerFeatureLevel {self.feature_id} (zoom {self.zoom})>"
@@ -0,0 +1,62 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Float, Index, Enum as SQLEnum
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.db_base import Base
+import enum
+
+
+class JobStatus(str, enum.Enum):
+    """Background job states"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class Job(Base):
+    """Background processing job (ingestion stages, conversions, ...)"""
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Used by workers to claim the next runnable job
+        Index("ix_jobs_claim", "status", "run_after", "priority"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    layer_id = Column(Integer, ForeignKey("layers.id", ondelete="CASCADE"), nullable=True, index=True)
+    kind = Column(String(50), nullable=False)
+    status = Column(SQLEnum(JobStatus), default=JobStatus.QUEUED, nullable=False)
+    priority = Column(Integer, default=0, nullable=False)  # Lower runs first
+    
+    # Input and output
+    payload = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    
+    # Progress reporting
+    progress = Column(Float, default=0.0, nullable=False)  # 0..1
+    message = Column(String(512), nullable=True)
+    error = Column(Text, nullable=True)
+    
+    # Retries
+    attempts = Column(Integer, default=0, nullable=False)
+    max_attempts = Column(Integer, default=3, nullable=False)
+    run_after = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    
+    # Timings
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Relationships
+    layer = relationship("Layer")
+    
+    @property
+    def duration(self):
+        """Run time in seconds of the last attempt"""
+        if not self.started_at:
+            return None
+        end = self.finished_at or self.heartbeat_at
+        return (end - self.started_at).total_seconds() if end else None
+    
+    def __repr__(self):
+        return f"<Job {self.kind} ({self.status})>"
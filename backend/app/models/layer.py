@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Enum as SQLEnum, Float
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Index, JSON, Enum as SQLEnum, Float, event
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.sql import func
 from geoalchemy2 import Geometry
 from app.db_base import Base
@@ -30,6 +30,11 @@ class LayerFormat(str, enum.Enum):
 class Layer(Base):
     """Layer model for geospatial data"""
     __tablename__ = "layers"
+    __table_args__ = (
+        # Keyset pagination order (app.utils.pagination)
+        Index("ix_layers_project_created_at_id", "project_id", "created_at", "id"),
+        Index("ix_layers_extent", "extent", postgresql_using="gist"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
@@ -40,7 +45,9 @@ class Layer(Base):
     
     # File information
     file_path = Column(String(512), nullable=False)
-    file_size = Column(Integer, nullable=True)  # Size in bytes
+    # Shared content the file belongs to (NULL for files stored before blobs)
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)
+    file_size = Column(BigInteger, nullable=True)  # Size in bytes
     original_filename = Column(String(255), nullable=True)
     
     # Processed data paths
@@ -49,6 +56,7 @@ class Layer(Base):
     
     # Spatial metadata
     bbox = Column(JSON, nullable=True)  # Bounding box [minx, miny, maxx, maxy]
+    extent = deferred(Column(Geometry(geometry_type='POLYGON', srid=4326, spatial_index=False), nullable=True))  # bbox as a polygon, for spatial queries
     crs = Column(String(50), nullable=True)  # Coordinate Reference System (EPSG code)
     
     # Additional metadata
@@ -66,3 +74,12 @@ class Layer(Base):
     
     def __repr__(self):
         return f"<Layer {self.name} ({self.layer_type})>"
+
+
+@event.listens_for(Layer.bbox, "set")
+def _sync_extent(target, value, oldvalue, initiator):
+    # bbox is always WGS84 (see app.services.ingest); the extent follows it
+    if value and len(value) == 4:
+        target.extent = func.ST_MakeEnvelope(*[float(v) for v in value], 4326)
+    else:
+        target.extent = None
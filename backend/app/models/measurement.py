@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, JSON, Enum as SQLEnum
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, JSON, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from geoalchemy2 import Geometry
@@ -27,6 +27,11 @@ class MeasurementUnit(str, enum.Enum):
 class Measurement(Base):
     """Measurement model"""
     __tablename__ = "measurements"
+    __table_args__ = (
+        # Keyset pagination order (app.utils.pagination)
+        Index("ix_measurements_project_created_at_id", "project_id", "created_at", "id"),
+        Index("ix_measurements_geometry", "geometry", postgresql_using="gist"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
@@ -34,7 +39,7 @@ class Measurement(Base):
     measurement_type = Column(SQLEnum(MeasurementType), nullable=False)
     
     # Geometry (stored as WKT or GeoJSON)
-    geometry = Column(Geometry(geometry_type='GEOMETRY', srid=4326), nullable=True)
+    geometry = Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False), nullable=True)
     
     # Measurement value and unit
     value = Column(Float, nullable=False)
@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Enum as SQLEnum
-from sqlalchemy.orm import relationship
+from itertools import chain
+from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, Index, Enum as SQLEnum, UniqueConstraint, event, update
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 from app.db_base import Base
 import enum
@@ -15,6 +16,11 @@ class ProjectMemberRole(str, enum.Enum):
 class Project(Base):
     """Project model"""
     __tablename__ = "projects"
+    __table_args__ = (
+        # Keyset pagination order (app.utils.pagination)
+        Index("ix_projects_created_at_id", "created_at", "id"),
+        Index("ix_projects_owner_created_at_id", "owner_id", "created_at", "id"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(255), nullable=False, index=True)
@@ -36,6 +42,10 @@ class Project(Base):
 class ProjectMember(Base):
     """Project member association table"""
     __tablename__ = "project_members"
+    __table_args__ = (
+        # Also serves the (project, user) lookup of permission checks
+        UniqueConstraint("project_id", "user_id", name="uq_project_members_project_user"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False)
@@ -49,3 +59,30 @@ class ProjectMember(Base):
     
     def __repr__(self):
         return f"<ProjectMember project_id={self.project_id} user_id={self.user_id}>"
+
+
+# Project contents: changing any of these changes the project version
+# (updated_at), which is the ETag of the project workspace
+VERSIONED_CHILD_TABLES = ("layers", "measurements")
+
+
+def touch_project(db: Session, project_id: int) -> None:
+    """Bump the version of a project after writes that bypass the ORM"""
+    db.execute(
+        update(Project.__table__)
+        .where(Project.__table__.c.id == project_id)
+        .values(updated_at=func.clock_timestamp())
+    )
+
+
+@event.listens_for(Session, "before_flush")
+def _touch_changed_projects(session, flush_context, instances):
+    project_ids = {
+        obj.project_id
+        for obj in chain(session.new, session.dirty, session.deleted)
+        if getattr(obj, "__tablename__", None) in VERSIONED_CHILD_TABLES
+        and obj.project_id is not None
+        and (obj not in session.dirty or session.is_modified(obj))
+    }
+    for project_id in project_ids:
+        touch_project(session, project_id)
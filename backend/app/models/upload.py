@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, ForeignKey, Enum as SQLEnum
+from sqlalchemy.sql import func
+from app.db_base import Base
+from app.models.layer import LayerType, LayerFormat
+
+
+class UploadSession(Base):
+    """Resumable chunked upload in progress"""
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String(36), primary_key=True)  # UUID, also used for the partial file name
+    project_id = Column(Integer, ForeignKey("projects.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    
+    # Layer to create once the upload is complete
+    name = Column(String(255), nullable=False)
+    description = Column(Text, nullable=True)
+    layer_type = Column(SQLEnum(LayerType), nullable=False)
+    format = Column(SQLEnum(LayerFormat), nullable=False)
+    
+    # File information
+    original_filename = Column(String(255), nullable=False)
+    total_size = Column(BigInteger, nullable=False)  # Declared size in bytes
+    received = Column(BigInteger, nullable=False, default=0)  # Bytes stored so far
+    sha256 = Column(String(64), nullable=True)  # Optional checksum announced by the client
+    
+    # Direct uploads: multipart upload in object storage, parts sent by the client
+    storage_upload_id = Column(String(1024), nullable=True)
+    part_size = Column(BigInteger, nullable=True)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now(), nullable=True)
+    
+    def __repr__(self):
+        return f"<UploadSession {self.id} ({self.received}/{self.total_size})>"
@@ -1,5 +1,6 @@
-from sqlalchemy import Boolean, Column, Integer, String, DateTime, Enum as SQLEnum
-from sqlalchemy.orm import relationship
+from itertools import chain
+from sqlalchemy import Boolean, Column, Integer, String, DateTime, Enum as SQLEnum, event
+from sqlalchemy.orm import Session, relationship
 from sqlalchemy.sql import func
 from app.db_base import Base
 import enum
@@ -28,3 +29,34 @@ class User(Base):
     
     def __repr__(self):
         return f"<User {self.username}>"
+
+
+# Cached principals (app.core.principals) are invalidated once a change to
+# the user row is committed, whichever endpoint or script made it
+@event.listens_for(Session, "after_flush")
+def _collect_changed_users(session, flush_context):
+    changed = {
+        obj.id
+        for obj in chain(session.dirty, session.deleted)
+        if isinstance(obj, User) and (obj in session.deleted or session.is_modified(obj))
+    }
+    if changed:
+        session.info.setdefault("changed_user_ids", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    changed = session.info.pop("changed_user_ids", None)
+    if not changed:
+        return
+    from app.core.principals import get_principal_cache
+
+    cache = get_principal_cache()
+    if cache:
+        for user_id in changed:
+            cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_changed_users(session):
+    session.info.pop("changed_user_ids", None)
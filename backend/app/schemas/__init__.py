@@ -3,3 +3,5 @@ from . import user
 from . import project
 from . import layer
 from . import measurement
+from . import upload
+from . import job
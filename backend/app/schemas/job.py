@@ -0,0 +1,25 @@
+from typing import Optional, Any, Dict
+from pydantic import BaseModel
+from datetime import datetime
+from app.models.job import JobStatus
+
+# Properties to return to client
+class Job(BaseModel):
+    id: int
+    layer_id: Optional[int] = None
+    kind: str
+    status: JobStatus
+    progress: float
+    message: Optional[str] = None
+    error: Optional[str] = None
+    result: Optional[Dict[str, Any]] = None
+    attempts: int
+    max_attempts: int
+    run_after: datetime
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration: Optional[float] = None  # Seconds
+
+    class Config:
+        from_attributes = True
@@ -1,5 +1,5 @@
-from typing import Optional, Any, Dict
-from pydantic import BaseModel
+from typing import Optional, Any, Dict, List
+from pydantic import BaseModel, Field, field_validator
 from app.models.measurement import MeasurementType, MeasurementUnit
 
 class MeasurementBase(BaseModel):
@@ -10,15 +10,127 @@ class MeasurementBase(BaseModel):
     geometry: Dict[str, Any] # GeoJSON Geometry (Point, LineString, Polygon)
 
 class MeasurementCreate(MeasurementBase):
-    pass
+    # Computed by the server for distance, perimeter and area
+    value: Optional[float] = None
+    unit: Optional[MeasurementUnit] = None
 
 class MeasurementInDBBase(MeasurementBase):
     id: int
     project_id: int
     created_at: Any = None 
 
+    @field_validator("geometry", mode="before")
+    @classmethod
+    def geometry_to_geojson(cls, value: Any) -> Any:
+        # Geometry columns load as WKB elements
+        if value is not None and not isinstance(value, dict):
+            from geoalchemy2.shape import to_shape
+            from shapely.geometry import mapping
+            return mapping(to_shape(value))
+        return value
+
     class Config:
         from_attributes = True
 
 class Measurement(MeasurementInDBBase):
     pass
+
+# Batch computation (no persistence)
+class MeasurementComputeItem(BaseModel):
+    measurement_type: MeasurementType
+    geometry: Dict[str, Any]
+    unit: Optional[MeasurementUnit] = None
+
+class MeasurementComputeRequest(BaseModel):
+    items: List[MeasurementComputeItem] = Field(..., max_length=100000)
+
+class MeasurementComputeResult(BaseModel):
+    index: int
+    value: Optional[float] = None
+    unit: Optional[MeasurementUnit] = None
+    error: Optional[str] = None
+
+# Bulk import / update / delete
+class MeasurementBulkCreate(MeasurementCreate):
+    notes: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+class MeasurementUpdate(BaseModel):
+    name: Optional[str] = None
+    value: Optional[float] = None
+    unit: Optional[MeasurementUnit] = None
+    geometry: Optional[Dict[str, Any]] = None
+    notes: Optional[str] = None
+    data: Optional[Dict[str, Any]] = None
+
+class MeasurementFeatureCollection(BaseModel):
+    """GeoJSON FeatureCollection; measurement fields go in `properties`"""
+    type: str = "FeatureCollection"
+    # Validated one by one so a bad feature only fails itself
+    features: List[Dict[str, Any]] = Field(..., max_length=100000)
+
+class MeasurementBulkDelete(BaseModel):
+    ids: List[int] = Field(..., max_length=100000)
+
+class MeasurementBulkItemResult(BaseModel):
+    index: int
+    id: Optional[int] = None
+    error: Optional[str] = None
+
+class MeasurementBulkResult(BaseModel):
+    succeeded: int
+    failed: int
+    items: List[MeasurementBulkItemResult]
+
+# Cut/fill volumes over a DEM or point-cloud layer
+class VolumeRequest(BaseModel):
+    geometry: Dict[str, Any]  # Polygon or MultiPolygon (WGS84)
+    # Base: a horizontal plane, a second surface (layer of the same
+    # project) or, with neither, the lowest point inside the polygon
+    base_elevation: Optional[float] = None
+    base_layer_id: Optional[int] = None
+    resolution: Optional[float] = Field(None, gt=0)  # Point clouds: cell size in CRS units
+    unit: Optional[MeasurementUnit] = None
+    # Store the result as a volume measurement of the project
+    save: bool = False
+    name: Optional[str] = None
+    notes: Optional[str] = None
+
+class VolumeResult(BaseModel):
+    cut: float  # Surface above the base: material to remove
+    fill: float  # Surface below the base: material to add
+    net: float  # cut - fill
+    unit: MeasurementUnit
+    area: float  # Square meters with data inside the polygon
+    cells: int
+    nodata_cells: int
+    resolution: List[float]
+    base_elevation: Optional[float] = None
+    min_elevation: float
+    max_elevation: float
+    tiles: int
+    measurement_id: Optional[int] = None
+
+# Elevation profiles along a line over a DEM or point-cloud layer
+class ProfileRequest(BaseModel):
+    geometry: Dict[str, Any]  # LineString (WGS84)
+    samples: int = Field(512, ge=2, le=100000)
+    search_radius: Optional[float] = Field(None, gt=0)  # Point clouds: meters to the nearest point
+    unit: Optional[MeasurementUnit] = None  # Of the length
+    # Store the profile as an elevation_profile measurement of the project
+    save: bool = False
+    name: Optional[str] = None
+    notes: Optional[str] = None
+
+class ProfileResult(BaseModel):
+    length: float
+    unit: MeasurementUnit
+    spacing: float  # Meters between samples
+    samples: int
+    elevations: List[Optional[float]]  # None where the surface has no data
+    coordinates: List[List[float]]  # lon, lat of each sample
+    min_elevation: float
+    max_elevation: float
+    gain: float
+    loss: float
+    measurement_id: Optional[int] = None
@@ -2,6 +2,8 @@ from typing import Optional, List
 from pydantic import BaseModel
 from datetime import datetime
 from app.models.project import ProjectMemberRole
+from app.schemas.layer import Layer
+from app.schemas.measurement import Measurement
 
 # Shared properties
 class ProjectBase(BaseModel):
@@ -34,3 +36,21 @@ class Project(ProjectInDBBase):
 # Properties stored in DB
 class ProjectInDB(ProjectInDBBase):
     pass
+
+# Project members
+class ProjectMemberCreate(BaseModel):
+    user_id: int
+    role: ProjectMemberRole = ProjectMemberRole.VIEWER
+
+class ProjectMember(ProjectMemberCreate):
+    id: int
+    project_id: int
+    joined_at: datetime
+
+    class Config:
+        from_attributes = True
+
+# Project with everything the project view needs, in one response
+class ProjectWorkspace(ProjectInDBBase):
+    layers: List[Layer] = []
+    measurements: List[Measurement] = []
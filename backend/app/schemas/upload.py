@@ -0,0 +1,47 @@
+from typing import List, Optional
+from pydantic import BaseModel, Field
+from datetime import datetime
+from app.models.layer import LayerType, LayerFormat
+
+# Properties to receive when starting a chunked upload
+class UploadInit(BaseModel):
+    name: str
+    description: Optional[str] = None
+    layer_type: LayerType
+    format: LayerFormat
+    filename: str
+    total_size: int = Field(..., gt=0)
+    sha256: Optional[str] = Field(None, min_length=64, max_length=64)
+
+# Properties to return to client
+class UploadSession(BaseModel):
+    id: str
+    project_id: int
+    name: str
+    original_filename: str
+    total_size: int
+    received: int
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+# Direct upload: the client PUTs each part to its presigned URL, in
+# parallel, and completes with the ETag header of every part
+class UploadPartURL(BaseModel):
+    part_number: int
+    url: str
+
+class DirectUpload(BaseModel):
+    upload: UploadSession
+    part_size: int
+    parts: List[UploadPartURL]
+    expires_in: int  # Seconds the URLs stay valid
+
+class UploadPart(BaseModel):
+    part_number: int = Field(..., ge=1)
+    etag: str
+
+class UploadComplete(BaseModel):
+    parts: List[UploadPart] = Field(default_factory=list, max_length=10000)
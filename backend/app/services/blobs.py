@@ -0,0 +1,213 @@
+"""
+Content-addressed upload storage.
+
+An upload is streamed to a temporary file while its SHA-256 is computed,
+then registered as a blob: the first upload of some content is stored as
+``<sha256><ext>`` (see ``app.services.storage``); later uploads of the
+same content just take a reference and drop their copy. Files uploaded
+directly to object storage are hashed and registered the same way by the
+``blob_register`` job. Layers point to their blob (``Layer.blob_sha256``)
+and ``Blob.ref_count`` counts them.
+
+Artifacts derived from the content alone (octree, COG, thumbnails) live
+under ``<PROCESSED_DIR>/blobs/<sha256>/`` so ingesting the same content
+again reuses them instead of recomputing.
+
+When the last layer goes away the blob is left with no references and a
+``blob_gc`` job deletes it. Registering and collecting a blob both lock
+its row, so a re-upload racing the collector either revives the row
+before it is collected or recreates it (and its file) afterwards.
+"""
+import logging
+import os
+import shutil
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import select, text, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import settings
+from app.services import jobs
+from app.services.storage import get_storage
+from app.services.tile_cache import get_tile_cache
+from app.utils.files import file_sha256, layer_artifact_dir, layer_artifacts_root, resolve_data_dir, write_digest
+
+logger = logging.getLogger(__name__)
+
+
+def blob_file(sha256: str, ext: str) -> str:
+    # Flat in UPLOAD_DIR: /static serves uploads by file name
+    return os.path.join(resolve_data_dir(settings.UPLOAD_DIR), f"{sha256}{ext.lower()}")
+
+
+def blob_artifacts_root(sha256: str) -> str:
+    """Directory holding the artifacts derived from a blob's content"""
+    return os.path.join(resolve_data_dir(settings.PROCESSED_DIR), "blobs", sha256)
+
+
+def artifact_dir(layer: models.Layer, name: str) -> str:
+    """
+    Directory for a derived artifact of a layer: shared by every layer of
+    the same blob, or private to layers stored before blobs existed.
+    """
+    if layer.blob_sha256:
+        return os.path.join(blob_artifacts_root(layer.blob_sha256), name)
+    return layer_artifact_dir(layer.id, name)
+
+
+def tile_cache_prefix(layer: models.Layer) -> str:
+    """Tile cache key prefix of tiles that depend only on the layer's content"""
+    return f"blob-{layer.blob_sha256}" if layer.blob_sha256 else str(layer.id)
+
+
+def lock_artifact(db: Session, key: str) -> None:
+    """
+    Serialize builds of a shared artifact until the caller's transaction
+    ends, so two layers of one blob never build it at the same time.
+    """
+    db.execute(text("SELECT pg_advisory_xact_lock(hashtext(:key))"), {"key": key})
+
+
+def acquire(db: Session, sha256: str, size: int, ext: str) -> str:
+    """
+    Take a reference on the blob of some content and return the blob's
+    path. The caller then stores the content with ``store`` and commits.
+    """
+    table = models.Blob.__table__
+    statement = (
+        insert(table)
+        .values(sha256=sha256, size=size, path=blob_file(sha256, ext), ref_count=1)
+        .on_conflict_do_update(index_elements=[table.c.sha256], set_={"ref_count": table.c.ref_count + 1})
+        .returning(table.c.path)
+    )
+    # The row stays locked until commit: a concurrent blob_gc has either
+    # finished (the row is new) or waits and then sees the reference
+    return db.execute(statement).scalar_one()
+
+
+def store(tmp_path: str, path: str, sha256: str) -> None:
+    """
+    Move a freshly received file to its blob, or remove it if the content
+    is already stored. Blocking (uploads to object storage): run it in a
+    thread.
+    """
+    storage = get_storage()
+    key = storage.key_for(path)
+    if storage.exists(key):
+        os.remove(tmp_path)
+    else:
+        storage.put(tmp_path, key)
+        write_digest(path, sha256)
+
+
+def release(db: Session, counts: Dict[str, int]) -> None:
+    """
+    Drop references (number per blob sha256) and queue the collection of
+    blobs left unreferenced. The caller commits.
+    """
+    table = models.Blob.__table__
+    for sha256, count in counts.items():
+        remaining = db.execute(
+            update(table)
+            .where(table.c.sha256 == sha256)
+            .values(ref_count=table.c.ref_count - count)
+            .returning(table.c.ref_count)
+        ).scalar()
+        if remaining is not None and remaining <= 0:
+            jobs.enqueue(db, "blob_gc", payload={"sha256": sha256})
+
+
+def remove_layer_files(layer: models.Layer) -> None:
+    """
+    Delete what a removed layer kept to itself: its file unless it is a
+    shared blob (those go with blob_gc), its private artifacts and its
+    cached tiles. Blocking: run it in a thread.
+    """
+    if layer.file_path and not layer.blob_sha256:
+        storage = get_storage()
+        storage.delete(storage.key_for(layer.file_path))  # Also its digest and compressed copies
+    shutil.rmtree(layer_artifacts_root(layer.id), ignore_errors=True)
+    get_tile_cache().invalidate_prefix(str(layer.id))
+
+
+def reference_counts(layers: Iterable[models.Layer]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for layer in layers:
+        if layer.blob_sha256:
+            counts[layer.blob_sha256] = counts.get(layer.blob_sha256, 0) + 1
+    return counts
+
+
+def processed_sibling(db: Session, layer: models.Layer) -> Optional[models.Layer]:
+    """Another layer of the same blob and format whose features are imported"""
+    if not layer.blob_sha256:
+        return None
+    Layer = models.Layer
+    return db.scalars(
+        select(Layer)
+        .where(
+            Layer.blob_sha256 == layer.blob_sha256,
+            Layer.format == layer.format,
+            Layer.id != layer.id,
+            Layer.layer_metadata["features_version"].as_string().is_not(None),
+        )
+        .order_by(Layer.id)
+        .limit(1)
+    ).first()
+
+
+@jobs.handler("blob_gc")
+def collect_blob(ctx: jobs.JobContext) -> dict:
+    """Delete an unreferenced blob with its file and derived artifacts"""
+    sha256 = ctx.payload.get("sha256")
+    blob = ctx.db.scalars(
+        select(models.Blob).where(models.Blob.sha256 == sha256).with_for_update()
+    ).first()
+    if blob is None or blob.ref_count > 0:
+        ctx.db.rollback()
+        return {"collected": False}
+
+    storage = get_storage()
+    storage.delete(storage.key_for(blob.path))  # Also its digest and compressed copies
+    shutil.rmtree(blob_artifacts_root(sha256), ignore_errors=True)
+    get_tile_cache().invalidate_prefix(f"blob-{sha256}")
+    ctx.db.delete(blob)
+    ctx.db.commit()
+    logger.info("Collected blob %s", sha256)
+    return {"collected": True, "size": blob.size}
+
+
+@jobs.handler("blob_register")
+def register_blob(ctx: jobs.JobContext) -> dict:
+    """
+    Hash a file uploaded directly to storage and move it to its blob.
+    First stage of the ingestion of direct uploads.
+    """
+    layer = ctx.layer
+    if layer is None or layer.blob_sha256:
+        return {}
+
+    storage = get_storage()
+    key = storage.key_for(layer.file_path)
+    local_path = storage.fetch(key)
+    sha256 = file_sha256(local_path)
+    expected = ctx.payload.get("sha256")
+    if expected and expected != sha256:
+        raise ValueError(f"Checksum mismatch: expected {expected}, got {sha256}")
+
+    size = os.path.getsize(local_path)
+    path = acquire(ctx.db, sha256, size, os.path.splitext(layer.file_path)[1])
+    blob_key = storage.key_for(path)
+    if not storage.exists(blob_key):
+        storage.copy(key, blob_key)
+        write_digest(path, sha256)
+    layer.file_path = path
+    layer.file_size = size
+    layer.blob_sha256 = sha256
+    layer.layer_metadata = {**(layer.layer_metadata or {}), "sha256": sha256}
+    ctx.db.commit()
+    # Only once committed: a retry after a failure still finds the upload
+    storage.delete(key)
+    return {"sha256": sha256, "size": size}
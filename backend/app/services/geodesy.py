@@ -0,0 +1,146 @@
+"""
+Vectorized geodesic computations on the WGS84 ellipsoid.
+
+Every function works on whole coordinate arrays: many lines or rings are
+packed in one (N, 2|3) array of lon/lat[/height] in degrees plus the start
+offset of each part, and per-part results are summed with NumPy ufunc
+reductions. No Python loop runs per vertex.
+"""
+from typing import Tuple
+
+import numpy as np
+
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+WGS84_B = WGS84_A * (1 - WGS84_F)
+WGS84_E2 = WGS84_F * (2 - WGS84_F)
+
+# Radius of the sphere with the same surface as the ellipsoid
+_E = np.sqrt(WGS84_E2)
+AUTHALIC_RADIUS = np.sqrt(
+    WGS84_A ** 2 / 2 * (1 + (1 - WGS84_E2) / _E * np.arctanh(_E))
+)
+_Q_POLE = (1 - WGS84_E2) * (1 / (1 - WGS84_E2) + np.arctanh(_E) / _E)
+
+
+def vincenty_distance(
+    lon1: np.ndarray, lat1: np.ndarray, lon2: np.ndarray, lat2: np.ndarray,
+    tolerance: float = 1e-12, max_iterations: int = 200,
+) -> np.ndarray:
+    """
+    Ellipsoidal distance in meters between point arrays (degrees), by
+    Vincenty's inverse formula. The iteration runs on all pairs at once
+    until every pair has converged; nearly antipodal pairs that never
+    converge keep their last estimate.
+    """
+    lon1, lat1, lon2, lat2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lon1, lat1, lon2, lat2))
+    f = WGS84_F
+    U1 = np.arctan((1 - f) * np.tan(lat1))
+    U2 = np.arctan((1 - f) * np.tan(lat2))
+    sin_u1, cos_u1 = np.sin(U1), np.cos(U1)
+    sin_u2, cos_u2 = np.sin(U2), np.cos(U2)
+    L = lon2 - lon1
+
+    lam = L.copy()
+    active = np.ones(L.shape, dtype=bool)
+    sin_sigma = cos_sigma = sigma = cos2_alpha = cos_2sm = None
+    for _ in range(max_iterations):
+        sin_lam, cos_lam = np.sin(lam), np.cos(lam)
+        sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+        cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+        sigma = np.arctan2(sin_sigma, cos_sigma)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            sin_alpha = np.where(sin_sigma == 0, 0.0, cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # Equatorial lines have cos2_alpha == 0
+            cos_2sm = np.where(cos2_alpha == 0, 0.0, cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+        C = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+        new_lam = L + (1 - C) * f * sin_alpha * (
+            sigma + C * sin_sigma * (cos_2sm + C * cos_sigma * (-1 + 2 * cos_2sm ** 2))
+        )
+        active = np.abs(new_lam - lam) > tolerance
+        lam = new_lam
+        if not active.any():
+            break
+
+    u2 = cos2_alpha * (WGS84_A ** 2 - WGS84_B ** 2) / WGS84_B ** 2
+    A = 1 + u2 / 16384 * (4096 + u2 * (-768 + u2 * (320 - 175 * u2)))
+    B = u2 / 1024 * (256 + u2 * (-128 + u2 * (74 - 47 * u2)))
+    delta_sigma = B * sin_sigma * (
+        cos_2sm + B / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sm ** 2)
+            - B / 6 * cos_2sm * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sm ** 2)
+        )
+    )
+    return WGS84_B * A * (sigma - delta_sigma)
+
+
+def _segments(coords: np.ndarray, offsets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Indices of segment start points and the part each segment belongs to"""
+    n = len(coords)
+    starts = np.arange(n - 1)
+    # A segment is valid unless its end point starts the next part
+    part_starts = np.zeros(n, dtype=bool)
+    part_starts[offsets] = True
+    valid = ~part_starts[1:]
+    starts = starts[valid]
+    part = np.searchsorted(offsets, starts, side="right") - 1
+    return starts, part
+
+
+def path_lengths(coords: np.ndarray, offsets: np.ndarray, use_height: bool = True) -> np.ndarray:
+    """
+    Length in meters of each part of a packed set of polylines. With a
+    third coordinate and ``use_height``, segments are measured as the
+    hypotenuse of the geodesic distance and the height difference.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    lengths = np.zeros(len(offsets), dtype=np.float64)
+    if len(coords) < 2:
+        return lengths
+    starts, part = _segments(coords, offsets)
+    if len(starts) == 0:
+        return lengths
+    a, b = coords[starts], coords[starts + 1]
+    distances = vincenty_distance(a[:, 0], a[:, 1], b[:, 0], b[:, 1])
+    if use_height and coords.shape[1] > 2:
+        distances = np.hypot(distances, np.nan_to_num(b[:, 2] - a[:, 2]))
+    np.add.at(lengths, part, distances)
+    return lengths
+
+
+def authalic_latitude(lat: np.ndarray) -> np.ndarray:
+    """Authalic latitude (radians) of geodetic latitudes (radians)"""
+    sin_lat = np.sin(lat)
+    e_sin = _E * sin_lat
+    q = (1 - WGS84_E2) * (sin_lat / (1 - e_sin ** 2) + np.arctanh(e_sin) / _E)
+    return np.arcsin(np.clip(q / _Q_POLE, -1.0, 1.0))
+
+
+def ring_areas(coords: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """
+    Unsigned area in square meters of each ring of a packed set of rings.
+    Latitudes are mapped to authalic latitudes so the spherical excess on
+    the authalic sphere gives ellipsoidal areas; edges are integrated as
+    in the Chamberlain-Duquette formula, which is accurate for the short
+    edges of surveyed geometries. Rings may be open or closed and must
+    not be empty.
+    """
+    coords = np.asarray(coords, dtype=np.float64)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(coords) == 0:
+        return np.zeros(len(offsets))
+    lon = np.radians(coords[:, 0])
+    beta = authalic_latitude(np.radians(coords[:, 1]))
+
+    # Next vertex of each vertex, wrapping around within its ring
+    n = len(coords)
+    ends = np.append(offsets[1:], n)
+    nxt = np.arange(1, n + 1)
+    nxt[ends - 1] = offsets
+    dlon = lon[nxt] - lon
+    dlon = (dlon + np.pi) % (2 * np.pi) - np.pi  # Shortest way across the antimeridian
+    terms = dlon * (2 + np.sin(beta) + np.sin(beta[nxt]))
+    sums = np.add.reduceat(terms, offsets) if n else terms
+    return np.abs(sums) * AUTHALIC_RADIUS ** 2 / 2
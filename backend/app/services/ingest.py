@@ -0,0 +1,315 @@
+"""
+Layer ingestion pipeline.
+
+Uploads only store the file and call ``enqueue_ingest``; every processing
+stage runs later as a background job (see ``app.services.jobs``).
+"""
+import json
+import logging
+import os
+import time
+from typing import BinaryIO, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import settings
+from app.models.layer import LayerFormat, LayerType
+from app.services import blobs, jobs, pointcloud, raster, storage, thumbnails, vector
+from app.utils.crs import transform_bounds
+from app.utils.files import (
+    file_sha256, layer_artifacts_root, read_digest, write_compressed_variants, write_digest,
+)
+
+logger = logging.getLogger(__name__)
+
+
+# Formats imported into the layer_features table
+VECTOR_FORMATS = (LayerFormat.GEOJSON, LayerFormat.KML, LayerFormat.KMZ)
+
+# Text formats served precompressed by the file server
+COMPRESSIBLE_FORMATS = (LayerFormat.GEOJSON, LayerFormat.KML, LayerFormat.IFC)
+
+
+def stages_for(layer: models.Layer) -> List[str]:
+    """Job kinds to run, in order, after a layer file is uploaded"""
+    stages = ["layer_metadata"]
+    if layer.layer_type == LayerType.POINT_CLOUD and layer.format in (LayerFormat.LAS, LayerFormat.LAZ):
+        stages.append("pointcloud_octree")
+    if layer.format == LayerFormat.GEOTIFF:
+        stages.append("raster_cog")
+    if layer.format in VECTOR_FORMATS:
+        stages += ["vector_import", "vector_simplify"]
+    if layer.format in COMPRESSIBLE_FORMATS and storage.get_storage().local:
+        # Only /static serving from UPLOAD_DIR picks the variants
+        stages.append("static_variants")
+    if thumbnails.can_render(layer):
+        # Drawn from the processed data, so it runs last
+        stages.append("layer_thumbnail")
+    return stages
+
+
+def enqueue_ingest(
+    db: Session, layer: models.Layer, register_blob: bool = False, sha256: Optional[str] = None
+) -> None:
+    """
+    Queue the ingestion pipeline of a freshly stored layer. Files uploaded
+    directly to storage are registered as blobs first, checked against
+    the ``sha256`` announced by the client if any.
+    """
+    stages = stages_for(layer)
+    if register_blob:
+        stages.insert(0, "blob_register")
+    jobs.enqueue_pipeline(db, stages, layer_id=layer.id, payload={"sha256": sha256} if sha256 else None)
+    db.commit()
+
+
+def _las_metadata(source: BinaryIO) -> dict:
+    import laspy
+
+    with laspy.open(source) as reader:
+        header = reader.header
+        info = {
+            "point_count": int(header.point_count),
+            "point_format": header.point_format.id,
+            "las_version": str(header.version),
+            "scales": list(header.scales),
+            "offsets": list(header.offsets),
+            "native_bounds": [header.mins[0], header.mins[1], header.maxs[0], header.maxs[1]],
+            "z_range": [header.mins[2], header.maxs[2]],
+        }
+        try:
+            crs = header.parse_crs()  # Needs pyproj
+        except Exception:
+            crs = None
+    if crs is not None:
+        epsg = crs.to_epsg()
+        if epsg:
+            info["crs"] = f"EPSG:{epsg}"
+        else:
+            info["crs_wkt"] = crs.to_wkt()
+    return info
+
+
+def _raster_metadata(path: str) -> dict:
+    try:
+        import rasterio
+    except ImportError:
+        logger.warning("rasterio is not installed, skipping raster metadata")
+        return {}
+
+    with rasterio.open(path) as src:
+        info = {
+            "width": src.width,
+            "height": src.height,
+            "band_count": src.count,
+            "dtypes": list(src.dtypes),
+            "nodata": src.nodata,
+            "resolution": list(src.res),
+            "native_bounds": list(src.bounds),
+        }
+        if src.crs:
+            epsg = src.crs.to_epsg()
+            if epsg:
+                info["crs"] = f"EPSG:{epsg}"
+            else:
+                info["crs_wkt"] = src.crs.to_wkt()
+    return info
+
+
+@jobs.handler("layer_metadata")
+def extract_metadata(ctx: jobs.JobContext) -> dict:
+    """Fill size, CRS and bounding box of a layer from its file header"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+    store = storage.get_storage()
+    key = store.key_for(layer.file_path)
+    file_size = store.size(key)
+    if file_size is None:
+        raise FileNotFoundError(layer.file_path)
+
+    # Only the headers are read (ranged reads with object storage)
+    info = {"file_size": file_size}
+    if layer.format in (LayerFormat.LAS, LayerFormat.LAZ):
+        with store.open(key) as f:
+            info.update(_las_metadata(f))
+    elif layer.format == LayerFormat.GEOTIFF:
+        info.update(_raster_metadata(store.gdal_path(key)))
+
+    crs = info.get("crs")
+    native_bounds = info.get("native_bounds")
+    if crs:
+        layer.crs = crs
+    if native_bounds and crs:
+        # bbox is always stored in WGS84 so the viewers can zoom to it
+        layer.bbox = transform_bounds(native_bounds, crs)
+    layer.file_size = info["file_size"]
+    layer.layer_metadata = {**(layer.layer_metadata or {}), **info}
+    ctx.db.commit()
+    return info
+
+
+@jobs.handler("pointcloud_octree")
+def build_pointcloud_octree(ctx: jobs.JobContext) -> dict:
+    """Convert a LAS/LAZ layer into a level-of-detail octree"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+
+    out_dir = blobs.artifact_dir(layer, "octree")
+    blobs.lock_artifact(ctx.db, out_dir)
+    octree_file = os.path.join(out_dir, pointcloud.OCTREE_FILE)
+    if os.path.exists(octree_file):
+        # Built for another layer with the same content
+        with open(octree_file) as f:
+            info = json.load(f)
+    else:
+        info = pointcloud.build_octree(
+            storage.fetch(layer.file_path), out_dir, crs=layer.crs, progress=ctx.progress
+        )
+    layer.processed_path = out_dir
+    layer.layer_metadata = {
+        **(layer.layer_metadata or {}),
+        "octree": {"depth": info["depth"], "nodes": info["nodes"], "points": info["points"]},
+    }
+    ctx.db.commit()
+    return {"depth": info["depth"], "nodes": info["nodes"], "points": info["points"]}
+
+
+@jobs.handler("raster_cog")
+def build_raster_cog(ctx: jobs.JobContext) -> dict:
+    """Rewrite a GeoTIFF layer as a Cloud-Optimized GeoTIFF for tiling"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+
+    out_path = os.path.join(blobs.artifact_dir(layer, "cog"), "cog.tif")
+    blobs.lock_artifact(ctx.db, out_path)
+    if os.path.exists(out_path):
+        # Built for another layer with the same content
+        info = {"render": raster.raster_stats(out_path)}
+    else:
+        info = raster.convert_to_cog(storage.fetch(layer.file_path), out_path, progress=ctx.progress)
+    layer.processed_path = out_path
+    layer.layer_metadata = {**(layer.layer_metadata or {}), **info}
+    ctx.db.commit()
+    return info
+
+
+def _next_features_version(layer: models.Layer) -> int:
+    """
+    A features version newer than the layer's current one. Nanoseconds
+    so two re-imports in the same second differ, and never lower than
+    the previous version + 1 in case the clock steps back.
+    """
+    previous = (layer.layer_metadata or {}).get("features_version") or 0
+    return max(time.time_ns(), int(previous) + 1)
+
+
+@jobs.handler("vector_import")
+def import_vector_features(ctx: jobs.JobContext) -> dict:
+    """Load the features of a vector layer into PostGIS for MVT serving"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+
+    sibling = blobs.processed_sibling(ctx.db, layer)
+    if sibling is not None:
+        # Same content already imported: copy the rows instead of parsing
+        info = vector.copy_features(ctx.db, sibling.id, layer.id)
+        info["skipped"] = (sibling.layer_metadata or {}).get("skipped", 0)
+    else:
+        features = vector.iter_features(storage.fetch(layer.file_path), layer.format)
+        info = vector.import_features(
+            ctx.db, layer.id, features,
+            progress=lambda count: ctx.progress(0.5, f"{count} features imported"),
+        )
+    bbox = vector.layer_extent(ctx.db, layer.id)
+    if bbox:
+        layer.bbox = bbox
+    layer.crs = "EPSG:4326"
+    layer.layer_metadata = {
+        **(layer.layer_metadata or {}),
+        **info,
+        # Changes whenever features are re-imported; part of tile ETags
+        "features_version": _next_features_version(layer),
+    }
+    ctx.db.commit()
+    return info
+
+
+@jobs.handler("vector_simplify")
+def simplify_vector_features(ctx: jobs.JobContext) -> dict:
+    """Precompute zoom-dependent simplified geometries of a vector layer"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+
+    zooms = vector.SIMPLIFY_ZOOMS
+    info = vector.build_simplified_levels(
+        ctx.db, layer.id, zooms,
+        progress=lambda zoom: ctx.progress((zooms.index(zoom) + 1) / len(zooms), f"Zoom {zoom} simplified"),
+    )
+    layer.layer_metadata = {
+        **(layer.layer_metadata or {}),
+        "simplification": info,
+        # Tiles rendered before the levels existed must not be reused
+        "features_version": _next_features_version(layer),
+    }
+    ctx.db.commit()
+    return info
+
+
+@jobs.handler("static_variants")
+def build_static_variants(ctx: jobs.JobContext) -> dict:
+    """Precompress a text layer file so /static can serve br/gzip directly"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+
+    if read_digest(layer.file_path) is None:
+        # Files stored before digests existed
+        write_digest(layer.file_path, file_sha256(layer.file_path))
+    variants = write_compressed_variants(layer.file_path)
+    layer.layer_metadata = {**(layer.layer_metadata or {}), "compressed_variants": variants}
+    ctx.db.commit()
+    return variants
+
+
+@jobs.handler("layer_thumbnail")
+def build_thumbnail(ctx: jobs.JobContext) -> dict:
+    """Render the preview image of a processed layer, unless it is up to date"""
+    layer = ctx.layer
+    if layer is None:
+        return {}
+
+    size = settings.THUMBNAIL_SIZE
+    fingerprint = thumbnails.source_fingerprint(layer, size)
+    out_path = thumbnails.thumbnail_file(layer, fingerprint)
+    blobs.lock_artifact(ctx.db, out_path)
+    if not os.path.exists(out_path):
+        content = thumbnails.render(ctx.db, layer, size)
+        if content is None:
+            return {"fingerprint": fingerprint, "empty": True}
+
+        os.makedirs(os.path.dirname(out_path), exist_ok=True)
+        tmp_path = out_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, out_path)
+    elif layer.thumbnail_path == out_path:
+        ctx.db.rollback()
+        return {"fingerprint": fingerprint, "skipped": True}
+
+    previous = layer.thumbnail_path
+    layer.thumbnail_path = out_path
+    layer.layer_metadata = {**(layer.layer_metadata or {}), "thumbnail": fingerprint}
+    ctx.db.commit()
+    # Shared thumbnails may still be used by other layers of the same blob
+    if previous and previous != out_path and previous.startswith(layer_artifacts_root(layer.id) + os.sep):
+        try:
+            os.remove(previous)
+        except OSError:
+            pass
+    return {"fingerprint": fingerprint, "bytes": os.path.getsize(out_path)}
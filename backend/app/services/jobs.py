@@ -0,0 +1,303 @@
+"""
+Persistent background jobs.
+
+Jobs live in the ``jobs`` table and are claimed by a local pool of worker
+threads with ``SELECT ... FOR UPDATE SKIP LOCKED``, so several API
+processes (or a separate ``python -m app.worker``) can share the queue
+without an external broker.
+
+Handlers are registered per job kind::
+
+    @jobs.handler("layer_metadata")
+    def extract_metadata(ctx: jobs.JobContext) -> dict:
+        ...
+
+A job may carry a ``pipeline`` list in its payload: when it succeeds the
+next kind is enqueued for the same layer, so ingestion stages run in order.
+"""
+import logging
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core import metrics
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models.job import JobStatus
+
+logger = logging.getLogger(__name__)
+
+_handlers: Dict[str, Callable[["JobContext"], Optional[dict]]] = {}
+
+
+def handler(kind: str):
+    """Register a function as the handler for a job kind"""
+    def decorator(func):
+        _handlers[kind] = func
+        return func
+    return decorator
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class JobContext:
+    """What a handler gets: its job, a DB session and progress reporting"""
+
+    # Minimum seconds between progress writes
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, db: Session, job: models.Job):
+        self.db = db
+        self.job = job
+        self.job_id = job.id
+        self.payload = job.payload or {}
+        self._last_progress = 0.0
+
+    @property
+    def layer(self) -> Optional[models.Layer]:
+        if self.job.layer_id is None:
+            return None
+        return self.db.get(models.Layer, self.job.layer_id)
+
+    def progress(self, fraction: float, message: Optional[str] = None, force: bool = False) -> None:
+        """
+        Report progress (0..1). Written in its own transaction so it is
+        visible while the handler's work is still uncommitted.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_progress < self.PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        values = {"progress": max(0.0, min(1.0, fraction)), "heartbeat_at": _now()}
+        if message is not None:
+            values["message"] = message[:512]
+        db = SessionLocal()
+        try:
+            db.query(models.Job).filter(models.Job.id == self.job_id).update(values)
+            db.commit()
+        finally:
+            db.close()
+
+
+def enqueue(
+    db: Session,
+    kind: str,
+    layer_id: Optional[int] = None,
+    payload: Optional[dict] = None,
+    priority: int = 0,
+    pipeline: Optional[List[str]] = None,
+) -> models.Job:
+    """Add a job to the queue. The caller commits."""
+    payload = dict(payload or {})
+    if pipeline:
+        payload["pipeline"] = list(pipeline)
+    job = models.Job(
+        kind=kind,
+        layer_id=layer_id,
+        payload=payload,
+        priority=priority,
+        status=JobStatus.QUEUED,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    return job
+
+
+def enqueue_pipeline(
+    db: Session, kinds: List[str], layer_id: Optional[int] = None, payload: Optional[dict] = None
+) -> Optional[models.Job]:
+    """Enqueue the first stage of a pipeline; the rest follow on success"""
+    if not kinds:
+        return None
+    return enqueue(db, kinds[0], layer_id=layer_id, payload=payload, pipeline=kinds[1:])
+
+
+def claim_next(db: Session) -> Optional[models.Job]:
+    """
+    Claim the next runnable job, skipping rows locked by other workers.
+    Running jobs without a heartbeat for JOB_STALE_AFTER seconds are
+    considered abandoned (crashed worker) and claimed again, or failed
+    once they have used all their attempts.
+    """
+    while True:
+        now = _now()
+        stale = now - timedelta(seconds=settings.JOB_STALE_AFTER)
+        job = (
+            db.query(models.Job)
+            .filter(
+                or_(
+                    (models.Job.status == JobStatus.QUEUED) & (models.Job.run_after <= now),
+                    (models.Job.status == JobStatus.RUNNING) & (models.Job.heartbeat_at < stale),
+                )
+            )
+            .order_by(models.Job.priority, models.Job.run_after, models.Job.id)
+            .with_for_update(skip_locked=True)
+            .first()
+        )
+        if not job:
+            db.rollback()
+            return None
+        if job.status == JobStatus.RUNNING and job.attempts >= job.max_attempts:
+            # Its worker died on every attempt: don't retry forever
+            job.status = JobStatus.FAILED
+            job.error = "Worker stopped responding"
+            job.finished_at = now
+            db.commit()
+            continue
+        job.status = JobStatus.RUNNING
+        job.attempts += 1
+        job.started_at = now
+        job.heartbeat_at = now
+        job.finished_at = None
+        job.error = None
+        db.commit()
+        return job
+
+
+class _Heartbeat:
+    """
+    Keeps ``heartbeat_at`` of a running job fresh from a timer thread, so
+    long steps that never report progress (a COG write, one big SQL
+    statement) are not mistaken for a crashed worker.
+    """
+
+    def __init__(self, job_id: int):
+        self.job_id = job_id
+        self.interval = max(settings.JOB_STALE_AFTER / 4, 1.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self) -> "_Heartbeat":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            db = SessionLocal()
+            try:
+                db.query(models.Job).filter(
+                    models.Job.id == self.job_id, models.Job.status == JobStatus.RUNNING
+                ).update({"heartbeat_at": _now()})
+                db.commit()
+            except Exception:
+                logger.exception("Heartbeat of job %s failed", self.job_id)
+            finally:
+                db.close()
+
+
+def run_job(db: Session, job: models.Job) -> None:
+    """Run a claimed job and record its outcome"""
+    job_id, kind = job.id, job.kind
+    func = _handlers.get(kind)
+    ctx = JobContext(db, job)
+    start = time.perf_counter()
+    try:
+        if func is None:
+            raise RuntimeError(f"No handler registered for job kind '{kind}'")
+        with _Heartbeat(job_id):
+            result = func(ctx)
+    except Exception as e:
+        metrics.observe_job(kind, "failed", time.perf_counter() - start)
+        db.rollback()
+        logger.exception("Job %s (%s) failed", job_id, kind)
+        _record_failure(db, job_id, e)
+        return
+    metrics.observe_job(kind, "succeeded", time.perf_counter() - start)
+
+    job = db.get(models.Job, job_id)
+    if job is None:  # Layer (and its jobs) deleted meanwhile
+        db.commit()
+        return
+    job.status = JobStatus.SUCCEEDED
+    job.progress = 1.0
+    job.result = _jsonable(result)
+    job.finished_at = _now()
+    pipeline = (job.payload or {}).get("pipeline") or []
+    if pipeline and job.layer_id is not None:
+        payload = {k: v for k, v in job.payload.items() if k != "pipeline"}
+        enqueue_pipeline(db, pipeline, layer_id=job.layer_id, payload=payload)
+    db.commit()
+
+
+def _record_failure(db: Session, job_id: int, error: Exception) -> None:
+    job = db.get(models.Job, job_id)
+    if job is None:
+        return
+    job.error = "".join(traceback.format_exception_only(type(error), error)).strip()
+    job.finished_at = _now()
+    if job.attempts < job.max_attempts:
+        # Exponential backoff before the next attempt
+        delay = settings.JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+        job.status = JobStatus.QUEUED
+        job.run_after = _now() + timedelta(seconds=delay)
+    else:
+        job.status = JobStatus.FAILED
+    db.commit()
+
+
+def _jsonable(value: Any) -> Any:
+    """Make sure a handler result can be stored in a JSON column"""
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "tolist"):  # NumPy scalars and arrays
+        return value.tolist()
+    return value
+
+
+def work_once() -> bool:
+    """Claim and run one job. Returns False if the queue was empty."""
+    db = SessionLocal()
+    try:
+        job = claim_next(db)
+        if job is None:
+            return False
+        run_job(db, job)
+        return True
+    finally:
+        db.close()
+
+
+class WorkerPool:
+    """Fixed-size pool of threads polling the job queue"""
+
+    def __init__(self, size: int, poll_interval: float):
+        self.size = size
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> None:
+        for i in range(self.size):
+            thread = threading.Thread(target=self._loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                busy = work_once()
+            except Exception:
+                logger.exception("Job worker error")
+                busy = False
+            if not busy:
+                self._stop.wait(self.poll_interval)
@@ -0,0 +1,362 @@
+"""
+Server-side measurement values.
+
+Lengths, perimeters and areas are computed from the GeoJSON geometry
+(WGS84 lon/lat, optional height) with ``app.services.geodesy``. Batches
+are evaluated together: the parts of all geometries are packed into one
+coordinate array, measured in a single vectorized call and summed back
+per geometry.
+
+Bulk writes and GeoJSON reads go through PostGIS directly: geometries
+travel as GeoJSON text and no geometry objects are built in Python.
+"""
+import enum
+import io
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import Select, Text, bindparam, case, cast, func, insert, literal_column, select, text, update
+from sqlalchemy.dialects.postgresql import JSON
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models.measurement import MeasurementType, MeasurementUnit
+from app.services import geodesy
+from app.services.vector import is_valid_geometry
+
+# Factor from the base unit (m, m², m³) of each family
+LINEAR_UNITS = {MeasurementUnit.METERS: 1.0, MeasurementUnit.KILOMETERS: 1000.0}
+AREA_UNITS = {MeasurementUnit.SQUARE_METERS: 1.0, MeasurementUnit.HECTARES: 10000.0}
+VOLUME_UNITS = {MeasurementUnit.CUBIC_METERS: 1.0}
+
+UNITS_BY_TYPE = {
+    MeasurementType.DISTANCE: LINEAR_UNITS,
+    MeasurementType.PERIMETER: LINEAR_UNITS,
+    MeasurementType.ELEVATION_PROFILE: LINEAR_UNITS,
+    MeasurementType.AREA: AREA_UNITS,
+    MeasurementType.VOLUME: VOLUME_UNITS,
+}
+DEFAULT_UNITS = {
+    MeasurementType.DISTANCE: MeasurementUnit.METERS,
+    MeasurementType.PERIMETER: MeasurementUnit.METERS,
+    MeasurementType.ELEVATION_PROFILE: MeasurementUnit.METERS,
+    MeasurementType.AREA: MeasurementUnit.SQUARE_METERS,
+    MeasurementType.VOLUME: MeasurementUnit.CUBIC_METERS,
+}
+
+# Types whose value follows from the geometry alone
+COMPUTED_TYPES = (MeasurementType.DISTANCE, MeasurementType.PERIMETER, MeasurementType.AREA)
+
+GEOMETRY_TYPES = {
+    MeasurementType.DISTANCE: ("LineString", "MultiLineString"),
+    MeasurementType.PERIMETER: ("Polygon", "MultiPolygon"),
+    MeasurementType.AREA: ("Polygon", "MultiPolygon"),
+}
+
+
+class MeasurementError(ValueError):
+    pass
+
+
+def resolve_unit(measurement_type: MeasurementType, unit: Optional[MeasurementUnit]) -> MeasurementUnit:
+    """Unit to report a measurement in, checking it fits the type"""
+    if unit is None:
+        return DEFAULT_UNITS[measurement_type]
+    if unit not in UNITS_BY_TYPE[measurement_type]:
+        raise MeasurementError(f"Unit {unit.value} is not valid for {measurement_type.value}")
+    return unit
+
+
+def _positions(part: Sequence[Sequence[float]]) -> np.ndarray:
+    """(k, 3) array of lon, lat, height (NaN when missing)"""
+    try:
+        array = np.asarray(part, dtype=np.float64)
+    except ValueError:
+        # Mixed 2D/3D positions
+        array = np.array([list(p[:3]) + [np.nan] * (3 - len(p[:3])) for p in part], dtype=np.float64)
+    if array.shape[1] == 2:
+        array = np.column_stack([array, np.full(len(array), np.nan)])
+    return array[:, :3]
+
+
+def _parts(geometry: Dict[str, Any], measurement_type: MeasurementType) -> List[Tuple[list, float]]:
+    """Lines or rings to measure, with +1/-1 for polygon shells/holes"""
+    kind = geometry["type"]
+    coords = geometry["coordinates"]
+    if kind == "LineString":
+        return [(coords, 1.0)]
+    if kind == "MultiLineString":
+        return [(line, 1.0) for line in coords]
+    polygons = [coords] if kind == "Polygon" else coords
+    parts = []
+    for rings in polygons:
+        for i, ring in enumerate(rings):
+            sign = 1.0 if i == 0 or measurement_type == MeasurementType.PERIMETER else -1.0
+            parts.append((ring, sign))
+    return parts
+
+
+def compute_values(
+    items: Sequence[Tuple[Dict[str, Any], MeasurementType, Optional[MeasurementUnit]]]
+) -> List[Dict[str, Any]]:
+    """
+    Evaluate (geometry, type, unit) items. Returns one result per item,
+    ``{"value", "unit"}`` or ``{"error"}``; a bad item never fails the
+    others.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    line_parts, line_owner = [], []
+    ring_parts, ring_owner, ring_sign = [], [], []
+    units: List[Optional[MeasurementUnit]] = [None] * len(items)
+
+    for index, (geometry, measurement_type, unit) in enumerate(items):
+        try:
+            units[index] = resolve_unit(measurement_type, unit)
+            if measurement_type not in COMPUTED_TYPES:
+                raise MeasurementError(f"{measurement_type.value} can't be computed from a geometry")
+            if not is_valid_geometry(geometry):
+                raise MeasurementError("Invalid geometry")
+            if geometry["type"] not in GEOMETRY_TYPES[measurement_type]:
+                raise MeasurementError(
+                    f"{measurement_type.value} needs a {' or '.join(GEOMETRY_TYPES[measurement_type])}"
+                )
+            for part, sign in _parts(geometry, measurement_type):
+                if measurement_type == MeasurementType.AREA:
+                    ring_parts.append(_positions(part))
+                    ring_owner.append(index)
+                    ring_sign.append(sign)
+                else:
+                    line_parts.append(_positions(part))
+                    line_owner.append(index)
+        except MeasurementError as e:
+            results[index] = {"error": str(e)}
+
+    totals = np.zeros(len(items), dtype=np.float64)
+    if line_parts:
+        offsets = np.cumsum([0] + [len(p) for p in line_parts[:-1]])
+        lengths = geodesy.path_lengths(np.concatenate(line_parts), offsets)
+        np.add.at(totals, np.asarray(line_owner), lengths)
+    if ring_parts:
+        offsets = np.cumsum([0] + [len(p) for p in ring_parts[:-1]])
+        areas = geodesy.ring_areas(np.concatenate(ring_parts)[:, :2], offsets)
+        np.add.at(totals, np.asarray(ring_owner), areas * np.asarray(ring_sign))
+
+    for index, result in enumerate(results):
+        if "error" in result:
+            continue
+        unit = units[index]
+        factor = UNITS_BY_TYPE[items[index][1]][unit]
+        results[index] = {"value": float(totals[index]) / factor, "unit": unit}
+    return results
+
+
+def compute_value(
+    geometry: Dict[str, Any], measurement_type: MeasurementType, unit: Optional[MeasurementUnit] = None
+) -> Tuple[float, MeasurementUnit]:
+    """Value and unit of one measurement; raises MeasurementError"""
+    result = compute_values([(geometry, measurement_type, unit)])[0]
+    if "error" in result:
+        raise MeasurementError(result["error"])
+    return result["value"], result["unit"]
+
+
+def resolve_values(items: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Value and unit to store for measurement inputs (objects with
+    ``geometry``, ``measurement_type``, ``unit`` and ``value``). Computed
+    types ignore the client value and are evaluated in one batch; the
+    others keep the client value. Returns ``{"value", "unit"}`` or
+    ``{"error"}`` per item.
+    """
+    results: List[Dict[str, Any]] = [{} for _ in items]
+    computed = [i for i, item in enumerate(items) if item.measurement_type in COMPUTED_TYPES]
+    values = compute_values([(items[i].geometry, items[i].measurement_type, items[i].unit) for i in computed])
+    for index, result in zip(computed, values):
+        results[index] = result
+    for index, item in enumerate(items):
+        if item.measurement_type in COMPUTED_TYPES:
+            continue
+        try:
+            if item.value is None:
+                raise MeasurementError("value is required for this measurement type")
+            results[index] = {"value": item.value, "unit": resolve_unit(item.measurement_type, item.unit)}
+        except MeasurementError as e:
+            results[index] = {"error": str(e)}
+    return results
+
+
+# Bulk writes. Rows are dicts of measurement columns with ``geometry`` as
+# GeoJSON text; PostGIS parses it, so no geometry objects are built here.
+COPY_THRESHOLD = 5000
+COPY_COLUMNS = ("id", "project_id", "name", "measurement_type", "value", "unit", "data", "notes", "created_by")
+
+
+def _geometry_expression(param: str = "geometry"):
+    return func.ST_Force2D(func.ST_SetSRID(func.ST_GeomFromGeoJSON(bindparam(param)), 4326))
+
+
+def _insert_statement():
+    table = models.Measurement.__table__
+    return (
+        insert(table)
+        .values(
+            project_id=bindparam("project_id"),
+            name=bindparam("name"),
+            measurement_type=bindparam("measurement_type", type_=table.c.measurement_type.type),
+            value=bindparam("value"),
+            unit=bindparam("unit", type_=table.c.unit.type),
+            data=bindparam("data", type_=table.c.data.type),
+            notes=bindparam("notes"),
+            created_by=bindparam("created_by"),
+            geometry=_geometry_expression(),
+        )
+        .returning(table.c.id, sort_by_parameter_order=True)
+    )
+
+
+def insert_measurements(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    Insert rows in the caller's transaction and return their ids in row
+    order. Sent as multi-row INSERT ... RETURNING statements, or through
+    COPY for batches of COPY_THRESHOLD rows or more.
+    """
+    if not rows:
+        return []
+    if len(rows) >= COPY_THRESHOLD:
+        return _copy_measurements(db, rows)
+    return list(db.execute(_insert_statement(), rows).scalars())
+
+
+def _copy_value(value: Any) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, enum.Enum):
+        value = value.name  # SQLAlchemy stores enum names
+    elif isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def _copy_measurements(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+    """
+    COPY rows into a temporary table and move them with one INSERT ...
+    SELECT. Ids are taken from the sequence beforehand, so they are known
+    without RETURNING.
+    """
+    ids = list(db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('measurements', 'id')) FROM generate_series(1, :n)"),
+        {"n": len(rows)},
+    ).scalars())
+    db.execute(text(
+        "CREATE TEMP TABLE measurement_import "
+        "(LIKE measurements INCLUDING DEFAULTS, geojson text) ON COMMIT DROP"
+    ))
+    db.execute(text("ALTER TABLE measurement_import DROP COLUMN geometry"))
+
+    buffer = io.StringIO()
+    for id_, row in zip(ids, rows):
+        values = [id_] + [row.get(column) for column in COPY_COLUMNS[1:]] + [row["geometry"]]
+        buffer.write("\t".join(_copy_value(v) for v in values) + "\n")
+    buffer.seek(0)
+    dbapi_connection = db.connection().connection.dbapi_connection
+    if hasattr(dbapi_connection, "run_async"):
+        # asyncpg (API sessions, see AsyncSession.run_sync): same text format
+        data = io.BytesIO(buffer.getvalue().encode())
+        dbapi_connection.run_async(lambda conn: conn.copy_to_table(
+            "measurement_import", source=data, columns=[*COPY_COLUMNS, "geojson"], format="text"
+        ))
+    else:
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY measurement_import ({', '.join(COPY_COLUMNS)}, geojson) FROM STDIN", buffer
+            )
+        finally:
+            cursor.close()
+
+    columns = ", ".join(COPY_COLUMNS)
+    db.execute(text(
+        f"INSERT INTO measurements ({columns}, geometry) "
+        f"SELECT {columns}, ST_Force2D(ST_SetSRID(ST_GeomFromGeoJSON(geojson), 4326)) "
+        "FROM measurement_import"
+    ))
+    db.execute(text("DROP TABLE measurement_import"))
+    return ids
+
+
+def update_measurements(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """
+    Update rows by id (``_id``) in one executemany. ``geometry`` may be
+    None to keep the stored geometry.
+    """
+    if not rows:
+        return
+    table = models.Measurement.__table__
+    statement = (
+        update(table)
+        .where(table.c.id == bindparam("_id"))
+        .values(
+            name=bindparam("name"),
+            value=bindparam("value"),
+            unit=bindparam("unit", type_=table.c.unit.type),
+            data=bindparam("data", type_=table.c.data.type),
+            notes=bindparam("notes"),
+            geometry=func.coalesce(_geometry_expression(), table.c.geometry),
+        )
+    )
+    db.execute(statement, rows)
+
+
+def load_measurements(db: Session, project_id: int, ids: Sequence[int]) -> Dict[int, Dict[str, Any]]:
+    """Current state of measurements (geometry as GeoJSON) keyed by id"""
+    table = models.Measurement.__table__
+    result = db.execute(
+        select(
+            table.c.id, table.c.name, table.c.measurement_type, table.c.value, table.c.unit,
+            table.c.data, table.c.notes, func.ST_AsGeoJSON(table.c.geometry).label("geometry"),
+        ).where(table.c.project_id == project_id, table.c.id.in_(list(ids)))
+    )
+    rows = {}
+    for row in result.mappings():
+        row = dict(row)
+        row["geometry"] = json.loads(row["geometry"]) if row["geometry"] else None
+        rows[row["id"]] = row
+    return rows
+
+
+# GeoJSON reads. Each row is one Feature serialized by Postgres (text), in
+# the shape of schemas.measurement.Measurement; enums are stored by name
+# and mapped back to their API values.
+def _json_object(**pairs) -> Any:
+    args = []
+    for key, value in pairs.items():
+        args += [literal_column(f"'{key}'"), value]
+    return func.json_build_object(*args)
+
+
+def _enum_values(column, enum_cls) -> Any:
+    return case({member.name: member.value for member in enum_cls}, value=cast(column, Text))
+
+
+def feature_query(project_id: int, precision: int = 7) -> Select:
+    """Features of a project's measurements as GeoJSON text, one per row"""
+    table = models.Measurement.__table__
+    feature = _json_object(
+        type=literal_column("'Feature'"),
+        id=table.c.id,
+        geometry=cast(func.ST_AsGeoJSON(table.c.geometry, precision), JSON),
+        properties=_json_object(
+            id=table.c.id,
+            project_id=table.c.project_id,
+            name=table.c.name,
+            measurement_type=_enum_values(table.c.measurement_type, MeasurementType),
+            value=table.c.value,
+            unit=_enum_values(table.c.unit, MeasurementUnit),
+            data=table.c.data,
+            notes=table.c.notes,
+            created_by=table.c.created_by,
+            created_at=table.c.created_at,
+        ),
+    )
+    return select(cast(feature, Text)).where(table.c.project_id == project_id)
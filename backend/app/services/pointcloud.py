@@ -0,0 +1,340 @@
+"""
+Point-cloud level-of-detail octree.
+
+LAS/LAZ files are converted into an EPT-like octree: every node is a flat
+binary file of fixed-size little-endian records (``POINT_DTYPE``) named
+``L-X-Y-Z.bin``, plus a ``hierarchy.json`` index with the point count of
+each node and an ``octree.json`` with bounds, scale and offset.
+
+The file is read with laspy's chunked reader, so memory stays bounded by
+the chunk size whatever the number of points. Each point is assigned to
+a level at random with probability proportional to the number of nodes in
+that level (8^L), which gives every node roughly the same number of points
+for an even density, and to the node containing it at that level. Coarse
+levels are therefore uniform subsamples of the whole cloud.
+"""
+import json
+import math
+import os
+import shutil
+import struct
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+from numpy.lib.recfunctions import repack_fields
+
+# One point as stored in node files. Positions are the raw LAS integers,
+# real coordinates are X * scale + offset.
+POINT_DTYPE = np.dtype([
+    ("x", "<i4"),
+    ("y", "<i4"),
+    ("z", "<i4"),
+    ("intensity", "<u2"),
+    ("classification", "u1"),
+])
+
+POINTS_PER_NODE = 100_000  # Target average per node
+READ_CHUNK = 1_000_000  # Points read from the LAS file at a time
+MAX_DEPTH = 12
+
+OCTREE_FILE = "octree.json"
+HIERARCHY_FILE = "hierarchy.json"
+NODES_DIR = "nodes"
+
+# Node codes pack (level, x, y, z) into one int64 so a chunk can be
+# grouped by node with a single sort
+_AXIS_BITS = 16
+
+
+def octree_depth(point_count: int) -> int:
+    """Depth so that leaf nodes hold about POINTS_PER_NODE points"""
+    if point_count <= POINTS_PER_NODE:
+        return 0
+    return min(MAX_DEPTH, math.ceil(math.log(point_count / POINTS_PER_NODE, 8)))
+
+
+def node_key(level: int, x: int, y: int, z: int) -> str:
+    return f"{level}-{x}-{y}-{z}"
+
+
+def parse_node_key(key: str) -> Tuple[int, int, int, int]:
+    level, x, y, z = (int(v) for v in key.split("-"))
+    return level, x, y, z
+
+
+def _encode(level: np.ndarray, ix: np.ndarray, iy: np.ndarray, iz: np.ndarray) -> np.ndarray:
+    return (
+        (level.astype(np.int64) << (3 * _AXIS_BITS))
+        | (ix.astype(np.int64) << (2 * _AXIS_BITS))
+        | (iy.astype(np.int64) << _AXIS_BITS)
+        | iz.astype(np.int64)
+    )
+
+
+def _decode(code: int) -> Tuple[int, int, int, int]:
+    mask = (1 << _AXIS_BITS) - 1
+    return (
+        code >> (3 * _AXIS_BITS),
+        (code >> (2 * _AXIS_BITS)) & mask,
+        (code >> _AXIS_BITS) & mask,
+        code & mask,
+    )
+
+
+def build_octree(
+    src_path: str,
+    out_dir: str,
+    crs: Optional[str] = None,
+    progress: Optional[Callable[[float, str], None]] = None,
+    seed: int = 0,
+) -> dict:
+    """
+    Build the octree of a LAS/LAZ file into ``out_dir``. The tree is
+    written to a temporary directory and moved in place at the end, so a
+    failed run never leaves a half-built octree behind.
+    Returns the octree description (contents of octree.json).
+    """
+    import laspy
+
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, NODES_DIR))
+
+    with laspy.open(src_path) as reader:
+        header = reader.header
+        total = int(header.point_count)
+        scale = np.asarray(header.scales, dtype=np.float64)
+        offset = np.asarray(header.offsets, dtype=np.float64)
+        mins = np.asarray(header.mins, dtype=np.float64)
+        maxs = np.asarray(header.maxs, dtype=np.float64)
+
+        # Cubic root node so children are cubes too
+        size = float(max(maxs - mins)) or 1.0
+        cube_min = mins
+        depth = octree_depth(total)
+        weights = 8.0 ** np.arange(depth + 1)
+        level_cdf = np.cumsum(weights) / weights.sum()
+
+        rng = np.random.default_rng(seed)
+        counts: Dict[int, int] = {}
+        done = 0
+        for chunk in reader.chunk_iterator(READ_CHUNK):
+            n = len(chunk)
+            if n == 0:
+                continue
+            records = np.empty(n, dtype=POINT_DTYPE)
+            records["x"] = chunk.X
+            records["y"] = chunk.Y
+            records["z"] = chunk.Z
+            records["intensity"] = chunk.intensity
+            records["classification"] = chunk.classification
+
+            level = np.minimum(np.searchsorted(level_cdf, rng.random(n), side="right"), depth)
+            cells = np.left_shift(1, level)
+            index = []
+            for axis, name in enumerate(("x", "y", "z")):
+                coord = records[name] * scale[axis] + offset[axis]
+                norm = (coord - cube_min[axis]) / size
+                index.append(np.clip((norm * cells).astype(np.int64), 0, cells - 1))
+            codes = _encode(level, *index)
+
+            order = np.argsort(codes, kind="stable")
+            codes = codes[order]
+            records = records[order]
+            unique, starts = np.unique(codes, return_index=True)
+            ends = np.append(starts[1:], n)
+            for code, start, end in zip(unique.tolist(), starts.tolist(), ends.tolist()):
+                key = node_key(*_decode(code))
+                with open(os.path.join(tmp_dir, NODES_DIR, f"{key}.bin"), "ab") as f:
+                    f.write(records[start:end].tobytes())
+                counts[code] = counts.get(code, 0) + (end - start)
+
+            done += n
+            if progress:
+                progress(done / max(total, 1), f"{done}/{total} points")
+
+    hierarchy = {node_key(*_decode(code)): count for code, count in sorted(counts.items())}
+    info = {
+        "version": 1,
+        "points": done,
+        "depth": depth,
+        "bounds": [*cube_min.tolist(), *(cube_min + size).tolist()],
+        "data_bounds": [*mins.tolist(), *maxs.tolist()],
+        "scale": scale.tolist(),
+        "offset": offset.tolist(),
+        "crs": crs,
+        "point_size": POINT_DTYPE.itemsize,
+        "fields": [[name, POINT_DTYPE[name].str] for name in POINT_DTYPE.names],
+        "nodes": len(hierarchy),
+    }
+    with open(os.path.join(tmp_dir, HIERARCHY_FILE), "w") as f:
+        json.dump(hierarchy, f)
+    with open(os.path.join(tmp_dir, OCTREE_FILE), "w") as f:
+        json.dump(info, f)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.makedirs(os.path.dirname(out_dir), exist_ok=True)
+    os.replace(tmp_dir, out_dir)
+    return info
+
+
+class Octree:
+    """Read access to a built octree"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, OCTREE_FILE)) as f:
+            self.info = json.load(f)
+        with open(os.path.join(path, HIERARCHY_FILE)) as f:
+            self.hierarchy: Dict[str, int] = json.load(f)
+        self.scale = np.asarray(self.info["scale"], dtype=np.float64)
+        self.offset = np.asarray(self.info["offset"], dtype=np.float64)
+        self.depth = int(self.info["depth"])
+        self._ordered = sorted(self.hierarchy, key=parse_node_key)
+
+    def node_bounds(self, key: str) -> List[float]:
+        """[minx, miny, minz, maxx, maxy, maxz] of a node in real coordinates"""
+        level, x, y, z = parse_node_key(key)
+        bounds = self.info["bounds"]
+        size = (bounds[3] - bounds[0]) / (1 << level)
+        minx = bounds[0] + x * size
+        miny = bounds[1] + y * size
+        minz = bounds[2] + z * size
+        return [minx, miny, minz, minx + size, miny + size, minz + size]
+
+    def node_points(self, key: str) -> np.ndarray:
+        """Memory-mapped records of a node (read only, no copy)"""
+        path = os.path.join(self.path, NODES_DIR, f"{key}.bin")
+        if self.hierarchy.get(key, 0) == 0:
+            return np.empty(0, dtype=POINT_DTYPE)
+        return np.memmap(path, dtype=POINT_DTYPE, mode="r")
+
+    def iter_nodes(self, max_level: Optional[int] = None) -> Iterator[str]:
+        """Node keys ordered by level, coarse first"""
+        for key in self._ordered:
+            if max_level is None or parse_node_key(key)[0] <= max_level:
+                yield key
+
+
+# Binary response of point queries:
+#   magic "GVPC", uint16 version, uint16 attribute flags, uint32 point count,
+#   uint16 record size, uint16 reserved, float64 scale[3], float64 offset[3]
+# followed by `count` packed records of int32 x, y, z and, when flagged,
+# uint16 intensity and uint8 classification (all little-endian).
+# Real coordinates are x * scale + offset.
+RESPONSE_HEADER = "<4sHHIHH3d3d"
+RESPONSE_MAGIC = b"GVPC"
+RESPONSE_VERSION = 1
+FLAG_INTENSITY = 1
+FLAG_CLASSIFICATION = 2
+OPTIONAL_FIELDS = (("intensity", FLAG_INTENSITY), ("classification", FLAG_CLASSIFICATION))
+
+
+@lru_cache(maxsize=32)
+def _load_octree(path: str, mtime: float) -> Octree:
+    return Octree(path)
+
+
+def load_octree(path: str) -> Octree:
+    """Octree reader, cached until octree.json changes"""
+    return _load_octree(path, os.path.getmtime(os.path.join(path, OCTREE_FILE)))
+
+
+def _intersects(a: List[float], bbox: List[float]) -> bool:
+    return a[0] <= bbox[2] and a[3] >= bbox[0] and a[1] <= bbox[3] and a[4] >= bbox[1]
+
+
+def _contains(bbox: List[float], a: List[float]) -> bool:
+    return bbox[0] <= a[0] and a[3] <= bbox[2] and bbox[1] <= a[1] and a[4] <= bbox[3]
+
+
+def _even_sample(points: np.ndarray, count: int) -> np.ndarray:
+    """``count`` records spread evenly over a node"""
+    if count >= len(points):
+        return points
+    if count <= 0:
+        return points[:0]
+    return points[(np.arange(count) * len(points)) // count]
+
+
+def select_points(
+    octree: Octree,
+    bbox: Optional[List[float]] = None,
+    max_points: int = 1_000_000,
+    lod: Optional[int] = None,
+) -> List[np.ndarray]:
+    """
+    Pick the points of nodes up to level ``lod`` inside a 2D ``bbox``
+    (native coordinates), coarse levels first. Levels are taken whole
+    while they fit in ``max_points``; the first one that does not is
+    subsampled by the same fraction in every node, so density stays
+    uniform across the bbox. Returns memory-mapped views where a node is
+    fully used.
+    """
+    selected: List[np.ndarray] = []
+    remaining = max_points
+    level_nodes: List[np.ndarray] = []
+    current_level = None
+
+    def flush() -> bool:
+        """Add the pending level; False once the budget is used up"""
+        nonlocal remaining
+        total = sum(len(points) for points in level_nodes)
+        if total <= remaining:
+            selected.extend(level_nodes)
+            remaining -= total
+            return remaining > 0
+        fraction = remaining / total
+        for points in level_nodes:
+            sample = _even_sample(points, int(len(points) * fraction))
+            if len(sample):
+                selected.append(sample)
+        remaining = 0
+        return False
+
+    for key in octree.iter_nodes(lod):
+        level = parse_node_key(key)[0]
+        if level != current_level:
+            if level_nodes and not flush():
+                return selected
+            level_nodes = []
+            current_level = level
+        bounds = octree.node_bounds(key)
+        if bbox is not None and not _intersects(bounds, bbox):
+            continue
+        points = octree.node_points(key)
+        if bbox is not None and not _contains(bbox, bounds):
+            x = points["x"] * octree.scale[0] + octree.offset[0]
+            y = points["y"] * octree.scale[1] + octree.offset[1]
+            points = points[(x >= bbox[0]) & (x <= bbox[2]) & (y >= bbox[1]) & (y <= bbox[3])]
+        if len(points):
+            level_nodes.append(points)
+    if level_nodes and remaining > 0:
+        flush()
+    return selected
+
+
+def encode_points(
+    octree: Octree,
+    selected: List[np.ndarray],
+    intensity: bool = True,
+    classification: bool = True,
+    block_points: int = 65536,
+) -> Iterator[bytes]:
+    """Stream the header and packed records of the selected points"""
+    flags = (FLAG_INTENSITY if intensity else 0) | (FLAG_CLASSIFICATION if classification else 0)
+    fields = ["x", "y", "z"] + [name for name, flag in OPTIONAL_FIELDS if flags & flag]
+    dtype = np.dtype([(name, POINT_DTYPE[name]) for name in fields])
+    count = sum(len(points) for points in selected)
+
+    yield struct.pack(
+        RESPONSE_HEADER, RESPONSE_MAGIC, RESPONSE_VERSION, flags, count, dtype.itemsize, 0,
+        *octree.scale.tolist(), *octree.offset.tolist(),
+    )
+    for points in selected:
+        for start in range(0, len(points), block_points):
+            block = points[start:start + block_points]
+            if dtype != POINT_DTYPE:
+                block = repack_fields(block[fields])
+            yield block.tobytes()
@@ -0,0 +1,212 @@
+"""
+Elevation profiles along a line.
+
+The line (WGS84) is projected to the surface's CRS and densified into
+evenly spaced samples (ellipsoidal spacing for geographic CRSs). Then:
+
+- DEMs: samples are grouped by the raster block they fall in and each
+  block is read once with a single window read, instead of one read per
+  sample; values are interpolated bilinearly, NaN where a neighbour pixel
+  is nodata.
+- point clouds: consecutive samples on the same line segment are handled
+  as runs; the octree nodes around a run are read once and every point is
+  assigned to its nearest sample along the run, keeping the closest point
+  of each sample within the search radius.
+
+Profiles are stored compactly: the samples are implied by the line and
+the spacing, so only the elevations (rounded) are kept.
+"""
+import math
+import sys
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services import geodesy, pointcloud
+from app.utils.crs import crs_units, transform_coords
+
+ELEVATION_DECIMALS = 2
+
+# Samples handled together when reading point-cloud nodes
+POINTCLOUD_RUN = 512
+
+# Meters per degree of latitude, to express search radii in geographic CRSs
+METERS_PER_DEGREE = 111320.0
+
+
+class ProfileError(ValueError):
+    pass
+
+
+def densify(geometry: Dict[str, Any], crs: str, samples: int) -> Dict[str, Any]:
+    """
+    Evenly spaced positions along a GeoJSON LineString, in ``crs``.
+    Returns x, y, the line segment of each sample, the length and the
+    spacing in meters.
+    """
+    if geometry.get("type") != "LineString":
+        raise ProfileError("A LineString is required")
+    coords = np.asarray([p[:2] for p in geometry["coordinates"]], dtype=np.float64)
+    x, y = transform_coords(coords[:, 0], coords[:, 1], "EPSG:4326", crs)
+    geographic, unit_factor = crs_units(crs)
+    if geographic:
+        lengths = geodesy.vincenty_distance(x[:-1], y[:-1], x[1:], y[1:])
+    else:
+        lengths = np.hypot(np.diff(x), np.diff(y)) * unit_factor
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    total = float(cumulative[-1])
+    if total <= 0:
+        raise ProfileError("The line has no length")
+
+    distances = np.linspace(0.0, total, samples)
+    segment = np.clip(np.searchsorted(cumulative, distances, side="right") - 1, 0, len(lengths) - 1)
+    fraction = (distances - cumulative[segment]) / np.where(lengths[segment] > 0, lengths[segment], 1.0)
+    return {
+        "x": x[segment] + fraction * (x[segment + 1] - x[segment]),
+        "y": y[segment] + fraction * (y[segment + 1] - y[segment]),
+        "segment": segment,
+        "length": total,
+        "spacing": total / (samples - 1),
+        "geographic": geographic,
+        "unit_factor": unit_factor,
+    }
+
+
+def sample_raster(path: str, x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """Bilinear DEM values at positions, with one window read per block"""
+    import rasterio
+    from rasterio.windows import Window
+
+    values = np.full(len(x), np.nan)
+    with rasterio.open(path) as src:
+        cols, rows = ~src.transform * (x, y)
+        # Pixel centers at integer positions
+        cols = np.asarray(cols) - 0.5
+        rows = np.asarray(rows) - 0.5
+        c0 = np.floor(cols).astype(np.int64)
+        r0 = np.floor(rows).astype(np.int64)
+        inside = (c0 >= -1) & (c0 < src.width) & (r0 >= -1) & (r0 < src.height)
+        if not inside.any():
+            return values
+
+        block_height, block_width = src.block_shapes[0]
+        blocks_per_row = math.ceil(src.width / block_width)
+        block = (
+            np.clip(r0, 0, src.height - 1) // block_height * blocks_per_row
+            + np.clip(c0, 0, src.width - 1) // block_width
+        )
+        index = np.flatnonzero(inside)
+        index = index[np.argsort(block[index], kind="stable")]
+        _, starts = np.unique(block[index], return_index=True)
+        for group in np.split(index, starts[1:]):
+            top = max(int(r0[group].min()), 0)
+            bottom = min(int(r0[group].max()) + 1, src.height - 1)
+            left = max(int(c0[group].min()), 0)
+            right = min(int(c0[group].max()) + 1, src.width - 1)
+            window = Window(left, top, right - left + 1, bottom - top + 1)
+            data = src.read(1, window=window, masked=True).astype(np.float64).filled(np.nan)
+
+            # Neighbours are clamped at the raster edges
+            ri = np.clip(r0[group] - top, 0, data.shape[0] - 1)
+            ri1 = np.clip(r0[group] + 1 - top, 0, data.shape[0] - 1)
+            ci = np.clip(c0[group] - left, 0, data.shape[1] - 1)
+            ci1 = np.clip(c0[group] + 1 - left, 0, data.shape[1] - 1)
+            fr = np.clip(rows[group] - r0[group], 0.0, 1.0)
+            fc = np.clip(cols[group] - c0[group], 0.0, 1.0)
+            values[group] = (
+                data[ri, ci] * (1 - fr) * (1 - fc) + data[ri, ci1] * (1 - fr) * fc
+                + data[ri1, ci] * fr * (1 - fc) + data[ri1, ci1] * fr * fc
+            )
+    return values
+
+
+def sample_octree(
+    path: str, x: np.ndarray, y: np.ndarray, segment: np.ndarray, radius: float
+) -> np.ndarray:
+    """Elevation of the nearest point (in XY, within ``radius``) of each position"""
+    octree = pointcloud.load_octree(path)
+    values = np.full(len(x), np.nan)
+    # Runs of consecutive samples on one segment: they lie on a straight line
+    breaks = np.flatnonzero(np.diff(segment)) + 1
+    starts = np.concatenate([[0], breaks, np.arange(0, len(x), POINTCLOUD_RUN)])
+    starts = np.unique(starts)
+    ends = np.append(starts[1:], len(x))
+
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        sx, sy = x[start:end], y[start:end]
+        bbox = [sx.min() - radius, sy.min() - radius, sx.max() + radius, sy.max() + radius]
+        ux, uy = (sx[-1] - sx[0], sy[-1] - sy[0]) if end - start > 1 else (1.0, 0.0)
+        norm = math.hypot(ux, uy) or 1.0
+        ux, uy = ux / norm, uy / norm
+        step = math.hypot(sx[1] - sx[0], sy[1] - sy[0]) if end - start > 1 else 1.0
+
+        best = np.full(end - start, np.inf)
+        for points in pointcloud.select_points(octree, bbox, max_points=sys.maxsize):
+            px = points["x"] * octree.scale[0] + octree.offset[0] - sx[0]
+            py = points["y"] * octree.scale[1] + octree.offset[1] - sy[0]
+            along = px * ux + py * uy
+            nearest = np.clip(np.rint(along / step), 0, end - start - 1).astype(np.int64)
+            distance = (along - nearest * step) ** 2 + (px * uy - py * ux) ** 2
+            keep = distance <= radius ** 2
+            if not keep.any():
+                continue
+            nearest, distance = nearest[keep], distance[keep]
+            z = points["z"][keep] * octree.scale[2] + octree.offset[2]
+            # Closest point per sample: sort by (sample, distance), take firsts
+            order = np.lexsort((distance, nearest))
+            samples, first = np.unique(nearest[order], return_index=True)
+            closest = order[first]
+            better = distance[closest] < best[samples]
+            best[samples[better]] = distance[closest][better]
+            values[start + samples[better]] = z[closest][better]
+    return values
+
+
+def _rounded(values: np.ndarray) -> List[Optional[float]]:
+    return [None if math.isnan(v) else v for v in np.round(values, ELEVATION_DECIMALS).tolist()]
+
+
+def compute_profile(
+    geometry: Dict[str, Any],
+    surface: Dict[str, Any],
+    samples: int,
+    search_radius: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Elevation profile of a surface (see ``volume.surface_for_layer``)
+    along a WGS84 LineString. ``search_radius`` (meters) bounds the
+    distance to the nearest point for point clouds. Raises ProfileError.
+    """
+    line = densify(geometry, surface["crs"], samples)
+    x, y = line["x"], line["y"]
+    if surface["kind"] == "raster":
+        elevations = sample_raster(surface["path"], x, y)
+    else:
+        octree = pointcloud.load_octree(surface["path"])
+        meters_per_unit = METERS_PER_DEGREE if line["geographic"] else line["unit_factor"]
+        if search_radius is None:
+            # Half the spacing, but at least twice the mean point spacing
+            minx, miny, _, maxx, maxy, _ = octree.info["data_bounds"]
+            area = max((maxx - minx) * (maxy - miny), 1e-12)
+            point_spacing = math.sqrt(area / max(octree.info["points"], 1)) * meters_per_unit
+            search_radius = max(line["spacing"] / 2, 2 * point_spacing)
+        elevations = sample_octree(
+            surface["path"], x, y, line["segment"], search_radius / meters_per_unit
+        )
+
+    valid = elevations[~np.isnan(elevations)]
+    if valid.size == 0:
+        raise ProfileError("The surface has no data along the line")
+    steps = np.diff(valid)
+    lon, lat = transform_coords(x, y, surface["crs"], "EPSG:4326")
+    return {
+        "length": line["length"],
+        "spacing": line["spacing"],
+        "samples": samples,
+        "elevations": _rounded(elevations),
+        "coordinates": np.round(np.column_stack([lon, lat]), 7).tolist(),
+        "min_elevation": float(valid.min()),
+        "max_elevation": float(valid.max()),
+        "gain": float(steps[steps > 0].sum()),
+        "loss": float(abs(steps[steps < 0].sum())),
+    }
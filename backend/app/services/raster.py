@@ -0,0 +1,191 @@
+"""
+Raster (GeoTIFF) processing: Cloud-Optimized GeoTIFF conversion and XYZ
+tile rendering.
+
+Requires rasterio (GDAL); it is imported lazily so the API still starts
+without it.
+"""
+import io
+import math
+import os
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+TILE_SIZE = 256
+COG_BLOCKSIZE = 512
+
+# Half the width of the web-mercator world in meters
+MERCATOR_ORIGIN = 20037508.342789244
+
+
+def tile_bounds_mercator(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Bounds (minx, miny, maxx, maxy) of an XYZ tile in EPSG:3857"""
+    size = 2 * MERCATOR_ORIGIN / (1 << z)
+    minx = -MERCATOR_ORIGIN + x * size
+    maxy = MERCATOR_ORIGIN - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def tile_bounds_wgs84(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """Bounds (west, south, east, north) of an XYZ tile in degrees"""
+    n = 1 << z
+
+    def lat(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return x / n * 360.0 - 180.0, lat(y + 1), (x + 1) / n * 360.0 - 180.0, lat(y)
+
+
+def convert_to_cog(
+    src_path: str, dst_path: str, progress: Optional[Callable[[float, str], None]] = None
+) -> dict:
+    """
+    Rewrite a GeoTIFF as a tiled, compressed Cloud-Optimized GeoTIFF with
+    internal overviews. Returns display statistics (per band min/max) used
+    to scale non-8-bit rasters when rendering tiles.
+    """
+    import rasterio
+    from rasterio.shutil import copy as rio_copy
+
+    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+    tmp_path = dst_path + ".tmp.tif"
+    with rasterio.Env(GDAL_NUM_THREADS="ALL_CPUS"):
+        with rasterio.open(src_path) as src:
+            if progress:
+                progress(0.05, "Writing COG")
+            if _has_driver("COG"):
+                rio_copy(
+                    src, tmp_path, driver="COG",
+                    compress="DEFLATE", predictor="YES", blocksize=COG_BLOCKSIZE,
+                    overviews="AUTO", resampling="AVERAGE", bigtiff="IF_SAFER",
+                )
+            else:
+                _write_tiled_gtiff(src, tmp_path, "DEFLATE")
+    os.replace(tmp_path, dst_path)
+
+    if progress:
+        progress(0.9, "Computing statistics")
+    return {"render": raster_stats(dst_path)}
+
+
+def _has_driver(name: str) -> bool:
+    import rasterio
+
+    with rasterio.Env() as env:
+        return name in env.drivers()
+
+
+def _write_tiled_gtiff(src, dst_path: str, compress: str) -> None:
+    """Fallback for GDAL < 3.1: tiled GTiff plus overviews"""
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.shutil import copy as rio_copy
+
+    rio_copy(
+        src, dst_path, driver="GTiff", tiled=True,
+        blockxsize=COG_BLOCKSIZE, blockysize=COG_BLOCKSIZE,
+        compress=compress, bigtiff="IF_SAFER", copy_src_overviews=False,
+    )
+    with rasterio.open(dst_path, "r+") as dst:
+        factors = []
+        factor = 2
+        while max(dst.width, dst.height) / factor >= COG_BLOCKSIZE / 2:
+            factors.append(factor)
+            factor *= 2
+        if factors:
+            dst.build_overviews(factors, Resampling.average)
+
+
+def raster_stats(path: str, sample_size: int = 1024) -> dict:
+    """2nd/98th percentile of each band, read from a small overview"""
+    import rasterio
+
+    with rasterio.open(path) as src:
+        scale = max(src.width, src.height) / sample_size
+        out_shape = (
+            src.count,
+            max(1, int(src.height / max(scale, 1))),
+            max(1, int(src.width / max(scale, 1))),
+        )
+        data = src.read(out_shape=out_shape, masked=True).astype("float64")
+        mins: List[float] = []
+        maxs: List[float] = []
+        for band in data:
+            values = band.compressed()
+            values = values[np.isfinite(values)]
+            if values.size == 0:
+                mins.append(0.0)
+                maxs.append(1.0)
+                continue
+            low, high = np.percentile(values, [2, 98])
+            mins.append(float(low))
+            maxs.append(float(high if high > low else low + 1))
+        return {"min": mins, "max": maxs, "dtype": src.dtypes[0]}
+
+
+def render_tile(
+    path: str, z: int, x: int, y: int, fmt: str = "png", stats: Optional[dict] = None
+) -> Optional[bytes]:
+    """
+    Render an XYZ tile of a (COG) raster. Only the windows and overview
+    level needed for the tile are read. Returns None if the tile is empty.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_bounds
+    from rasterio.vrt import WarpedVRT
+
+    minx, miny, maxx, maxy = tile_bounds_mercator(z, x, y)
+    transform = from_bounds(minx, miny, maxx, maxy, TILE_SIZE, TILE_SIZE)
+    with rasterio.open(path) as src:
+        bands = [1, 2, 3] if src.count >= 3 else [1]
+        with WarpedVRT(
+            src, crs="EPSG:3857", transform=transform, width=TILE_SIZE, height=TILE_SIZE,
+            resampling=Resampling.bilinear, add_alpha=src.nodata is None and src.count < 4,
+        ) as vrt:
+            mask = vrt.dataset_mask()
+            if not mask.any():
+                return None
+            data = vrt.read(bands)
+            dtype = src.dtypes[0]
+
+    if dtype != "uint8":
+        data = _to_uint8(data, bands, stats)
+    return encode_image(data, mask, fmt)
+
+
+def _to_uint8(data: np.ndarray, bands: List[int], stats: Optional[dict]) -> np.ndarray:
+    out = np.empty(data.shape, dtype=np.uint8)
+    for i, band in enumerate(bands):
+        values = data[i].astype("float64")
+        if stats:
+            low, high = stats["min"][band - 1], stats["max"][band - 1]
+        else:
+            low, high = float(np.nanmin(values)), float(np.nanmax(values))
+        scaled = (values - low) / ((high - low) or 1.0) * 255.0
+        out[i] = np.clip(np.nan_to_num(scaled), 0, 255).astype(np.uint8)
+    return out
+
+
+def encode_image(data: np.ndarray, mask: np.ndarray, fmt: str) -> bytes:
+    """Encode (bands, h, w) uint8 data plus a 0/255 mask as PNG or WEBP"""
+    from PIL import Image
+
+    alpha = mask.astype(np.uint8)
+    if data.shape[0] == 1:
+        image = Image.fromarray(np.dstack([data[0], alpha]), mode="LA")
+    else:
+        image = Image.fromarray(np.dstack([data[0], data[1], data[2], alpha]), mode="RGBA")
+    buffer = io.BytesIO()
+    if fmt == "webp":
+        image.save(buffer, format="WEBP", lossless=False, quality=85)
+    else:
+        image.save(buffer, format="PNG", optimize=False)
+    return buffer.getvalue()
+
+
+def empty_tile(fmt: str) -> bytes:
+    """Fully transparent tile"""
+    data = np.zeros((1, TILE_SIZE, TILE_SIZE), dtype=np.uint8)
+    return encode_image(data, data[0], fmt)
@@ -0,0 +1,399 @@
+"""
+Storage of uploaded files.
+
+Files are addressed by a key, their path relative to UPLOAD_DIR (which
+is also their name under /static). Two backends:
+
+- ``local``: the files live in UPLOAD_DIR itself.
+- ``s3``: the files live in an S3-compatible bucket (AWS, MinIO, ...)
+  and UPLOAD_DIR is a local cache of the ones processed on this host.
+  Clients upload and download directly with presigned URLs, transfers
+  from the API and workers use parallel multipart requests, and readers
+  that only need part of a file (headers) use ranged GETs.
+
+``Layer.file_path`` keeps being the local path of the file; ``fetch``
+makes sure it is there before a job reads it. With ``s3`` these local
+copies are a cache bounded by UPLOAD_CACHE_MAX_BYTES: the least recently
+used ones are removed once it is exceeded.
+
+Only the uploads move to object storage. Derived artifacts (COGs,
+octrees, thumbnails, the tile cache) stay in PROCESSED_DIR, where the API
+reads what the workers wrote, so with ``s3`` PROCESSED_DIR must be a
+volume shared by every API and worker host. ``get_storage`` refuses to
+start otherwise (SHARED_PROCESSED_DIR).
+"""
+import io
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import quote
+
+from app.core.config import settings
+from app.utils.files import remove_stored_file, resolve_data_dir
+
+# Most parts allowed in one multipart upload (S3 limit)
+MAX_PARTS = 10000
+
+# Read-ahead of files read through ranged requests
+RANGE_BUFFER = 1024 * 1024
+
+# Cached copies used this recently are never evicted: a job may be about to open them
+CACHE_MIN_AGE = 600
+
+
+class StorageError(Exception):
+    """Raised when the storage service rejects an operation"""
+
+
+def upload_dir() -> str:
+    return resolve_data_dir(settings.UPLOAD_DIR)
+
+
+def part_size_for(total_size: int) -> int:
+    """Part size of a multipart upload, grown so it fits in MAX_PARTS"""
+    return max(settings.UPLOAD_PART_SIZE, -(-total_size // MAX_PARTS))
+
+
+class LocalStorage:
+    """Files in UPLOAD_DIR, served by /static"""
+
+    local = True
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def key_for(self, path: str) -> str:
+        return os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    def fetch(self, key: str) -> str:
+        return self.local_path(key)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def size(self, key: str) -> Optional[int]:
+        try:
+            return os.path.getsize(self.local_path(key))
+        except OSError:
+            return None
+
+    def open(self, key: str):
+        return open(self.local_path(key), "rb")
+
+    def gdal_path(self, key: str) -> str:
+        return self.local_path(key)
+
+    def put(self, local_path: str, key: str) -> None:
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(local_path, path)
+
+    def copy(self, src_key: str, dst_key: str) -> None:
+        dst = self.local_path(dst_key)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            os.link(self.local_path(src_key), dst)
+        except OSError:
+            shutil.copyfile(self.local_path(src_key), dst)
+
+    def delete(self, key: str) -> None:
+        remove_stored_file(self.local_path(key))  # Also its digest and compressed copies
+
+    def download_url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        return None  # Served by /static
+
+
+class RangeReader(io.RawIOBase):
+    """Seekable read-only file over ranged GETs of an object"""
+
+    def __init__(self, storage: "S3Storage", key: str, size: int):
+        self.storage = storage
+        self.key = key
+        self.length = size
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.length}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def readinto(self, buffer) -> int:
+        length = min(len(buffer), self.length - self.position)
+        if length <= 0:
+            return 0
+        data = self.storage.read_range(self.key, self.position, length)
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+
+class S3Storage:
+    """Files in an S3-compatible bucket, cached in UPLOAD_DIR when processed"""
+
+    local = False
+
+    def __init__(self, cache_dir: str):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+        from botocore.config import Config
+
+        self.cache_dir = cache_dir
+        self.bucket = settings.S3_BUCKET
+        self.prefix = settings.S3_PREFIX.strip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=settings.S3_ENDPOINT_URL or None,
+            region_name=settings.S3_REGION or None,
+            aws_access_key_id=settings.S3_ACCESS_KEY_ID or None,
+            aws_secret_access_key=settings.S3_SECRET_ACCESS_KEY or None,
+            config=Config(
+                signature_version="s3v4",
+                # Custom endpoints (MinIO) usually have no per-bucket DNS
+                s3={"addressing_style": "path" if settings.S3_ENDPOINT_URL else "auto"},
+                max_pool_connections=max(10, settings.UPLOAD_PART_CONCURRENCY * 2),
+            ),
+        )
+        # Files larger than a part go up and down in parallel parts
+        self.transfer = TransferConfig(
+            multipart_threshold=settings.UPLOAD_PART_SIZE,
+            multipart_chunksize=settings.UPLOAD_PART_SIZE,
+            max_concurrency=settings.UPLOAD_PART_CONCURRENCY,
+        )
+
+    def object_key(self, key: str) -> str:
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def key_for(self, path: str) -> str:
+        return os.path.relpath(path, self.cache_dir).replace(os.sep, "/")
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, *key.split("/"))
+
+    def _missing(self, error: Exception) -> bool:
+        code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound", "NoSuchUpload")
+
+    def fetch(self, key: str) -> str:
+        """Local copy of an object, downloaded into the cache if missing"""
+        path = self.local_path(key)
+        try:
+            os.utime(path)  # Most recently used
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            try:
+                self.client.download_file(self.bucket, self.object_key(key), tmp_path, Config=self.transfer)
+                os.replace(tmp_path, path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            self.trim_cache()
+        return path
+
+    def trim_cache(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Remove the least recently used cached copies until the cache fits
+        in ``max_bytes`` (UPLOAD_CACHE_MAX_BYTES). Every object is still in
+        the bucket; hidden directories (uploads in progress, digests) are
+        left alone. Returns the bytes freed.
+        """
+        max_bytes = settings.UPLOAD_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        entries = []
+        for root, dirs, files in os.walk(self.cache_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue  # Downloads in progress
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        freed = 0
+        recent = time.time() - CACHE_MIN_AGE
+        for mtime, size, path in sorted(entries):
+            if total - freed <= max_bytes:
+                break
+            if mtime > recent:
+                break
+            remove_stored_file(path)
+            freed += size
+        return freed
+
+    def _head(self, key: str) -> Optional[dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.object_key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str) -> Optional[int]:
+        head = self._head(key)
+        return int(head["ContentLength"]) if head else None
+
+    def read_range(self, key: str, start: int, length: int) -> bytes:
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.object_key(key), Range=f"bytes={start}-{start + length - 1}"
+        )
+        return response["Body"].read()
+
+    def open(self, key: str):
+        """File object reading the object with ranged GETs, for header reads"""
+        size = self.size(key)
+        if size is None:
+            raise FileNotFoundError(key)
+        return io.BufferedReader(RangeReader(self, key, size), buffer_size=RANGE_BUFFER)
+
+    def gdal_path(self, key: str) -> str:
+        # GDAL reads only the blocks it needs, with HTTP range requests
+        return "/vsicurl/" + self.download_url(key)
+
+    def put(self, local_path: str, key: str) -> None:
+        """Upload a local file and keep it as the cached copy"""
+        from app.utils.file_server import media_type_for
+
+        self.client.upload_file(
+            local_path, self.bucket, self.object_key(key),
+            ExtraArgs={"ContentType": media_type_for(key)}, Config=self.transfer,
+        )
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(local_path, path)
+        self.trim_cache()
+
+    def copy(self, src_key: str, dst_key: str) -> None:
+        # Server side; the managed copy switches to multipart for large objects
+        self.client.copy(
+            {"Bucket": self.bucket, "Key": self.object_key(src_key)},
+            self.bucket, self.object_key(dst_key), Config=self.transfer,
+        )
+        src = self.local_path(src_key)
+        if os.path.exists(src):
+            dst = self.local_path(dst_key)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            shutil.copyfile(src, dst)
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self.object_key(key))
+        remove_stored_file(self.local_path(key))
+
+    def download_url(self, key: str, filename: Optional[str] = None) -> Optional[str]:
+        params = {"Bucket": self.bucket, "Key": self.object_key(key)}
+        if filename:
+            params["ResponseContentDisposition"] = f"attachment; filename*=UTF-8''{quote(filename)}"
+        return self.client.generate_presigned_url(
+            "get_object", Params=params, ExpiresIn=settings.S3_PRESIGN_EXPIRES
+        )
+
+    # Multipart uploads sent directly by clients
+    def create_multipart(self, key: str) -> str:
+        from app.utils.file_server import media_type_for
+
+        response = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=self.object_key(key), ContentType=media_type_for(key)
+        )
+        return response["UploadId"]
+
+    def part_urls(self, key: str, upload_id: str, part_numbers: Iterable[int]) -> List[str]:
+        # Signed locally, no request per part
+        return [
+            self.client.generate_presigned_url(
+                "upload_part",
+                Params={
+                    "Bucket": self.bucket, "Key": self.object_key(key),
+                    "UploadId": upload_id, "PartNumber": number,
+                },
+                ExpiresIn=settings.S3_PRESIGN_EXPIRES,
+            )
+            for number in part_numbers
+        ]
+
+    def uploaded_parts(self, key: str, upload_id: str) -> Dict[int, dict]:
+        """Parts stored so far: {part number: {"etag", "size"}}"""
+        parts = {}
+        paginator = self.client.get_paginator("list_parts")
+        for page in paginator.paginate(Bucket=self.bucket, Key=self.object_key(key), UploadId=upload_id):
+            for part in page.get("Parts", []):
+                parts[part["PartNumber"]] = {"etag": part["ETag"], "size": part["Size"]}
+        return parts
+
+    def complete_multipart(self, key: str, upload_id: str, parts: Dict[int, str]) -> None:
+        """Assemble the object from its parts ({part number: ETag})"""
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self.object_key(key), UploadId=upload_id,
+                MultipartUpload={"Parts": [
+                    {"PartNumber": number, "ETag": etag} for number, etag in sorted(parts.items())
+                ]},
+            )
+        except ClientError as e:
+            raise StorageError(str(e)) from e
+
+    def abort_multipart(self, key: str, upload_id: str) -> None:
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.object_key(key), UploadId=upload_id)
+        except ClientError as e:
+            if not self._missing(e):
+                raise
+
+
+_storage = None
+_storage_lock = threading.Lock()
+
+
+def get_storage():
+    """Storage backend selected by STORAGE_BACKEND (one per process)"""
+    global _storage
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                if settings.STORAGE_BACKEND == "s3":
+                    if not settings.SHARED_PROCESSED_DIR:
+                        raise StorageError(
+                            "STORAGE_BACKEND=s3 needs PROCESSED_DIR on a volume shared by every "
+                            "API and worker host; set SHARED_PROCESSED_DIR=true once it is"
+                        )
+                    _storage = S3Storage(upload_dir())
+                elif settings.STORAGE_BACKEND == "local":
+                    _storage = LocalStorage(upload_dir())
+                else:
+                    raise StorageError(f"Unknown STORAGE_BACKEND: {settings.STORAGE_BACKEND}")
+    return _storage
+
+
+def fetch(path: str) -> str:
+    """Local path of a stored file, downloaded first with object storage"""
+    storage = get_storage()
+    return storage.fetch(storage.key_for(path))
+
+
+def gdal_path(path: str) -> str:
+    """Name GDAL opens a stored file by, reading it in place with object storage"""
+    storage = get_storage()
+    return storage.gdal_path(storage.key_for(path))
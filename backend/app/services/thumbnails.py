@@ -0,0 +1,214 @@
+"""
+Layer preview images.
+
+Every processed layer gets a small PNG rendered once at ingest from its
+derived data, never from the raw upload:
+
+- rasters: a decimated read of the COG (served by its internal overviews)
+- vectors: the footprint of the imported features, drawn from geometries
+  PostGIS has already projected and quantized to thumbnail pixels
+- point clouds: a top-down density image of the coarse octree levels
+
+Thumbnails are named after a fingerprint of their source, so a file is
+never rewritten in place (it can be cached forever) and re-running the
+stage on an unchanged layer is a no-op.
+"""
+import hashlib
+import io
+import json
+import os
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models.layer import LayerFormat
+from app.services import blobs, pointcloud, raster, storage
+
+# Bump when the rendering changes so existing thumbnails are redrawn
+RENDER_VERSION = 1
+
+MEDIA_TYPE = "image/png"
+
+# A versioned thumbnail URL never changes content; the bare one may
+VERSIONED_CACHE = "private, max-age=31536000, immutable"
+LATEST_CACHE = "private, no-cache"
+
+# Points read for a density image (coarse octree levels first)
+POINTCLOUD_SAMPLE = 2_000_000
+
+FILL_COLOR = (37, 99, 235, 90)
+LINE_COLOR = (37, 99, 235, 255)
+POINT_RADIUS = 1
+
+VECTOR_FORMATS = (LayerFormat.GEOJSON, LayerFormat.KML, LayerFormat.KMZ)
+
+
+def can_render(layer: models.Layer) -> bool:
+    return layer.format in (LayerFormat.GEOTIFF, LayerFormat.LAS, LayerFormat.LAZ) + VECTOR_FORMATS
+
+
+def source_fingerprint(layer: models.Layer, size: int) -> str:
+    """
+    Hash of everything a thumbnail depends on: the uploaded content (its
+    SHA-256, or size and mtime for files stored without one), the version
+    of the derived data it is drawn from and the rendering parameters.
+    """
+    metadata = layer.layer_metadata or {}
+    source = metadata.get("sha256")
+    if not source:
+        stat = os.stat(layer.file_path)
+        source = f"{stat.st_size}-{stat.st_mtime_ns}"
+    # Features of layers sharing a blob are the same whatever their version
+    derived = None if layer.blob_sha256 else metadata.get("features_version")
+    if derived is None and layer.processed_path and os.path.exists(layer.processed_path):
+        derived = os.stat(layer.processed_path).st_mtime_ns
+    key = json.dumps([RENDER_VERSION, size, layer.format.value, source, derived])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
+
+
+def thumbnail_file(layer: models.Layer, fingerprint: str) -> str:
+    return os.path.join(blobs.artifact_dir(layer, "thumbnail"), f"{fingerprint}.png")
+
+
+def render(db: Session, layer: models.Layer, size: int) -> Optional[bytes]:
+    """PNG preview of a processed layer, None if there is nothing to draw"""
+    if layer.format == LayerFormat.GEOTIFF:
+        path = layer.processed_path or storage.gdal_path(layer.file_path)
+        return render_raster(path, size, (layer.layer_metadata or {}).get("render"))
+    if layer.format in (LayerFormat.LAS, LayerFormat.LAZ):
+        if not layer.processed_path:
+            return None
+        return render_pointcloud(layer.processed_path, size)
+    if layer.format in VECTOR_FORMATS:
+        return render_vector(db, layer.id, size)
+    return None
+
+
+def _fit(width: int, height: int, size: int):
+    """Output shape (height, width) with the longest side equal to ``size``"""
+    scale = size / max(width, height, 1)
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+def render_raster(path: str, size: int, stats: Optional[dict] = None) -> Optional[bytes]:
+    """
+    Downsampled view of a raster. Reading with a small ``out_shape`` lets
+    GDAL pick the closest overview, so only a few blocks are decoded.
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+
+    with rasterio.open(path) as src:
+        bands = [1, 2, 3] if src.count >= 3 else [1]
+        height, width = _fit(src.width, src.height, size)
+        data = src.read(bands, out_shape=(len(bands), height, width), resampling=Resampling.average)
+        mask = src.dataset_mask(out_shape=(height, width), resampling=Resampling.nearest)
+        dtype = src.dtypes[0]
+
+    if not mask.any():
+        return None
+    if dtype != "uint8":
+        data = raster._to_uint8(data, bands, stats)
+    return raster.encode_image(data, mask, "png")
+
+
+def render_pointcloud(octree_path: str, size: int) -> Optional[bytes]:
+    """Top-down point density (log scaled) of an octree's coarse levels"""
+    octree = pointcloud.load_octree(octree_path)
+    minx, miny, _, maxx, maxy, _ = octree.info["data_bounds"]
+    height, width = _fit(maxx - minx, maxy - miny, size)
+
+    extent = ((miny, max(maxy, miny + 1e-9)), (minx, max(maxx, minx + 1e-9)))
+    counts = np.zeros((height, width), dtype=np.float64)
+    for points in pointcloud.select_points(octree, max_points=POINTCLOUD_SAMPLE):
+        x = points["x"] * octree.scale[0] + octree.offset[0]
+        y = points["y"] * octree.scale[1] + octree.offset[1]
+        # Row 0 is the north edge
+        hist, _, _ = np.histogram2d(y, x, bins=(height, width), range=extent)
+        counts += hist[::-1]
+
+    if not counts.any():
+        return None
+    density = np.log1p(counts)
+    density = density / density.max() * 255.0
+    gray = np.where(counts > 0, 64 + density * (191 / 255), 0).astype(np.uint8)
+    return raster.encode_image(gray[np.newaxis], (counts > 0) * 255, "png")
+
+
+# Geometries projected to web mercator and quantized to thumbnail pixels by
+# ST_AsMVTGeom over a square around the layer extent (y grows downwards,
+# as in images). The coarsest stored simplification level is used where
+# there is one.
+FOOTPRINT_QUERY = text("""
+    WITH bounds AS (
+        SELECT ST_Expand(
+                   ST_Centroid(e),
+                   GREATEST(ST_XMax(e) - ST_XMin(e), ST_YMax(e) - ST_YMin(e), 1) / 2
+               ) AS geom
+        FROM (
+            SELECT ST_Transform(ST_SetSRID(ST_Extent(geom)::geometry, 4326), 3857) AS e
+            FROM layer_features WHERE layer_id = :layer_id
+        ) s
+        WHERE e IS NOT NULL
+    )
+    SELECT ST_AsGeoJSON(ST_AsMVTGeom(
+        ST_Transform(COALESCE(l.geom, f.geom), 3857), bounds.geom, :size, 0, true
+    ))
+    FROM layer_features f
+    CROSS JOIN bounds
+    LEFT JOIN layer_feature_levels l
+           ON l.feature_id = f.id
+          AND l.zoom = (SELECT MIN(zoom) FROM layer_feature_levels WHERE layer_id = :layer_id)
+    WHERE f.layer_id = :layer_id
+""")
+
+
+def render_vector(db: Session, layer_id: int, size: int) -> Optional[bytes]:
+    """Footprint of a vector layer: filled polygons, lines and points"""
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGBA", (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    drawn = 0
+    result = db.execute(
+        FOOTPRINT_QUERY.execution_options(yield_per=5000), {"layer_id": layer_id, "size": size}
+    )
+    for (geojson,) in result:
+        if geojson:
+            drawn += _draw_geometry(draw, json.loads(geojson))
+    if not drawn:
+        return None
+
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _draw_geometry(draw, geometry: dict) -> int:
+    kind = geometry.get("type")
+    coords = geometry.get("coordinates")
+    if kind == "Point":
+        coords = [coords]
+    if kind in ("Point", "MultiPoint"):
+        for x, y in coords:
+            draw.ellipse((x - POINT_RADIUS, y - POINT_RADIUS, x + POINT_RADIUS, y + POINT_RADIUS), fill=LINE_COLOR)
+        return len(coords)
+    if kind == "LineString":
+        coords = [coords]
+    if kind in ("LineString", "MultiLineString"):
+        for line in coords:
+            draw.line([tuple(p) for p in line], fill=LINE_COLOR, width=1)
+        return len(coords)
+    if kind == "Polygon":
+        coords = [coords]
+    if kind in ("Polygon", "MultiPolygon"):
+        for polygon in coords:
+            # Holes are not cut out: this is a footprint, not a map
+            draw.polygon([tuple(p) for p in polygon[0]], fill=FILL_COLOR, outline=LINE_COLOR)
+        return len(coords)
+    if kind == "GeometryCollection":
+        return sum(_draw_geometry(draw, part) for part in geometry.get("geometries", []))
+    return 0
@@ -0,0 +1,139 @@
+"""
+Size-bounded on-disk LRU cache for rendered tiles.
+
+Entries are plain files under the cache root, so they survive restarts
+and are shared by every process using the same root. The recency index is
+kept in memory; a hit touches its file, and the index is rebuilt from the
+files' times on first use and every RESCAN_INTERVAL seconds, so each
+process sees (and evicts) what the others wrote. Between rescans the size
+bound can be exceeded by what other processes write meanwhile. A miss in
+the index still finds a tile another process wrote and adopts it.
+"""
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from uuid import uuid4
+
+from app.core.config import settings
+from app.utils.files import resolve_data_dir
+
+# Seconds between two measurements of the whole cache directory
+RESCAN_INTERVAL = 60.0
+
+
+class DiskLRUCache:
+    """Key/value bytes cache on disk evicting least recently used entries"""
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._index: "OrderedDict[str, int]" = OrderedDict()
+        self._total = 0
+        self._loaded = False
+        self._scanned_at = 0.0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        path = os.path.normpath(os.path.join(self.root, key))
+        if not path.startswith(os.path.normpath(self.root) + os.sep):
+            raise ValueError(f"Invalid cache key: {key}")
+        return path
+
+    def _scan(self) -> "OrderedDict[str, int]":
+        """Entries on disk, least recently used first"""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, os.path.relpath(path, self.root), stat.st_size))
+        return OrderedDict((key.replace(os.sep, "/"), size) for _, key, size in sorted(entries))
+
+    def _load(self) -> None:
+        """Rebuild the index from disk (outside the lock: it walks the tree)"""
+        index = self._scan()
+        with self._lock:
+            self._index = index
+            self._total = sum(index.values())
+            self._loaded = True
+            self._scanned_at = time.monotonic()
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        if not self._loaded:
+            self._load()
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # Recency, shared with the other processes
+        except OSError:
+            with self._lock:
+                self._total -= self._index.pop(key, 0)
+            return None
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+            else:
+                # Written by another process
+                self._index[key] = len(data)
+                self._total += len(data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+        if not self._loaded or time.monotonic() - self._scanned_at > RESCAN_INTERVAL:
+            self._load()
+        evicted = []
+        with self._lock:
+            self._total += len(data) - self._index.pop(key, 0)
+            self._index[key] = len(data)
+            while self._total > self.max_bytes and len(self._index) > 1:
+                old_key, size = self._index.popitem(last=False)
+                self._total -= size
+                evicted.append(old_key)
+        for old_key in evicted:
+            try:
+                os.remove(self._path(old_key))
+            except OSError:
+                pass
+
+    def invalidate_prefix(self, prefix: str) -> None:
+        """Drop every entry under a key prefix (e.g. one layer)"""
+        prefix = prefix.rstrip("/") + "/"
+        with self._lock:
+            for key in [k for k in self._index if k.startswith(prefix)]:
+                self._total -= self._index.pop(key)
+        shutil.rmtree(self._path(prefix), ignore_errors=True)
+
+    @property
+    def size(self) -> int:
+        return self._total
+
+
+_tile_cache: Optional[DiskLRUCache] = None
+_tile_cache_lock = threading.Lock()
+
+
+def get_tile_cache() -> DiskLRUCache:
+    """Process-wide tile cache under PROCESSED_DIR"""
+    global _tile_cache
+    with _tile_cache_lock:
+        if _tile_cache is None:
+            root = os.path.join(resolve_data_dir(settings.PROCESSED_DIR), "tile_cache")
+            os.makedirs(root, exist_ok=True)
+            _tile_cache = DiskLRUCache(root, settings.TILE_CACHE_MAX_BYTES)
+        return _tile_cache
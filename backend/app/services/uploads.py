@@ -0,0 +1,227 @@
+"""
+Streaming upload storage.
+
+Files are written to a temporary ``.part`` file in UPLOAD_DIR while they
+are received, the size limit is enforced on the fly and the SHA-256
+checksum is computed in the same pass; the complete file is then stored
+as a content-addressed blob (see ``app.services.blobs``). Chunked uploads
+keep their ``.part`` file between requests: its size on disk is the
+resume offset, so a dropped connection only loses the bytes in flight.
+
+Direct uploads skip the API: the client sends the parts of a multipart
+upload straight to object storage and the file is hashed and registered
+by a job (see ``app.services.storage`` and ``blobs.register_blob``).
+"""
+import hashlib
+import os
+import threading
+import time
+from typing import AsyncIterator, BinaryIO, Dict, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app import models
+from app.core import metrics
+from app.core.config import settings
+from app.services.storage import get_storage
+from app.utils.files import resolve_data_dir
+
+# Bytes buffered before each disk write / hash update
+CHUNK_SIZE = 1024 * 1024
+
+PARTIAL_DIRNAME = ".partial"
+
+
+class UploadTooLarge(Exception):
+    """Raised when the received data exceeds the allowed size"""
+
+
+class UploadBusy(Exception):
+    """Raised when another chunk for the same upload is being written"""
+
+
+class OffsetMismatch(Exception):
+    """Raised when a chunk does not start where the stored data ends"""
+
+    def __init__(self, expected: int):
+        super().__init__(f"Expected offset {expected}")
+        self.expected = expected
+
+
+# Running hash state per upload session, keyed by upload id.
+# Value is (offset the hash covers, hasher). Rebuilt from disk when missing
+# (e.g. after a restart) so it never has to be persisted.
+_hash_states: Dict[str, Tuple[int, "hashlib._Hash"]] = {}
+_hash_lock = threading.Lock()
+
+# Uploads with a chunk currently being written in this process. Across
+# processes the API also holds a row lock on the upload session.
+_active_uploads = set()
+
+
+def upload_dir() -> str:
+    return resolve_data_dir(settings.UPLOAD_DIR)
+
+
+def partial_path(upload_id: str) -> str:
+    """Path of the partial file for a chunked upload"""
+    path = os.path.join(upload_dir(), PARTIAL_DIRNAME)
+    os.makedirs(path, exist_ok=True)
+    return os.path.join(path, f"{upload_id}.part")
+
+
+def direct_key(upload_id: str, filename: str) -> str:
+    """Storage key of a direct upload until it is registered as a blob"""
+    return f"{PARTIAL_DIRNAME}/{upload_id}{os.path.splitext(filename)[1].lower()}"
+
+
+def received_bytes(upload_id: str) -> int:
+    """Bytes stored so far for an upload, i.e. the offset to resume from"""
+    path = partial_path(upload_id)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _hash_file(path: str, length: int) -> "hashlib._Hash":
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining > 0:
+            data = f.read(min(CHUNK_SIZE, remaining))
+            if not data:
+                break
+            hasher.update(data)
+            remaining -= len(data)
+    return hasher
+
+
+def _take_hasher(upload_id: str, offset: int) -> "hashlib._Hash":
+    with _hash_lock:
+        state = _hash_states.pop(upload_id, None)
+    if state and state[0] == offset:
+        return state[1]
+    # No usable state in this process: re-hash what is already on disk
+    if offset == 0:
+        return hashlib.sha256()
+    return _hash_file(partial_path(upload_id), offset)
+
+
+def _store_hasher(upload_id: str, offset: int, hasher: "hashlib._Hash") -> None:
+    with _hash_lock:
+        _hash_states[upload_id] = (offset, hasher)
+
+
+def _write(f: BinaryIO, hasher: "hashlib._Hash", data: bytes) -> None:
+    f.write(data)
+    hasher.update(data)
+
+
+async def append_chunk(
+    upload_id: str, offset: int, total_size: int, stream: AsyncIterator[bytes]
+) -> int:
+    """
+    Append a request body stream to a partial upload starting at ``offset``.
+    Returns the number of bytes stored after the chunk. Whatever arrived
+    before an error or a disconnect is kept, so the client can resume.
+    """
+    with _hash_lock:
+        if upload_id in _active_uploads:
+            raise UploadBusy()
+        _active_uploads.add(upload_id)
+    try:
+        return await _append(upload_id, offset, total_size, stream)
+    finally:
+        with _hash_lock:
+            _active_uploads.discard(upload_id)
+
+
+async def _append(
+    upload_id: str, offset: int, total_size: int, stream: AsyncIterator[bytes]
+) -> int:
+    path = partial_path(upload_id)
+    current = received_bytes(upload_id)
+    if offset != current:
+        raise OffsetMismatch(current)
+
+    hasher = await run_in_threadpool(_take_hasher, upload_id, current)
+    start = time.perf_counter()
+    written = current
+    buffer = bytearray()
+    try:
+        with open(path, "ab") as f:
+            try:
+                async for data in stream:
+                    if written + len(buffer) + len(data) > total_size:
+                        raise UploadTooLarge()
+                    buffer += data
+                    if len(buffer) >= CHUNK_SIZE:
+                        pending = bytes(buffer)
+                        buffer.clear()
+                        await run_in_threadpool(_write, f, hasher, pending)
+                        written += len(pending)
+            finally:
+                # Also keeps the valid part of an interrupted chunk
+                if buffer:
+                    pending = bytes(buffer)
+                    buffer.clear()
+                    _write(f, hasher, pending)
+                    written += len(pending)
+    finally:
+        # If a write failed half way the offsets won't match and the
+        # hash is rebuilt from disk on the next chunk
+        _store_hasher(upload_id, written, hasher)
+        metrics.observe_upload("chunk", written - current, time.perf_counter() - start)
+    return written
+
+
+def finish_chunked(upload_id: str) -> Tuple[str, str]:
+    """
+    Checksum of a complete partial upload.
+    Returns (partial file path, sha256 hex digest); the file is then
+    handed to ``blobs.acquire``.
+    """
+    hasher = _take_hasher(upload_id, received_bytes(upload_id))
+    return partial_path(upload_id), hasher.hexdigest()
+
+
+def discard_chunked(upload_id: str) -> None:
+    """Remove a partial upload and its hash state"""
+    with _hash_lock:
+        _hash_states.pop(upload_id, None)
+    path = partial_path(upload_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def discard_upload(upload: models.UploadSession) -> None:
+    """Remove what an unfinished upload session received, wherever it went"""
+    if upload.storage_upload_id:
+        get_storage().abort_multipart(direct_key(upload.id, upload.original_filename), upload.storage_upload_id)
+    else:
+        discard_chunked(upload.id)
+
+
+def save_stream(src: BinaryIO, file_location: str, max_size: int) -> Tuple[int, str]:
+    """
+    Copy a file object to ``file_location`` enforcing ``max_size`` while
+    copying. Returns (size, sha256 hex digest). The destination is removed
+    if the limit is exceeded.
+    """
+    hasher = hashlib.sha256()
+    size = 0
+    start = time.perf_counter()
+    try:
+        with open(file_location, "wb") as dst:
+            while True:
+                data = src.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if size > max_size:
+                    raise UploadTooLarge()
+                _write(dst, hasher, data)
+    except BaseException:
+        if os.path.exists(file_location):
+            os.remove(file_location)
+        raise
+    metrics.observe_upload("form", size, time.perf_counter() - start)
+    return size, hasher.hexdigest()
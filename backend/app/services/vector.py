@@ -0,0 +1,458 @@
+"""
+Vector layer import into the ``layer_features`` table.
+
+Features are read from GeoJSON or KML/KMZ files and inserted in batches;
+geometries are parsed by PostGIS (ST_GeomFromGeoJSON) so no geometry
+objects are built in Python. Both formats are parsed as streams (GeoJSON
+feature by feature with ijson, KMZ entries decompressed on the fly), so
+file size does not bound memory use.
+"""
+import contextlib
+import json
+import math
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+import ijson
+from sqlalchemy import bindparam, func, insert, text
+from sqlalchemy.orm import Session
+
+from app import models
+from app.models.layer import LayerFormat
+
+BATCH_SIZE = 5000
+
+GEOMETRY_TYPES = {
+    "Point", "MultiPoint", "LineString", "MultiLineString",
+    "Polygon", "MultiPolygon", "GeometryCollection",
+}
+
+Feature = Dict[str, Any]  # {"geometry": {...}, "properties": {...}}
+
+
+def _json_items(path: str, prefix: str) -> Iterator[Any]:
+    """Values at ``prefix`` of a JSON file, parsed incrementally"""
+    with open(path, "rb") as f:
+        try:
+            yield from ijson.items(f, prefix, use_float=True)
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid JSON: {e}") from e
+
+
+def iter_geojson_features(path: str) -> Iterator[Feature]:
+    """
+    Features of a GeoJSON file. The ``features`` array of a collection is
+    parsed incrementally, one feature at a time; only a document without
+    one (a single Feature or geometry) is loaded whole.
+    """
+    count = 0
+    for feature in _json_items(path, "features.item"):
+        count += 1
+        if isinstance(feature, dict):
+            yield {"geometry": feature.get("geometry"), "properties": feature.get("properties")}
+    if count:
+        return
+    data = next(_json_items(path, ""), None)
+    if not isinstance(data, dict):
+        return
+    if data.get("type") == "Feature":
+        yield {"geometry": data.get("geometry"), "properties": data.get("properties")}
+    elif data.get("type") in GEOMETRY_TYPES:
+        yield {"geometry": data, "properties": None}
+
+
+def _kml_coords(text_value: Optional[str]) -> List[List[float]]:
+    coords = []
+    for token in (text_value or "").split():
+        try:
+            values = [float(v) for v in token.split(",")]
+        except ValueError:
+            continue
+        coords.append(values[:3])
+    return coords
+
+
+def _kml_geometry(elem: ET.Element) -> Optional[dict]:
+    tag = elem.tag.rsplit("}", 1)[-1]
+    if tag == "Point":
+        coords = _kml_coords(elem.findtext("{*}coordinates"))
+        return {"type": "Point", "coordinates": coords[0]} if coords else None
+    if tag == "LineString":
+        return {"type": "LineString", "coordinates": _kml_coords(elem.findtext("{*}coordinates"))}
+    if tag == "LinearRing":
+        return {"type": "LineString", "coordinates": _kml_coords(elem.findtext("{*}coordinates"))}
+    if tag == "Polygon":
+        rings = [_kml_coords(elem.findtext("{*}outerBoundaryIs/{*}LinearRing/{*}coordinates"))]
+        for inner in elem.findall("{*}innerBoundaryIs/{*}LinearRing"):
+            rings.append(_kml_coords(inner.findtext("{*}coordinates")))
+        return {"type": "Polygon", "coordinates": rings}
+    if tag == "MultiGeometry":
+        return _kml_multi_geometry([g for g in (_kml_geometry(child) for child in elem) if g])
+    return None
+
+
+def _kml_multi_geometry(parts: List[dict]) -> Optional[dict]:
+    """
+    Geometry of a <MultiGeometry>: a Multi* geometry when all parts have
+    one type, a GeometryCollection only for mixed ones. ST_AsMVTGeom keeps
+    just the highest-dimension parts of a collection, so mixed placemarks
+    lose their points or lines in vector tiles.
+    """
+    singles = []
+    for part in parts:
+        kind = part["type"]
+        if kind == "GeometryCollection":
+            singles += part["geometries"]  # Nested MultiGeometry, already flat
+        elif kind.startswith("Multi"):
+            singles += [{"type": kind[5:], "coordinates": c} for c in part["coordinates"]]
+        else:
+            singles.append(part)
+    if not singles:
+        return None
+    if len(singles) == 1:
+        return singles[0]
+    kinds = {g["type"] for g in singles}
+    if len(kinds) == 1:
+        return {"type": f"Multi{kinds.pop()}", "coordinates": [g["coordinates"] for g in singles]}
+    return {"type": "GeometryCollection", "geometries": singles}
+
+
+def _kml_placemark(placemark: ET.Element) -> Feature:
+    geometry = None
+    for child in placemark:
+        geometry = _kml_geometry(child)
+        if geometry:
+            break
+    properties = {}
+    for key in ("name", "description"):
+        value = placemark.findtext(f"{{*}}{key}")
+        if value:
+            properties[key] = value
+    for data in placemark.findall(".//{*}Data"):
+        properties[data.get("name")] = data.findtext("{*}value")
+    # Typed attributes (<Schema>), common in GIS and CAD exports
+    for data in placemark.findall(".//{*}SimpleData"):
+        properties[data.get("name")] = data.text
+    return {"geometry": geometry, "properties": properties}
+
+
+def _kmz_document(archive: zipfile.ZipFile) -> Optional[str]:
+    """Main KML of a KMZ: doc.kml, else the first .kml (root level first)"""
+    names = [n for n in archive.namelist() if n.lower().endswith(".kml")]
+    for name in names:
+        if name.lower() == "doc.kml":
+            return name
+    names.sort(key=lambda n: n.count("/"))
+    return names[0] if names else None
+
+
+def iter_kml_features(path: str, kmz: bool = False) -> Iterator[Feature]:
+    """
+    Placemarks of a KML file, or of the main document of a KMZ, decompressed
+    on the fly. The XML is parsed incrementally and every element is dropped
+    once handled, so memory stays bounded by the largest placemark however
+    big the file is.
+    """
+    with contextlib.ExitStack() as stack:
+        if kmz:
+            archive = stack.enter_context(zipfile.ZipFile(path))
+            name = _kmz_document(archive)
+            if name is None:
+                return
+            source = stack.enter_context(archive.open(name))
+        else:
+            source = stack.enter_context(open(path, "rb"))
+
+        # Open elements, to detach each finished one from its parent
+        ancestors: List[ET.Element] = []
+        in_placemark = 0
+        for event, elem in ET.iterparse(source, events=("start", "end")):
+            is_placemark = elem.tag.endswith("}Placemark") or elem.tag == "Placemark"
+            if event == "start":
+                ancestors.append(elem)
+                in_placemark += is_placemark
+                continue
+            ancestors.pop()
+            if is_placemark:
+                in_placemark -= 1
+                if not in_placemark:
+                    yield _kml_placemark(elem)
+            # Placemark content is kept until the placemark itself ends
+            if not in_placemark and ancestors:
+                ancestors[-1].remove(elem)
+
+
+def iter_features(path: str, format: LayerFormat) -> Iterator[Feature]:
+    if format == LayerFormat.GEOJSON:
+        return iter_geojson_features(path)
+    if format in (LayerFormat.KML, LayerFormat.KMZ):
+        return iter_kml_features(path, kmz=format == LayerFormat.KMZ)
+    raise ValueError(f"Unsupported vector format: {format}")
+
+
+def _valid_position(position: Any) -> bool:
+    return (
+        isinstance(position, (list, tuple))
+        and len(position) >= 2
+        and all(isinstance(v, (int, float)) and math.isfinite(v) for v in position[:3])
+    )
+
+
+def is_valid_geometry(geometry: Any) -> bool:
+    """Cheap structural check so one bad feature can't fail a whole batch"""
+    if not isinstance(geometry, dict):
+        return False
+    kind = geometry.get("type")
+    if kind == "GeometryCollection":
+        parts = geometry.get("geometries")
+        return bool(parts) and all(is_valid_geometry(g) for g in parts)
+    coords = geometry.get("coordinates")
+    if kind == "Point":
+        return _valid_position(coords)
+    if kind in ("MultiPoint", "LineString"):
+        return isinstance(coords, list) and len(coords) >= (2 if kind == "LineString" else 1) \
+            and all(_valid_position(p) for p in coords)
+    if kind in ("MultiLineString", "Polygon"):
+        minimum = 4 if kind == "Polygon" else 2
+        return isinstance(coords, list) and bool(coords) and all(
+            isinstance(line, list) and len(line) >= minimum and all(_valid_position(p) for p in line)
+            for line in coords
+        )
+    if kind == "MultiPolygon":
+        return isinstance(coords, list) and bool(coords) and all(
+            is_valid_geometry({"type": "Polygon", "coordinates": polygon}) for polygon in coords
+        )
+    return False
+
+
+def _insert_statement():
+    table = models.LayerFeature.__table__
+    return insert(table).values(
+        layer_id=bindparam("layer_id"),
+        properties=bindparam("properties", type_=table.c.properties.type),
+        geom=func.ST_Force2D(func.ST_SetSRID(func.ST_GeomFromGeoJSON(bindparam("geometry")), 4326)),
+    )
+
+
+def import_features(
+    db: Session,
+    layer_id: int,
+    features: Iterable[Feature],
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    Replace the features of a layer. Inserted in batches of BATCH_SIZE
+    within the caller's transaction. Returns import counts.
+    """
+    db.execute(text("DELETE FROM layer_features WHERE layer_id = :layer_id"), {"layer_id": layer_id})
+    statement = _insert_statement()
+    batch: List[dict] = []
+    imported = skipped = 0
+    for feature in features:
+        geometry = feature.get("geometry")
+        if not is_valid_geometry(geometry):
+            skipped += 1
+            continue
+        batch.append({
+            "layer_id": layer_id,
+            "properties": feature.get("properties") or {},
+            "geometry": json.dumps(geometry),
+        })
+        if len(batch) >= BATCH_SIZE:
+            db.execute(statement, batch)
+            imported += len(batch)
+            batch = []
+            if progress:
+                progress(imported)
+    if batch:
+        db.execute(statement, batch)
+        imported += len(batch)
+    return {"features": imported, "skipped": skipped}
+
+
+def copy_features(db: Session, src_layer_id: int, dst_layer_id: int) -> dict:
+    """
+    Replace the features of a layer with a copy of another layer's, in
+    the caller's transaction. Returns import counts.
+    """
+    db.execute(text("DELETE FROM layer_features WHERE layer_id = :layer_id"), {"layer_id": dst_layer_id})
+    result = db.execute(
+        text(
+            "INSERT INTO layer_features (layer_id, properties, geom) "
+            "SELECT :dst, properties, geom FROM layer_features WHERE layer_id = :src ORDER BY id"
+        ),
+        {"src": src_layer_id, "dst": dst_layer_id},
+    )
+    return {"features": result.rowcount}
+
+
+def layer_extent(db: Session, layer_id: int) -> Optional[List[float]]:
+    """[minx, miny, maxx, maxy] of the imported features"""
+    row = db.execute(
+        text(
+            "SELECT ST_XMin(e), ST_YMin(e), ST_XMax(e), ST_YMax(e) FROM "
+            "(SELECT ST_Extent(geom) AS e FROM layer_features WHERE layer_id = :layer_id) s"
+        ),
+        {"layer_id": layer_id},
+    ).first()
+    if row is None or row[0] is None:
+        return None
+    return [float(v) for v in row]
+
+
+# Simplification levels: geometries are simplified once per level at
+# ingest with a tolerance of half a web-mercator pixel (in degrees at the
+# equator) at that zoom. A request at zoom z uses the smallest level >= z,
+# whose tolerance is never coarser than what z can display; above the
+# last level the original geometries are used.
+SIMPLIFY_ZOOMS = (4, 8, 12)
+SIMPLIFY_PIXELS = 0.5
+
+# Meters per pixel of a 256px web-mercator tile at zoom 0 (equator)
+ZOOM0_RESOLUTION = 156543.03392804097
+
+
+def simplify_tolerance(zoom: int) -> float:
+    """Tolerance in degrees for a zoom level"""
+    return 360.0 / (256 * (1 << zoom)) * SIMPLIFY_PIXELS
+
+
+def zoom_for_resolution(resolution: float) -> int:
+    """Web-mercator zoom whose pixel size (meters) is at most ``resolution``"""
+    return max(0, math.ceil(math.log2(ZOOM0_RESOLUTION / resolution)))
+
+
+def level_for_zoom(levels: Optional[List[int]], zoom: Optional[int]) -> Optional[int]:
+    """Stored simplification level to read at ``zoom``, None for full detail"""
+    if zoom is None:
+        return None
+    candidates = [level for level in levels or () if level >= zoom]
+    return min(candidates) if candidates else None
+
+
+SIMPLIFY_QUERY = text("""
+    INSERT INTO layer_feature_levels (feature_id, zoom, layer_id, geom)
+    SELECT id, :zoom, layer_id, simplified
+    FROM (
+        SELECT id, layer_id, geom, ST_SimplifyPreserveTopology(geom, :tolerance) AS simplified
+        FROM layer_features
+        WHERE layer_id = :layer_id AND ST_NPoints(geom) > 4
+    ) s
+    WHERE NOT ST_IsEmpty(simplified) AND ST_NPoints(simplified) < ST_NPoints(geom)
+""")
+
+
+def build_simplified_levels(
+    db: Session,
+    layer_id: int,
+    zooms=SIMPLIFY_ZOOMS,
+    progress: Optional[Callable[[int], None]] = None,
+) -> dict:
+    """
+    (Re)build the simplified geometries of a layer, coarse zooms first.
+    Returns the levels and the number of geometries stored per level.
+    """
+    db.execute(text("DELETE FROM layer_feature_levels WHERE layer_id = :layer_id"), {"layer_id": layer_id})
+    stored = {}
+    for zoom in sorted(zooms):
+        result = db.execute(
+            SIMPLIFY_QUERY,
+            {"layer_id": layer_id, "zoom": zoom, "tolerance": simplify_tolerance(zoom)},
+        )
+        stored[str(zoom)] = result.rowcount
+        if progress:
+            progress(zoom)
+    return {"levels": sorted(zooms), "stored": stored}
+
+
+# Geometry of a feature at the requested level (NULL level: original)
+_LEVEL_JOIN = """
+        LEFT JOIN layer_feature_levels l
+               ON l.feature_id = f.id AND l.zoom = CAST(:level AS smallint)"""
+
+FEATURES_QUERY = text("""
+    SELECT json_build_object(
+        'type', 'FeatureCollection',
+        'features', COALESCE(json_agg(json_build_object(
+            'type', 'Feature',
+            'id', q.id,
+            'geometry', ST_AsGeoJSON(q.geom, :precision)::json,
+            'properties', q.properties
+        )), '[]'::json)
+    )::text
+    FROM (
+        SELECT f.id, f.properties, COALESCE(l.geom, f.geom) AS geom
+        FROM layer_features f""" + _LEVEL_JOIN + """
+        WHERE f.layer_id = :layer_id
+          AND (CAST(:minx AS float8) IS NULL
+               OR f.geom && ST_MakeEnvelope(:minx, :miny, :maxx, :maxy, 4326))
+        ORDER BY f.id
+        LIMIT :limit
+    ) q
+""")
+
+
+def precision_for_zoom(zoom: Optional[int]) -> int:
+    """Decimal digits of coordinates that still resolve a pixel at ``zoom``"""
+    if zoom is None:
+        return 7
+    return max(1, min(7, math.ceil(math.log10(1 / simplify_tolerance(zoom)))))
+
+
+def features_geojson(
+    db: Session,
+    layer_id: int,
+    level: Optional[int] = None,
+    bbox: Optional[List[float]] = None,
+    limit: int = 10000,
+    precision: int = 7,
+) -> str:
+    """FeatureCollection of a layer at a simplification level, built by PostGIS"""
+    minx, miny, maxx, maxy = bbox if bbox else (None, None, None, None)
+    return db.execute(
+        FEATURES_QUERY,
+        {
+            "layer_id": layer_id, "level": level, "limit": limit, "precision": precision,
+            "minx": minx, "miny": miny, "maxx": maxx, "maxy": maxy,
+        },
+    ).scalar()
+
+
+# Mapbox Vector Tile of one layer. Geometries are clipped to the tile with
+# a buffer and encoded in tile coordinates by PostGIS; the simplified
+# level matching the tile zoom is used when there is one.
+MVT_QUERY = text("""
+    WITH bounds AS (
+        SELECT ST_TileEnvelope(:z, :x, :y) AS geom
+    ),
+    features AS (
+        SELECT f.id,
+               f.properties,
+               ST_AsMVTGeom(ST_Transform(COALESCE(l.geom, f.geom), 3857), bounds.geom, :extent, :buffer, true) AS geom
+        FROM layer_features f
+        CROSS JOIN bounds""" + _LEVEL_JOIN + """
+        WHERE f.layer_id = :layer_id
+          AND f.geom && ST_Transform(bounds.geom, 4326)
+    )
+    SELECT ST_AsMVT(features, :name, :extent, 'geom', 'id')
+    FROM features
+    WHERE geom IS NOT NULL
+""")
+
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+
+def render_mvt(
+    db: Session, layer_id: int, z: int, x: int, y: int,
+    name: str = "features", level: Optional[int] = None,
+) -> bytes:
+    row = db.execute(
+        MVT_QUERY,
+        {
+            "layer_id": layer_id, "z": z, "x": x, "y": y, "name": name, "level": level,
+            "extent": MVT_EXTENT, "buffer": MVT_BUFFER,
+        },
+    ).first()
+    return bytes(row[0]) if row and row[0] is not None else b""
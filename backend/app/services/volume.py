@@ -0,0 +1,392 @@
+"""
+Cut/fill volumes inside a polygon.
+
+The surface is a DEM (GeoTIFF layer, read from its COG) or a point cloud
+(octree, gridded to mean elevation per cell), measured against a
+horizontal base plane, the lowest point inside the polygon or a second
+surface resampled onto the same grid. As in earthworks, cut is the
+material above the base (to be removed) and fill the space below it (to
+be filled); net is cut - fill.
+
+The grid is the DEM's own pixel grid (or a regular grid over the polygon
+for point clouds) clipped to the polygon bounds. The polygon is
+rasterized once over it, then the grid is cut into tiles; tiles without a
+masked cell are dropped, so only the raster windows / octree nodes under
+the polygon are ever read. Each tile returns a few sums computed with
+vectorized NumPy, and tiles run in parallel in a process pool.
+
+Elevations are assumed to be in meters; horizontal units come from the
+CRS (geographic grids use the ellipsoidal area of each row of cells).
+"""
+import math
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app import models
+from app.core.config import settings
+from app.models.layer import LayerFormat
+from app.services import geodesy, pointcloud, storage
+from app.utils.crs import crs_units, transform_coords
+
+TILE_SIZE = 1024  # Cells per tile side (two COG blocks)
+MAX_CELLS = 100_000_000  # Grid cells under the polygon bounds
+
+# Point clouds: the default cell size gives about this many points per cell
+POINTS_PER_CELL = 4
+
+
+class VolumeError(ValueError):
+    pass
+
+
+class SurfaceNotReady(VolumeError):
+    """The layer's derived data (COG, octree) is not built yet"""
+
+
+class Grid:
+    """North-up grid: origin at the top-left corner, cell size in CRS units"""
+
+    __slots__ = ("crs", "x0", "y0", "res_x", "res_y", "rows", "cols", "geographic", "unit_factor")
+
+    def __init__(self, crs, x0, y0, res_x, res_y, rows, cols, geographic=False, unit_factor=1.0):
+        self.crs = crs
+        self.x0, self.y0 = float(x0), float(y0)
+        self.res_x, self.res_y = float(res_x), float(res_y)
+        self.rows, self.cols = int(rows), int(cols)
+        self.geographic = geographic
+        self.unit_factor = unit_factor
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    @property
+    def bounds(self) -> List[float]:
+        return [
+            self.x0, self.y0 - self.rows * self.res_y,
+            self.x0 + self.cols * self.res_x, self.y0,
+        ]
+
+    def tile(self, row: int, col: int, rows: int, cols: int) -> "Grid":
+        return Grid(
+            self.crs, self.x0 + col * self.res_x, self.y0 - row * self.res_y,
+            self.res_x, self.res_y, rows, cols, self.geographic, self.unit_factor,
+        )
+
+    def cell_areas(self) -> np.ndarray:
+        """Area in m² of the cells, (rows, 1) so it broadcasts over a row"""
+        if not self.geographic:
+            area = self.res_x * self.res_y * self.unit_factor ** 2
+            return np.full((self.rows, 1), area)
+        # Cells are spherical quadrangles on the authalic sphere
+        edges = self.y0 - np.arange(self.rows + 1) * self.res_y
+        beta = geodesy.authalic_latitude(np.radians(edges))
+        band = np.abs(np.sin(beta[:-1]) - np.sin(beta[1:]))
+        return (geodesy.AUTHALIC_RADIUS ** 2 * math.radians(self.res_x) * band)[:, np.newaxis]
+
+
+# Surfaces: {"kind": "raster" | "octree", "path": ..., "crs": ...}
+def surface_for_layer(layer: models.Layer) -> Dict[str, Any]:
+    """Surface description of a DEM or point-cloud layer"""
+    metadata = layer.layer_metadata or {}
+    crs = layer.crs or metadata.get("crs_wkt")
+    if layer.format == LayerFormat.GEOTIFF:
+        if layer.processed_path and os.path.exists(layer.processed_path):
+            path = layer.processed_path
+        else:
+            path = storage.gdal_path(layer.file_path)
+        surface = {"kind": "raster", "path": path, "crs": crs}
+    elif layer.format in (LayerFormat.LAS, LayerFormat.LAZ):
+        if not layer.processed_path or not os.path.exists(os.path.join(layer.processed_path, pointcloud.OCTREE_FILE)):
+            raise SurfaceNotReady("Point cloud is not processed yet")
+        surface = {"kind": "octree", "path": layer.processed_path, "crs": crs}
+    else:
+        raise VolumeError("Volumes need a GeoTIFF DEM or a point-cloud layer")
+    if not crs:
+        raise SurfaceNotReady("The layer has no CRS yet")
+    return surface
+
+
+def sample_surface(surface: Dict[str, Any], grid: Grid) -> np.ma.MaskedArray:
+    """Elevations of a surface on a grid, masked where it has no data"""
+    if surface["kind"] == "raster":
+        return _sample_raster(surface["path"], grid)
+    return _sample_octree(surface["path"], grid)
+
+
+def _sample_raster(path: str, grid: Grid) -> np.ma.MaskedArray:
+    import rasterio
+    from rasterio.crs import CRS
+    from rasterio.enums import Resampling
+    from rasterio.transform import from_origin
+    from rasterio.vrt import WarpedVRT
+    from rasterio.windows import Window
+
+    with rasterio.open(path) as src:
+        col = (grid.x0 - src.transform.c) / src.transform.a
+        row = (src.transform.f - grid.y0) / -src.transform.e
+        aligned = (
+            src.crs == CRS.from_user_input(grid.crs)
+            and math.isclose(src.transform.a, grid.res_x) and math.isclose(-src.transform.e, grid.res_y)
+            and math.isclose(col, round(col), abs_tol=1e-6) and math.isclose(row, round(row), abs_tol=1e-6)
+        )
+        if aligned:
+            window = Window(round(col), round(row), grid.cols, grid.rows)
+            inside = (
+                window.col_off >= 0 and window.row_off >= 0
+                and window.col_off + grid.cols <= src.width and window.row_off + grid.rows <= src.height
+            )
+            data = src.read(1, window=window, masked=True, boundless=not inside)
+        else:
+            transform = from_origin(grid.x0, grid.y0, grid.res_x, grid.res_y)
+            with WarpedVRT(
+                src, crs=grid.crs, transform=transform, width=grid.cols, height=grid.rows,
+                resampling=Resampling.bilinear,
+            ) as vrt:
+                data = vrt.read(1, masked=True)
+    data = data.astype(np.float64)
+    return np.ma.masked_invalid(data)
+
+
+def _sample_octree(path: str, grid: Grid) -> np.ma.MaskedArray:
+    """Mean elevation of the points falling in each cell"""
+    octree = pointcloud.load_octree(path)
+    sums = np.zeros(grid.rows * grid.cols, dtype=np.float64)
+    counts = np.zeros(grid.rows * grid.cols, dtype=np.int64)
+    for points in pointcloud.select_points(octree, grid.bounds, max_points=sys.maxsize):
+        x = points["x"] * octree.scale[0] + octree.offset[0]
+        y = points["y"] * octree.scale[1] + octree.offset[1]
+        z = points["z"] * octree.scale[2] + octree.offset[2]
+        col = np.floor((x - grid.x0) / grid.res_x).astype(np.int64)
+        row = np.floor((grid.y0 - y) / grid.res_y).astype(np.int64)
+        inside = (col >= 0) & (col < grid.cols) & (row >= 0) & (row < grid.rows)
+        cells = row[inside] * grid.cols + col[inside]
+        sums += np.bincount(cells, weights=z[inside], minlength=sums.size)
+        counts += np.bincount(cells, minlength=counts.size)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = sums / counts
+    return np.ma.masked_array(mean, mask=counts == 0).reshape(grid.rows, grid.cols)
+
+
+def rasterize(polygons: List[List[np.ndarray]], grid: Grid) -> np.ndarray:
+    """
+    Boolean mask of the cells whose center is inside the polygons (lists
+    of rings in grid CRS coordinates, shell first). Drawn with Pillow, in C.
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("1", (grid.cols, grid.rows), 0)
+    draw = ImageDraw.Draw(image)
+    for rings in polygons:
+        for i, ring in enumerate(rings):
+            # Pixel centers sit at integer coordinates for Pillow
+            px = (ring[:, 0] - grid.x0) / grid.res_x - 0.5
+            py = (grid.y0 - ring[:, 1]) / grid.res_y - 0.5
+            draw.polygon(list(zip(px.tolist(), py.tolist())), fill=1 if i == 0 else 0)
+    return np.asarray(image, dtype=bool)
+
+
+def tile_sums(
+    surface: Dict[str, Any], base: Dict[str, Any], grid: Grid, mask: np.ndarray
+) -> Dict[str, float]:
+    """
+    Partial sums of one tile. ``base`` is {"plane": z}, {"surface": ...}
+    or {"lowest": True}; with the latter the cut is derived afterwards
+    from the elevation sums and the overall minimum.
+    """
+    z = sample_surface(surface, grid)
+    valid = mask & ~np.ma.getmaskarray(z)
+    depth = None
+    if "surface" in base:
+        base_z = sample_surface(base["surface"], grid)
+        valid &= ~np.ma.getmaskarray(base_z)
+        depth = z.data - base_z.data
+    elif "plane" in base:
+        depth = z.data - base["plane"]
+
+    areas = np.broadcast_to(grid.cell_areas(), z.shape)[valid]
+    elevations = z.data[valid]
+    sums = {
+        "cells": int(valid.sum()),
+        "nodata_cells": int(mask.sum()) - int(valid.sum()),
+        "area": float(areas.sum()),
+        "z_area": float((elevations * areas).sum()),
+        "min": float(elevations.min()) if elevations.size else None,
+        "max": float(elevations.max()) if elevations.size else None,
+        "cut": 0.0,
+        "fill": 0.0,
+    }
+    if depth is not None:
+        depth = depth[valid]
+        sums["cut"] = float((np.clip(depth, 0, None) * areas).sum())
+        sums["fill"] = float((np.clip(-depth, 0, None) * areas).sum())
+    return sums
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if settings.VOLUME_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the API process runs threads, forking it is unsafe
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.VOLUME_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _polygon_rings(geometry: Dict[str, Any], crs: str) -> List[List[np.ndarray]]:
+    """Polygons of a GeoJSON (WGS84) geometry as rings in ``crs``"""
+    kind = geometry.get("type")
+    if kind == "Polygon":
+        polygons = [geometry["coordinates"]]
+    elif kind == "MultiPolygon":
+        polygons = geometry["coordinates"]
+    else:
+        raise VolumeError("A Polygon or MultiPolygon is required")
+    out = []
+    for rings in polygons:
+        projected = []
+        for ring in rings:
+            coords = np.asarray([p[:2] for p in ring], dtype=np.float64)
+            x, y = transform_coords(coords[:, 0], coords[:, 1], "EPSG:4326", crs)
+            projected.append(np.column_stack([x, y]))
+        out.append(projected)
+    return out
+
+
+def _raster_grid(path: str, crs: str, polygons: List[List[np.ndarray]]) -> Grid:
+    """Pixels of the DEM under the bounds of the polygons"""
+    import rasterio
+
+    with rasterio.open(path) as src:
+        transform = src.transform
+        if transform.b or transform.d:
+            raise VolumeError("Rotated rasters are not supported")
+        res_x, res_y = transform.a, -transform.e
+        points = np.concatenate([ring for rings in polygons for ring in rings])
+        col0 = max(0, math.floor((points[:, 0].min() - transform.c) / res_x))
+        col1 = min(src.width, math.ceil((points[:, 0].max() - transform.c) / res_x))
+        row0 = max(0, math.floor((transform.f - points[:, 1].max()) / res_y))
+        row1 = min(src.height, math.ceil((transform.f - points[:, 1].min()) / res_y))
+    if col1 <= col0 or row1 <= row0:
+        raise VolumeError("The polygon does not overlap the surface")
+    geographic, unit_factor = crs_units(crs)
+    return Grid(
+        crs, transform.c + col0 * res_x, transform.f - row0 * res_y, res_x, res_y,
+        row1 - row0, col1 - col0, geographic, unit_factor,
+    )
+
+
+def _octree_grid(path: str, crs: str, polygons: List[List[np.ndarray]], resolution: Optional[float]) -> Grid:
+    """Regular grid over the polygon bounds, snapped to multiples of the cell size"""
+    octree = pointcloud.load_octree(path)
+    minx, miny, _, maxx, maxy, _ = octree.info["data_bounds"]
+    if resolution is None:
+        # Average point spacing of the whole cloud, times POINTS_PER_CELL
+        area = max((maxx - minx) * (maxy - miny), 1e-12)
+        resolution = math.sqrt(area / max(octree.info["points"], 1) * POINTS_PER_CELL)
+    points = np.concatenate([ring for rings in polygons for ring in rings])
+    x0 = max(points[:, 0].min(), minx)
+    x1 = min(points[:, 0].max(), maxx)
+    y0 = max(points[:, 1].min(), miny)
+    y1 = min(points[:, 1].max(), maxy)
+    if x1 <= x0 or y1 <= y0:
+        raise VolumeError("The polygon does not overlap the surface")
+    x0 = math.floor(x0 / resolution) * resolution
+    top = math.ceil(y1 / resolution) * resolution
+    cols = max(1, math.ceil((x1 - x0) / resolution))
+    rows = max(1, math.ceil((top - y0) / resolution))
+    geographic, unit_factor = crs_units(crs)
+    return Grid(crs, x0, top, resolution, resolution, rows, cols, geographic, unit_factor)
+
+
+def compute_volume(
+    geometry: Dict[str, Any],
+    surface: Dict[str, Any],
+    base: Dict[str, Any],
+    resolution: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Cut (above ``base``) and fill (below it) in m³ of ``surface`` inside
+    a WGS84 polygon.
+    Surfaces carry their ``kind``, ``path`` and ``crs``; a point-cloud
+    base must share the CRS of the surface. Raises VolumeError.
+    """
+    crs = surface["crs"]
+    polygons = _polygon_rings(geometry, crs)
+    if surface["kind"] == "raster":
+        grid = _raster_grid(surface["path"], crs, polygons)
+    else:
+        grid = _octree_grid(surface["path"], crs, polygons, resolution)
+    if "surface" in base and base["surface"]["kind"] == "octree" and base["surface"]["crs"] != crs:
+        raise VolumeError("A point-cloud base surface must use the CRS of the measured surface")
+    if grid.rows * grid.cols > MAX_CELLS:
+        raise VolumeError("The polygon covers too many cells of the surface")
+
+    mask = rasterize(polygons, grid)
+    tasks = []
+    for row in range(0, grid.rows, TILE_SIZE):
+        for col in range(0, grid.cols, TILE_SIZE):
+            tile_mask = mask[row:row + TILE_SIZE, col:col + TILE_SIZE]
+            if tile_mask.any():
+                tile = grid.tile(row, col, *tile_mask.shape)
+                tasks.append((surface, base, tile, np.ascontiguousarray(tile_mask)))
+    if not tasks:
+        raise VolumeError("The polygon does not cover any cell of the surface")
+
+    pool = _get_pool()
+    if pool is None or len(tasks) == 1:
+        partials = [tile_sums(*task) for task in tasks]
+    else:
+        partials = list(pool.map(tile_sums, *zip(*tasks)))
+
+    totals = {key: sum(p[key] for p in partials) for key in ("cells", "nodata_cells", "area", "z_area", "cut", "fill")}
+    minimums = [p["min"] for p in partials if p["min"] is not None]
+    maximums = [p["max"] for p in partials if p["max"] is not None]
+    if not totals["cells"]:
+        raise VolumeError("The surface has no data inside the polygon")
+    lowest = min(minimums)
+    base_elevation = base.get("plane")
+    if base.get("lowest"):
+        # Volume above the plane through the lowest point (a stockpile): no fill
+        base_elevation = lowest
+        totals["cut"] = max(0.0, totals["z_area"] - lowest * totals["area"])
+        totals["fill"] = 0.0
+
+    return {
+        "cut": totals["cut"],
+        "fill": totals["fill"],
+        "net": totals["cut"] - totals["fill"],
+        "area": totals["area"],
+        "cells": totals["cells"],
+        "nodata_cells": totals["nodata_cells"],
+        "resolution": [grid.res_x, grid.res_y],
+        "base_elevation": base_elevation,
+        "min_elevation": lowest,
+        "max_elevation": max(maximums),
+        "tiles": len(tasks),
+    }
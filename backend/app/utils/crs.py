@@ -0,0 +1,69 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def transform_bounds(
+    bounds: Sequence[float], src_crs: str, dst_crs: str = "EPSG:4326"
+) -> Optional[List[float]]:
+    """
+    Transform [minx, miny, maxx, maxy] between coordinate systems.
+    Returns None when pyproj is not installed or the CRS is unknown.
+    """
+    if src_crs == dst_crs:
+        return list(bounds)
+    try:
+        from pyproj import Transformer
+    except ImportError:
+        return None
+    try:
+        transformer = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+        return list(transformer.transform_bounds(*bounds))
+    except Exception:
+        return None
+
+
+def transform_coords(
+    x: Sequence[float], y: Sequence[float], src_crs: str, dst_crs: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Transform coordinate arrays between coordinate systems (x/y order,
+    i.e. lon/lat for geographic ones). Raises ValueError when pyproj is
+    not installed or a CRS is unknown.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if src_crs == dst_crs:
+        return x, y
+    try:
+        from pyproj import Transformer
+    except ImportError:
+        raise ValueError("pyproj is required to transform coordinates")
+    try:
+        transformer = Transformer.from_crs(src_crs, dst_crs, always_xy=True)
+    except Exception as e:
+        raise ValueError(f"Unknown CRS: {e}") from e
+    tx, ty = transformer.transform(x, y)
+    return np.asarray(tx, dtype=np.float64), np.asarray(ty, dtype=np.float64)
+
+
+def crs_units(crs: str) -> Tuple[bool, float]:
+    """
+    (is geographic, meters per horizontal unit) of a CRS. The factor is
+    1.0 for geographic ones, whose units are degrees. Raises ValueError
+    when pyproj is not installed or the CRS is unknown.
+    """
+    if crs in ("EPSG:4326", "OGC:CRS84"):
+        return True, 1.0
+    try:
+        from pyproj import CRS
+    except ImportError:
+        raise ValueError("pyproj is required to read CRS units")
+    try:
+        parsed = CRS.from_user_input(crs)
+    except Exception as e:
+        raise ValueError(f"Unknown CRS: {e}") from e
+    if parsed.is_geographic:
+        return True, 1.0
+    axis = parsed.axis_info[0] if parsed.axis_info else None
+    return False, float(axis.unit_conversion_factor) if axis else 1.0
@@ -0,0 +1,312 @@
+"""
+File server for uploaded data (mounted at /static).
+
+Compared to Starlette's StaticFiles it adds what large geodata needs:
+- HTTP Range / If-Range, including multipart/byteranges, so clients can
+  range-read COG or FlatGeobuf files
+- strong ETags from the content SHA-256 (digest sidecar written at upload)
+- ``Cache-Control: immutable`` for UUID-named (never rewritten) files
+- precompressed ``.br`` / ``.gz`` siblings generated at ingest, picked
+  from Accept-Encoding instead of compressing on every request
+
+With object storage (``StorageRedirect``) requests are redirected to
+presigned URLs instead, so the storage service serves the bytes (ranges
+included) without going through the API.
+"""
+import mimetypes
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import AsyncIterator, List, Optional, Tuple
+from uuid import uuid4
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import RedirectResponse, Response, StreamingResponse
+from starlette.routing import get_route_path
+from starlette.types import Receive, Scope, Send
+
+from app.utils.files import COMPRESSED_SUFFIXES, read_digest
+
+READ_CHUNK = 256 * 1024
+# More ranges than this (after merging) are ignored: the whole file is sent
+MAX_RANGES = 50
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+UUID_NAME = re.compile(
+    r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{64})(\.[A-Za-z0-9]+)?$"
+)
+
+# Formats that are not in the mimetypes registry
+EXTRA_TYPES = {
+    ".geojson": "application/geo+json",
+    ".kml": "application/vnd.google-earth.kml+xml",
+    ".kmz": "application/vnd.google-earth.kmz",
+    ".fgb": "application/octet-stream",
+    ".las": "application/octet-stream",
+    ".laz": "application/octet-stream",
+}
+
+
+def media_type_for(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    return EXTRA_TYPES.get(ext) or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def parse_ranges(value: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `bytes=` Range header into inclusive (start, end) pairs.
+    Returns None if the header is malformed (ignored per RFC 9110) and an
+    empty list if no range is satisfiable.
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start_s, sep, end_s = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                # Suffix range: last N bytes
+                length = int(end_s)
+                if length <= 0:
+                    continue
+                ranges.append((max(size - length, 0), size - 1))
+                continue
+            start = int(start_s)
+            end = int(end_s) if end_s else size - 1
+        except ValueError:
+            return None
+        if end_s and start > end:
+            return None
+        if start >= size:
+            continue
+        ranges.append((start, min(end, size - 1)))
+    return ranges
+
+
+def merge_ranges(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    Sort ranges and coalesce those that overlap or touch (RFC 9110 allows
+    it), so no byte is sent twice.
+    """
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def accepted_encodings(header: Optional[str]) -> List[str]:
+    """Content codings accepted by the client (q > 0)"""
+    result = []
+    for item in (header or "").split(","):
+        name, _, params = item.strip().partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            key, _, val = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(val)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            result.append(name)
+    return result
+
+
+async def _file_chunks(path: str, start: int, length: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            data = await f.read(min(READ_CHUNK, remaining))
+            if not data:
+                break
+            remaining -= len(data)
+            yield data
+
+
+class UploadFiles:
+    """ASGI app serving the files of a directory"""
+
+    def __init__(self, directory: str):
+        self.directory = os.path.realpath(directory)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        response = await self.get_response(scope)
+        await response(scope, receive, send)
+
+    def resolve(self, scope: Scope) -> Optional[str]:
+        """Absolute path of the requested file, None if not servable"""
+        parts = [p for p in get_route_path(scope).split("/") if p]
+        if not parts or any(p.startswith(".") for p in parts):
+            return None  # Hidden entries (partial uploads, digests) are private
+        path = os.path.realpath(os.path.join(self.directory, *parts))
+        if not path.startswith(self.directory + os.sep):
+            return None
+        return path
+
+    async def get_response(self, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return Response("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        path = self.resolve(scope)
+        try:
+            st = await anyio.to_thread.run_sync(os.stat, path) if path else None
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            return Response("Not Found", status_code=404)
+
+        request_headers = Headers(scope=scope)
+        digest = await anyio.to_thread.run_sync(read_digest, path)
+        # Strong validator from the content hash, weak one until it is known
+        etag = f'"{digest}"' if digest else f'W/"{st.st_size:x}-{st.st_mtime_ns:x}"'
+        last_modified = formatdate(st.st_mtime, usegmt=True)
+        name = os.path.basename(path)
+        headers = {
+            "ETag": etag,
+            "Last-Modified": last_modified,
+            "Cache-Control": IMMUTABLE_CACHE if UUID_NAME.match(name) else REVALIDATE_CACHE,
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept-Encoding",
+        }
+        media_type = media_type_for(path)
+
+        if self.is_not_modified(request_headers, etag, st.st_mtime):
+            return Response(status_code=304, headers=headers)
+
+        range_header = request_headers.get("range")
+        if range_header and self.if_range_matches(request_headers, etag, last_modified):
+            ranges = parse_ranges(range_header, st.st_size)
+            if ranges is not None:
+                return self.range_response(scope, path, st.st_size, ranges, media_type, headers)
+        elif not range_header:
+            # Whole file: prefer a precompressed variant
+            for encoding in ("br", "gzip"):
+                if encoding not in accepted_encodings(request_headers.get("accept-encoding")):
+                    continue
+                variant = path + COMPRESSED_SUFFIXES[encoding]
+                try:
+                    variant_size = (await anyio.to_thread.run_sync(os.stat, variant)).st_size
+                except OSError:
+                    continue
+                headers["Content-Encoding"] = encoding
+                headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+                return self.file_response(scope, variant, 0, variant_size, media_type, headers)
+
+        return self.file_response(scope, path, 0, st.st_size, media_type, headers)
+
+    @staticmethod
+    def is_not_modified(headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = headers.get("if-none-match")
+        if if_none_match:
+            # Weak comparison, also matching the compressed variants
+            tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+            base = etag.removeprefix("W/")[:-1]
+            return "*" in tags or any(t == etag.removeprefix("W/") or t.startswith(base + "-") for t in tags)
+        if_modified_since = headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    @staticmethod
+    def if_range_matches(headers: Headers, etag: str, last_modified: str) -> bool:
+        """Range is honoured only if If-Range (when present) still matches"""
+        if_range = headers.get("if-range")
+        if not if_range:
+            return True
+        if if_range.startswith('"') or if_range.startswith("W/"):
+            # Strong comparison is required for ranges
+            return not etag.startswith("W/") and if_range == etag
+        return if_range == last_modified
+
+    @staticmethod
+    def file_response(
+        scope: Scope, path: str, start: int, length: int, media_type: str, headers: dict,
+        status_code: int = 200,
+    ) -> Response:
+        headers = {**headers, "Content-Length": str(length)}
+        if scope["method"] == "HEAD":
+            return Response(status_code=status_code, headers=headers, media_type=media_type)
+        return StreamingResponse(
+            _file_chunks(path, start, length), status_code=status_code,
+            headers=headers, media_type=media_type,
+        )
+
+    def range_response(
+        self, scope: Scope, path: str, size: int, ranges: List[Tuple[int, int]],
+        media_type: str, headers: dict,
+    ) -> Response:
+        if not ranges:
+            return Response(
+                status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        ranges = merge_ranges(ranges)
+        if len(ranges) > MAX_RANGES:
+            return self.file_response(scope, path, 0, size, media_type, headers)
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers = {**headers, "Content-Range": f"bytes {start}-{end}/{size}"}
+            return self.file_response(scope, path, start, end - start + 1, media_type, headers, 206)
+
+        boundary = uuid4().hex
+        part_headers = [
+            (
+                f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        length = sum(len(h) + (end - start + 1) + 2 for h, (start, end) in zip(part_headers, ranges))
+        length += len(closing) - 2  # The first part has no leading CRLF
+
+        async def body() -> AsyncIterator[bytes]:
+            for i, (part_header, (start, end)) in enumerate(zip(part_headers, ranges)):
+                yield (b"\r\n" if i else b"") + part_header
+                async for data in _file_chunks(path, start, end - start + 1):
+                    yield data
+            yield closing
+
+        headers = {**headers, "Content-Length": str(length)}
+        multipart_type = f"multipart/byteranges; boundary={boundary}"
+        if scope["method"] == "HEAD":
+            return Response(status_code=206, headers=headers, media_type=multipart_type)
+        return StreamingResponse(body(), status_code=206, headers=headers, media_type=multipart_type)
+
+
+class StorageRedirect:
+    """ASGI app redirecting file requests to presigned object-storage URLs"""
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        assert scope["type"] == "http"
+        response = await self.get_response(scope)
+        await response(scope, receive, send)
+
+    async def get_response(self, scope: Scope) -> Response:
+        if scope["method"] not in ("GET", "HEAD"):
+            return Response("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        parts = [p for p in get_route_path(scope).split("/") if p]
+        if not parts or any(p.startswith(".") for p in parts):
+            return Response("Not Found", status_code=404)  # Direct uploads in progress are private
+        # Signing is local: no request to the storage service
+        url = self.storage.download_url("/".join(parts))
+        return RedirectResponse(url, status_code=307, headers={"Cache-Control": "no-store"})
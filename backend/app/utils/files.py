@@ -0,0 +1,115 @@
+import gzip
+import hashlib
+import os
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+
+def resolve_data_dir(path: str) -> str:
+    """
+    Resolve a data directory from settings and make sure it exists.
+    Relative paths are resolved against the backend root (CWD).
+    """
+    if not os.path.isabs(path):
+        path = os.path.join(os.getcwd(), path)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def layer_artifacts_root(layer_id: int) -> str:
+    """Directory holding every derived artifact of a layer"""
+    return os.path.join(resolve_data_dir(settings.PROCESSED_DIR), "layers", str(layer_id))
+
+
+def layer_artifact_dir(layer_id: int, name: str) -> str:
+    """
+    Directory for a derived artifact of a layer (octree, COG, ...)
+    under PROCESSED_DIR. The directory itself is not created.
+    """
+    return os.path.join(layer_artifacts_root(layer_id), name)
+
+
+# Sidecar files next to uploads: SHA-256 digests in a hidden directory
+# (never served) and precompressed siblings generated at ingest
+DIGEST_DIRNAME = ".digests"
+COMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def digest_path(file_path: str) -> str:
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, DIGEST_DIRNAME, f"{name}.sha256")
+
+
+def write_digest(file_path: str, sha256: str) -> None:
+    """Remember the content hash of a stored file"""
+    path = digest_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(sha256)
+
+
+def read_digest(file_path: str) -> Optional[str]:
+    try:
+        with open(digest_path(file_path)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def remove_stored_file(file_path: str) -> None:
+    """Delete an uploaded file together with its sidecar files"""
+    paths = [file_path, digest_path(file_path)]
+    paths += [file_path + suffix for suffix in COMPRESSED_SUFFIXES.values()]
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for data in iter(lambda: f.read(chunk_size), b""):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _compress_file(src_path: str, dst_path: str, encoding: str, chunk_size: int = 1024 * 1024) -> None:
+    if encoding == "gzip":
+        with open(src_path, "rb") as src, gzip.open(dst_path, "wb", compresslevel=9) as dst:
+            for data in iter(lambda: src.read(chunk_size), b""):
+                dst.write(data)
+        return
+    import brotli
+
+    compressor = brotli.Compressor(quality=11)
+    with open(src_path, "rb") as src, open(dst_path, "wb") as dst:
+        for data in iter(lambda: src.read(chunk_size), b""):
+            dst.write(compressor.process(data))
+        dst.write(compressor.finish())
+
+
+def write_compressed_variants(file_path: str) -> Dict[str, int]:
+    """
+    Write ``.br`` / ``.gz`` copies of a stored file, keeping only those
+    smaller than the original. Brotli is skipped when the module is not
+    installed. Returns the size of each kept variant by encoding.
+    """
+    original_size = os.path.getsize(file_path)
+    sizes = {}
+    for encoding, suffix in COMPRESSED_SUFFIXES.items():
+        variant = file_path + suffix
+        tmp = variant + ".tmp"
+        try:
+            _compress_file(file_path, tmp, encoding)
+        except ImportError:
+            continue
+        size = os.path.getsize(tmp)
+        if size < original_size:
+            os.replace(tmp, variant)
+            sizes[encoding] = size
+        else:
+            os.remove(tmp)
+    return sizes
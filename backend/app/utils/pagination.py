@@ -0,0 +1,103 @@
+"""
+Keyset pagination and streamed listings.
+
+Lists are ordered by ``(created_at, id)`` and a page starts right after
+the last row of the previous one, so every page costs one index range
+scan however deep it is. Cursors are opaque to clients: URL-safe base64 of
+the last row's sort key.
+
+Streamed listings read rows through a server-side cursor in batches and
+serialize them one by one, so a full export never holds the whole result.
+"""
+import base64
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, List, Optional, Sequence, Tuple, Type
+
+from pydantic import BaseModel
+from sqlalchemy import Select, tuple_
+
+from app.database import AsyncSessionLocal
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+GEOJSON_MEDIA_TYPE = "application/geo+json"
+GEOJSON_SEQ_MEDIA_TYPE = "application/geo+json-seq"
+
+STREAM_BATCH_SIZE = 1000
+
+
+def encode_cursor(created_at: datetime, id_: int) -> str:
+    raw = f"{created_at.isoformat()}|{id_}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Sort key encoded in a cursor; ValueError if it is malformed"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, id_ = raw.rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(id_)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def keyset(
+    stmt: Select,
+    model: Any,
+    after: Optional[Tuple[datetime, int]],
+    limit: Optional[int] = None,
+    skip: int = 0,
+) -> Select:
+    """
+    Order a query by (created_at, id) and start after a sort key. With a
+    limit, one extra row is fetched to tell whether a next page exists
+    (see ``split_page``). The deprecated offset ``skip`` only applies to
+    the first page: a cursor already says where the page starts.
+    """
+    stmt = stmt.order_by(model.created_at, model.id)
+    if after is not None:
+        stmt = stmt.where(tuple_(model.created_at, model.id) > tuple_(*after))
+    elif skip:
+        stmt = stmt.offset(skip)
+    if limit is not None:
+        stmt = stmt.limit(limit + 1)
+    return stmt
+
+
+def split_page(rows: Sequence[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """(rows of the page, cursor of the next page or None on the last page)"""
+    rows = list(rows)
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def ndjson_encoder(schema: Type[BaseModel]) -> Callable[[Any], bytes]:
+    """Row encoder producing one JSON document per line"""
+    def encode(row: Any) -> bytes:
+        return schema.model_validate(row).model_dump_json().encode() + b"\n"
+    return encode
+
+
+async def stream_scalars(
+    stmt: Select, encode: Callable[[Any], bytes], batch_size: int = STREAM_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Encoded rows of a query, read with a server-side cursor. Runs in its
+    own session: the request's session is closed before the body is sent.
+    """
+    async with AsyncSessionLocal() as session:
+        result = await session.stream_scalars(stmt.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield b"".join(encode(row) for row in partition)
+
+
+async def stream_feature_collection(stmt: Select, batch_size: int = STREAM_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """FeatureCollection around a query returning one GeoJSON Feature (text) per row"""
+    yield b'{"type":"FeatureCollection","features":['
+    first = True
+    async for chunk in stream_scalars(stmt, lambda feature: b"," + feature.encode(), batch_size):
+        # Every feature is preceded by a comma except the very first one
+        yield chunk[1:] if first else chunk
+        first = False
+    yield b"]}"
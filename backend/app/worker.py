@@ -0,0 +1,40 @@
+"""
+Standalone job worker.
+
+Run with ``python -m app.worker`` (from the backend root) to process the
+job queue outside the API processes, e.g. with JOB_WORKERS=0 for the API
+and JOB_WORKERS=N for this process.
+"""
+import logging
+import signal
+import threading
+
+from app.core.config import settings
+from app.core import metrics
+from app.services import jobs
+from app.services import ingest  # noqa: F401  (registers job handlers)
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    get_storage()  # Fails fast on an invalid storage configuration
+    stop = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+
+    if settings.METRICS_WORKER_PORT:
+        # Job durations and SQL stats of this process
+        metrics.start_http_server(settings.METRICS_WORKER_PORT)
+
+    pool = jobs.WorkerPool(max(settings.JOB_WORKERS, 1), settings.JOB_POLL_INTERVAL)
+    pool.start()
+    logger.info("Job worker started with %d threads", pool.size)
+    stop.wait()
+    pool.stop()
+
+
+if __name__ == "__main__":
+    main()
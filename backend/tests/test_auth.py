@@ -0,0 +1,133 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from passlib.hash import pbkdf2_sha256
+
+from app import models
+from app.api import deps
+from app.core import hashing, security
+from app.core.config import settings
+from app.main import app
+
+PASSWORD = "correct horse"
+
+
+class FakeSession:
+    def __init__(self, user):
+        self.user = user
+        self.commits = 0
+
+    async def scalar(self, statement):
+        return self.user
+
+    async def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture(autouse=True)
+def inline_hashing(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 0)
+    monkeypatch.setattr(hashing, "_slots", threading.BoundedSemaphore(2))
+
+
+@pytest.fixture
+def login():
+    def post(user, password=PASSWORD):
+        db = FakeSession(user)
+        app.dependency_overrides[deps.get_db] = lambda: db
+        try:
+            response = TestClient(app).post(
+                "/api/auth/login", data={"username": user.username, "password": password}
+            )
+        finally:
+            app.dependency_overrides.clear()
+        return response, db
+    return post
+
+
+def make_user(hashed_password):
+    return models.User(id=1, username="ana", hashed_password=hashed_password, is_active=True)
+
+
+def rounds(hashed_password):
+    return pbkdf2_sha256.from_string(hashed_password).rounds
+
+
+def test_hash_and_verify():
+    hashed = asyncio.run(hashing.hash_password(PASSWORD))
+    assert rounds(hashed) == settings.PASSWORD_HASH_ROUNDS
+    assert asyncio.run(hashing.verify_password(PASSWORD, hashed)) == (True, None)
+    assert asyncio.run(hashing.verify_password("wrong", hashed)) == (False, None)
+
+
+def test_busy_when_all_slots_taken():
+    assert hashing._slots.acquire(blocking=False)
+    assert hashing._slots.acquire(blocking=False)
+    with pytest.raises(hashing.HashingBusy):
+        asyncio.run(hashing.hash_password(PASSWORD))
+    hashing._slots.release()
+    # A finished hash gives its slot back
+    asyncio.run(hashing.hash_password(PASSWORD))
+    asyncio.run(hashing.hash_password(PASSWORD))
+
+
+def test_failed_hash_releases_slot():
+    for _ in range(3):
+        with pytest.raises(ValueError):
+            asyncio.run(hashing.verify_password(PASSWORD, "not a hash"))
+    asyncio.run(hashing.hash_password(PASSWORD))
+
+
+def test_process_pool(monkeypatch):
+    monkeypatch.setattr(settings, "PASSWORD_HASH_WORKERS", 1)
+    try:
+        hashed = asyncio.run(hashing.hash_password(PASSWORD))
+        assert security.verify_password(PASSWORD, hashed)
+    finally:
+        hashing.shutdown()
+
+
+def test_login_busy_returns_503(login):
+    user = make_user(security.get_password_hash(PASSWORD))
+    assert hashing._slots.acquire(blocking=False)
+    assert hashing._slots.acquire(blocking=False)
+    try:
+        response, db = login(user)
+    finally:
+        hashing._slots.release()
+        hashing._slots.release()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(hashing.RETRY_AFTER)
+    assert db.commits == 0
+
+
+def test_login_rehashes_outdated_hash(login):
+    old = pbkdf2_sha256.using(rounds=settings.PASSWORD_HASH_ROUNDS // 2).hash(PASSWORD)
+    user = make_user(old)
+    response, db = login(user)
+    assert response.status_code == 200
+    assert response.json()["access_token"]
+    assert db.commits == 1
+    assert user.hashed_password != old
+    assert rounds(user.hashed_password) == settings.PASSWORD_HASH_ROUNDS
+    assert security.verify_password(PASSWORD, user.hashed_password)
+
+
+def test_login_keeps_current_hash(login):
+    current = security.get_password_hash(PASSWORD)
+    user = make_user(current)
+    response, db = login(user)
+    assert response.status_code == 200
+    assert db.commits == 0
+    assert user.hashed_password == current
+
+
+def test_login_wrong_password(login):
+    old = pbkdf2_sha256.using(rounds=1000).hash(PASSWORD)
+    user = make_user(old)
+    response, db = login(user, password="wrong")
+    assert response.status_code == 400
+    assert db.commits == 0
+    assert user.hashed_password == old
@@ -0,0 +1,178 @@
+import gzip
+import re
+
+import pytest
+from starlette.testclient import TestClient
+
+from app.utils import file_server
+from app.utils.file_server import UploadFiles, merge_ranges, parse_ranges
+from app.utils.files import write_digest
+
+CONTENT = bytes(range(256)) * 40  # 10240 bytes
+NAME = "0f8b3c2a-5d1e-4f6a-9b7c-8e2d1a3f4b5c.geojson"
+SHA256 = "ab" * 32
+
+
+@pytest.fixture
+def client(tmp_path):
+    path = tmp_path / NAME
+    path.write_bytes(CONTENT)
+    (tmp_path / (NAME + ".gz")).write_bytes(gzip.compress(CONTENT))
+    (tmp_path / (NAME + ".br")).write_bytes(b"brotli")
+    write_digest(str(path), SHA256)
+    (tmp_path / "plain.txt").write_bytes(CONTENT)
+    # httpx asks for gzip by default
+    return TestClient(UploadFiles(str(tmp_path)), headers={"Accept-Encoding": "identity"})
+
+
+def multipart_parts(response):
+    """(Content-Range, body) of each part of a multipart/byteranges body"""
+    boundary = re.search(r"boundary=(\w+)", response.headers["content-type"]).group(1).encode()
+    parts = []
+    for chunk in response.content.split(b"--" + boundary)[1:-1]:
+        head, _, body = chunk.partition(b"\r\n\r\n")
+        content_range = re.search(rb"Content-Range: bytes (\S+)", head).group(1).decode()
+        parts.append((content_range, body.removesuffix(b"\r\n")))
+    return parts
+
+
+def test_parse_ranges():
+    size = 1000
+    assert parse_ranges("bytes=0-99", size) == [(0, 99)]
+    assert parse_ranges("bytes=900-", size) == [(900, 999)]
+    assert parse_ranges("bytes=-100", size) == [(900, 999)]
+    assert parse_ranges("bytes=-5000", size) == [(0, 999)]
+    assert parse_ranges("bytes=990-2000", size) == [(990, 999)]
+    assert parse_ranges("bytes=1000-", size) == []
+    assert parse_ranges("bytes=-0", size) == []
+    assert parse_ranges("bytes=5-1", size) is None
+    assert parse_ranges("items=0-1", size) is None
+    assert parse_ranges("bytes=a-b", size) is None
+
+
+def test_merge_ranges():
+    assert merge_ranges([(50, 99), (0, 9), (5, 20), (21, 30)]) == [(0, 30), (50, 99)]
+    assert merge_ranges([(0, 99), (10, 20)]) == [(0, 99)]
+
+
+def test_full_file(client):
+    response = client.get(f"/{NAME}")
+    assert response.status_code == 200
+    assert response.content == CONTENT
+    assert response.headers["etag"] == f'"{SHA256}"'
+    assert response.headers["cache-control"] == file_server.IMMUTABLE_CACHE
+    assert response.headers["content-type"] == "application/geo+json"
+
+
+def test_weak_etag_without_digest(client):
+    response = client.get("/plain.txt")
+    assert response.headers["etag"].startswith('W/"')
+    assert response.headers["cache-control"] == file_server.REVALIDATE_CACHE
+
+
+def test_hidden_entries_are_not_served(client):
+    assert client.get(f"/.digests/{NAME}.sha256").status_code == 404
+    assert client.get("/../etc/passwd").status_code == 404
+
+
+def test_single_range(client):
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+    assert response.content == CONTENT[100:200]
+
+
+def test_suffix_range(client):
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=-300"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes {len(CONTENT) - 300}-{len(CONTENT) - 1}/{len(CONTENT)}"
+    assert response.content == CONTENT[-300:]
+
+
+def test_unsatisfiable_range(client):
+    response = client.get(f"/{NAME}", headers={"Range": f"bytes={len(CONTENT)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_malformed_range_is_ignored(client):
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=9-3"})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_multipart_ranges(client):
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=0-9,-5,1000-1099"})
+    assert response.status_code == 206
+    assert response.headers["content-type"].startswith("multipart/byteranges; boundary=")
+    assert int(response.headers["content-length"]) == len(response.content)
+    size = len(CONTENT)
+    assert multipart_parts(response) == [
+        (f"0-9/{size}", CONTENT[0:10]),
+        (f"1000-1099/{size}", CONTENT[1000:1100]),
+        (f"{size - 5}-{size - 1}/{size}", CONTENT[-5:]),
+    ]
+
+
+def test_multipart_head_length_matches_get(client):
+    headers = {"Range": "bytes=0-9,20-29"}
+    get = client.get(f"/{NAME}", headers=headers)
+    head = client.head(f"/{NAME}", headers=headers)
+    assert head.status_code == 206
+    assert head.headers["content-length"] == get.headers["content-length"]
+
+
+def test_overlapping_ranges_are_merged(client):
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=0-99,50-149,150-199"})
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 0-199/{len(CONTENT)}"
+    assert response.content == CONTENT[:200]
+
+
+def test_too_many_ranges_send_the_whole_file(client):
+    spec = ",".join(f"{i * 10}-{i * 10}" for i in range(file_server.MAX_RANGES + 1))
+    response = client.get(f"/{NAME}", headers={"Range": f"bytes={spec}"})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+def test_if_range(client):
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=0-9", "If-Range": f'"{SHA256}"'})
+    assert response.status_code == 206
+    response = client.get(f"/{NAME}", headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == CONTENT
+
+
+@pytest.mark.parametrize("encoding, suffix", [("gzip", ".gz"), ("br", ".br")])
+def test_precompressed_variant(client, tmp_path, encoding, suffix):
+    response = client.get(f"/{NAME}", headers={"Accept-Encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["etag"] == f'"{SHA256}-{encoding}"'
+    if encoding == "gzip":
+        # httpx decodes gzip transparently
+        assert response.content == CONTENT
+    assert int(response.headers["content-length"]) == (tmp_path / (NAME + suffix)).stat().st_size
+
+
+@pytest.mark.parametrize("if_none_match", [
+    f'"{SHA256}"',
+    f'"{SHA256}-gzip"',
+    f'"{SHA256}-br"',
+    f'W/"{SHA256}-br"',
+    f'"other", "{SHA256}-gzip"',
+    "*",
+])
+def test_if_none_match(client, if_none_match):
+    response = client.get(f"/{NAME}", headers={"If-None-Match": if_none_match})
+    assert response.status_code == 304
+
+
+def test_if_none_match_other_etag(client):
+    response = client.get(f"/{NAME}", headers={"If-None-Match": '"other", "other-gzip"'})
+    assert response.status_code == 200
+
+
+def test_methods(client):
+    assert client.post(f"/{NAME}").status_code == 405
+    assert client.head(f"/{NAME}").headers["content-length"] == str(len(CONTENT))
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from app.models.layer import LayerFormat
+from app.services.vector import iter_features, iter_geojson_features
+
+POINT = {"type": "Point", "coordinates": [6.1, 46.2]}
+
+
+@pytest.fixture
+def write(tmp_path):
+    def write(document, name="layer.geojson"):
+        path = tmp_path / name
+        path.write_text(document if isinstance(document, str) else json.dumps(document))
+        return str(path)
+    return write
+
+
+def test_feature_collection(write):
+    path = write({
+        # "features" before "type", as some exporters write it
+        "features": [
+            {"type": "Feature", "geometry": POINT, "properties": {"name": "a", "depth": 1.5, "n": 2}},
+            {"type": "Feature", "geometry": None, "properties": None},
+        ],
+        "type": "FeatureCollection",
+    })
+    features = list(iter_features(path, LayerFormat.GEOJSON))
+    assert features == [
+        {"geometry": POINT, "properties": {"name": "a", "depth": 1.5, "n": 2}},
+        {"geometry": None, "properties": None},
+    ]
+    # Plain floats, so properties serialize to JSON
+    assert type(features[0]["properties"]["depth"]) is float
+    assert type(features[0]["geometry"]["coordinates"][0]) is float
+
+
+def test_features_are_streamed(write):
+    path = write({"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": POINT, "properties": {"i": i}} for i in range(3)
+    ]})
+    features = iter_geojson_features(path)
+    assert next(features)["properties"] == {"i": 0}
+    assert [f["properties"]["i"] for f in features] == [1, 2]
+
+
+def test_single_feature(write):
+    path = write({"type": "Feature", "geometry": POINT, "properties": {"name": "a"}})
+    assert list(iter_geojson_features(path)) == [{"geometry": POINT, "properties": {"name": "a"}}]
+
+
+def test_bare_geometry(write):
+    assert list(iter_geojson_features(write(POINT))) == [{"geometry": POINT, "properties": None}]
+
+
+@pytest.mark.parametrize("document", [
+    {"type": "FeatureCollection", "features": []},
+    {"type": "Topology"},
+    [1, 2],
+])
+def test_nothing_to_import(write, document):
+    assert list(iter_geojson_features(write(document))) == []
+
+
+def test_malformed(write):
+    with pytest.raises(ValueError):
+        list(iter_geojson_features(write('{"type": "FeatureCollection", "features": [')))
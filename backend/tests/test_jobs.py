@@ -0,0 +1,217 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app import models
+from app.core.config import settings
+from app.models.job import JobStatus
+from app.services import jobs
+
+
+@pytest.fixture
+def Session(monkeypatch):
+    # SQLite ignores FOR UPDATE, the locking clause is checked on the
+    # PostgreSQL rendering of the claim query instead
+    engine = create_engine(
+        "sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool
+    )
+    models.Job.__table__.create(engine)
+    factory = sessionmaker(bind=engine, expire_on_commit=False)
+    monkeypatch.setattr(jobs, "SessionLocal", factory)
+    monkeypatch.setattr(jobs, "_handlers", {})
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(settings, "JOB_RETRY_DELAY", 30)
+    monkeypatch.setattr(settings, "JOB_STALE_AFTER", 1800)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def db(Session):
+    session = Session()
+    yield session
+    session.close()
+
+
+def naive(value):
+    # SQLite hands back naive UTC datetimes
+    return value.replace(tzinfo=None)
+
+
+def add(db, kind="work", **kwargs):
+    job = jobs.enqueue(db, kind, **kwargs)
+    db.commit()
+    return job
+
+
+def reload(db, job_id):
+    db.expire_all()
+    return db.get(models.Job, job_id)
+
+
+def test_claim_skips_locked_rows(db):
+    job = add(db)
+    statements = []
+    event.listen(db, "do_orm_execute", lambda state: statements.append(state.statement))
+
+    claimed = jobs.claim_next(db)
+    assert claimed.id == job.id
+    assert claimed.status == JobStatus.RUNNING
+    assert claimed.attempts == 1
+    assert claimed.started_at is not None and claimed.heartbeat_at is not None
+    sql = str(statements[0].compile(dialect=postgresql.dialect()))
+    assert sql.endswith("FOR UPDATE SKIP LOCKED")
+    # Claimed and committed: nobody else gets it
+    assert jobs.claim_next(db) is None
+
+
+def test_claim_order_and_run_after(db):
+    late = add(db, priority=5)
+    first = add(db, priority=0)
+    waiting = add(db, priority=-1)
+    waiting.run_after = jobs._now() + timedelta(hours=1)
+    db.commit()
+
+    assert jobs.claim_next(db).id == first.id
+    assert jobs.claim_next(db).id == late.id
+    assert jobs.claim_next(db) is None
+    assert reload(db, waiting.id).status == JobStatus.QUEUED
+
+
+def test_stale_running_job_is_reclaimed(db):
+    job = add(db)
+    jobs.claim_next(db)
+    # Fresh heartbeat: still owned by its worker
+    assert jobs.claim_next(db) is None
+
+    job = reload(db, job.id)
+    job.heartbeat_at = jobs._now() - timedelta(seconds=settings.JOB_STALE_AFTER + 1)
+    db.commit()
+    claimed = jobs.claim_next(db)
+    assert claimed.id == job.id
+    assert claimed.attempts == 2
+    assert claimed.status == JobStatus.RUNNING
+
+
+def test_stale_job_out_of_attempts_fails(db):
+    job = add(db)
+    jobs.claim_next(db)
+    job = reload(db, job.id)
+    job.attempts = job.max_attempts
+    job.heartbeat_at = jobs._now() - timedelta(seconds=settings.JOB_STALE_AFTER + 1)
+    db.commit()
+
+    assert jobs.claim_next(db) is None
+    job = reload(db, job.id)
+    assert job.status == JobStatus.FAILED
+    assert job.error == "Worker stopped responding"
+    assert job.attempts == job.max_attempts
+
+
+def test_success_enqueues_next_stage(db):
+    seen = []
+
+    @jobs.handler("first")
+    def first(ctx):
+        seen.append(ctx.payload)
+        return {"count": 3, "bounds": (1, 2)}
+
+    job = jobs.enqueue_pipeline(db, ["first", "second"], layer_id=7, payload={"path": "a.tif"})
+    db.commit()
+    assert jobs.work_once()
+
+    job = reload(db, job.id)
+    assert job.status == JobStatus.SUCCEEDED
+    assert job.progress == 1.0
+    assert job.result == {"count": 3, "bounds": [1, 2]}
+    assert seen == [{"path": "a.tif", "pipeline": ["second"]}]
+    following = db.query(models.Job).filter(models.Job.kind == "second").one()
+    assert following.status == JobStatus.QUEUED
+    assert following.layer_id == 7
+    assert following.payload == {"path": "a.tif"}
+
+
+def test_failure_retries_with_backoff_then_fails(db):
+    calls = []
+
+    @jobs.handler("flaky")
+    def flaky(ctx):
+        calls.append(ctx.job.attempts)
+        raise ValueError("bad input")
+
+    job = add(db, kind="flaky")
+    for attempt in (1, 2):
+        before = jobs._now()
+        assert jobs.work_once()
+        job = reload(db, job.id)
+        assert job.status == JobStatus.QUEUED
+        assert job.attempts == attempt
+        assert job.error == "ValueError: bad input"
+        delay = settings.JOB_RETRY_DELAY * 2 ** (attempt - 1)
+        assert naive(job.run_after) >= naive(before + timedelta(seconds=delay))
+        # Not runnable before its backoff is over
+        assert not jobs.work_once()
+        job.run_after = jobs._now() - timedelta(seconds=1)
+        db.commit()
+
+    assert jobs.work_once()
+    job = reload(db, job.id)
+    assert job.status == JobStatus.FAILED
+    assert job.attempts == 3
+    assert calls == [1, 2, 3]
+    assert not jobs.work_once()
+
+
+def test_unknown_kind_fails(db):
+    job = add(db, kind="missing")
+    job.max_attempts = 1
+    db.commit()
+    assert jobs.work_once()
+    job = reload(db, job.id)
+    assert job.status == JobStatus.FAILED
+    assert "No handler registered" in job.error
+
+
+def test_heartbeat_while_handler_runs(db, monkeypatch):
+    # Heartbeat every second
+    monkeypatch.setattr(settings, "JOB_STALE_AFTER", 4)
+
+    @jobs.handler("slow")
+    def slow(ctx):
+        time.sleep(1.5)
+
+    job = add(db, kind="slow")
+    claimed = jobs.claim_next(db)
+    started = claimed.heartbeat_at
+    jobs.run_job(db, claimed)
+
+    job = reload(db, job.id)
+    assert job.status == JobStatus.SUCCEEDED
+    assert naive(job.heartbeat_at) > naive(started)
+
+
+def test_worker_pool_runs_queue(db):
+    done = threading.Event()
+    ran = []
+
+    @jobs.handler("work")
+    def work(ctx):
+        ran.append(ctx.job_id)
+        if len(ran) == 2:
+            done.set()
+
+    ids = [add(db).id, add(db).id]
+    pool = jobs.WorkerPool(1, poll_interval=0.05)
+    pool.start()
+    try:
+        assert done.wait(5)
+    finally:
+        pool.stop(5)
+    assert ran == ids
+    assert [reload(db, i).status for i in ids] == [JobStatus.SUCCEEDED] * 2
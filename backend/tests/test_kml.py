@@ -0,0 +1,158 @@
+import zipfile
+
+import pytest
+
+from app.models.layer import LayerFormat
+from app.services.vector import is_valid_geometry, iter_features, iter_kml_features
+
+SQUARE = "0,0 1,0 1,1 0,1 0,0"
+HOLE = "0.2,0.2 0.2,0.8 0.8,0.8 0.8,0.2 0.2,0.2"
+
+KML = f"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2">
+<Document>
+  <name>Survey</name>
+  <Folder>
+    <name>Outer</name>
+    <Placemark>
+      <name>Well</name>
+      <description>Depth 12 m</description>
+      <Point><coordinates>6.1,46.2,410</coordinates></Point>
+    </Placemark>
+    <Folder>
+      <name>Inner</name>
+      <Placemark>
+        <name>Road</name>
+        <ExtendedData>
+          <Data name="surface"><value>gravel</value></Data>
+          <SchemaData schemaUrl="#roads"><SimpleData name="lanes">2</SimpleData></SchemaData>
+        </ExtendedData>
+        <LineString><coordinates>6.1,46.2 6.2,46.3</coordinates></LineString>
+      </Placemark>
+      <Placemark>
+        <name>Plot</name>
+        <Polygon>
+          <outerBoundaryIs><LinearRing><coordinates>{SQUARE}</coordinates></LinearRing></outerBoundaryIs>
+          <innerBoundaryIs><LinearRing><coordinates>{HOLE}</coordinates></LinearRing></innerBoundaryIs>
+        </Polygon>
+      </Placemark>
+    </Folder>
+  </Folder>
+  <Placemark>
+    <name>Points</name>
+    <MultiGeometry>
+      <Point><coordinates>1,2</coordinates></Point>
+      <Point><coordinates>3,4</coordinates></Point>
+    </MultiGeometry>
+  </Placemark>
+  <Placemark>
+    <name>Fields</name>
+    <MultiGeometry>
+      <Polygon><outerBoundaryIs><LinearRing><coordinates>{SQUARE}</coordinates></LinearRing></outerBoundaryIs></Polygon>
+      <MultiGeometry>
+        <Polygon><outerBoundaryIs><LinearRing><coordinates>{HOLE}</coordinates></LinearRing></outerBoundaryIs></Polygon>
+      </MultiGeometry>
+    </MultiGeometry>
+  </Placemark>
+  <Placemark>
+    <name>Single</name>
+    <MultiGeometry>
+      <LineString><coordinates>0,0 1,1</coordinates></LineString>
+    </MultiGeometry>
+  </Placemark>
+  <Placemark>
+    <name>Mixed</name>
+    <MultiGeometry>
+      <Point><coordinates>5,5</coordinates></Point>
+      <LineString><coordinates>0,0 1,1</coordinates></LineString>
+      <MultiGeometry>
+        <Point><coordinates>6,6</coordinates></Point>
+      </MultiGeometry>
+    </MultiGeometry>
+  </Placemark>
+  <Placemark>
+    <name>No geometry</name>
+  </Placemark>
+</Document>
+</kml>
+"""
+
+
+def coords(text):
+    return [[float(v) for v in p.split(",")] for p in text.split()]
+
+
+@pytest.fixture
+def kml_path(tmp_path):
+    path = tmp_path / "survey.kml"
+    path.write_text(KML)
+    return str(path)
+
+
+@pytest.fixture
+def features(kml_path):
+    return {f["properties"].get("name"): f for f in iter_kml_features(kml_path)}
+
+
+def test_placemarks_of_nested_folders(features):
+    assert list(features) == ["Well", "Road", "Plot", "Points", "Fields", "Single", "Mixed", "No geometry"]
+    assert features["Well"]["geometry"] == {"type": "Point", "coordinates": [6.1, 46.2, 410.0]}
+    assert features["Well"]["properties"]["description"] == "Depth 12 m"
+    assert features["Road"]["geometry"] == {"type": "LineString", "coordinates": [[6.1, 46.2], [6.2, 46.3]]}
+    assert features["Road"]["properties"] == {"name": "Road", "surface": "gravel", "lanes": "2"}
+    assert features["No geometry"]["geometry"] is None
+
+
+def test_polygon_with_hole(features):
+    geometry = features["Plot"]["geometry"]
+    assert geometry == {"type": "Polygon", "coordinates": [coords(SQUARE), coords(HOLE)]}
+    assert is_valid_geometry(geometry)
+
+
+def test_homogeneous_multi_geometry(features):
+    assert features["Points"]["geometry"] == {"type": "MultiPoint", "coordinates": [[1.0, 2.0], [3.0, 4.0]]}
+    # Nested MultiGeometry parts are flattened
+    assert features["Fields"]["geometry"] == {
+        "type": "MultiPolygon", "coordinates": [[coords(SQUARE)], [coords(HOLE)]],
+    }
+    assert features["Single"]["geometry"] == {"type": "LineString", "coordinates": [[0.0, 0.0], [1.0, 1.0]]}
+
+
+def test_mixed_multi_geometry(features):
+    geometry = features["Mixed"]["geometry"]
+    assert geometry == {
+        "type": "GeometryCollection",
+        "geometries": [
+            {"type": "Point", "coordinates": [5.0, 5.0]},
+            {"type": "LineString", "coordinates": [[0.0, 0.0], [1.0, 1.0]]},
+            {"type": "Point", "coordinates": [6.0, 6.0]},
+        ],
+    }
+    # Flat: every member is a single geometry, as ST_GeomFromGeoJSON expects
+    assert is_valid_geometry(geometry)
+
+
+def test_kmz(tmp_path, kml_path):
+    path = tmp_path / "survey.kmz"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("files/overlay.kml", "<kml/>")
+        archive.writestr("files/icon.png", b"\x89PNG")
+        archive.write(kml_path, "doc.kml")
+    features = list(iter_features(str(path), LayerFormat.KMZ))
+    assert [f["properties"]["name"] for f in features] == [
+        "Well", "Road", "Plot", "Points", "Fields", "Single", "Mixed", "No geometry",
+    ]
+
+
+def test_kmz_without_doc_kml(tmp_path):
+    path = tmp_path / "other.kmz"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("nested/deep.kml", "<kml/>")
+        archive.writestr("main.kml", KML)
+    assert len(list(iter_kml_features(str(path), kmz=True))) == 8
+
+
+def test_kml_without_namespace(tmp_path):
+    path = tmp_path / "plain.kml"
+    path.write_text("<kml><Placemark><Point><coordinates>1,2</coordinates></Point></Placemark></kml>")
+    assert [f["geometry"] for f in iter_kml_features(str(path))] == [{"type": "Point", "coordinates": [1.0, 2.0]}]
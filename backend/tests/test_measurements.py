@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from app.models.measurement import MeasurementType, MeasurementUnit
+from app.services import geodesy, measurements
+
+pyproj = pytest.importorskip("pyproj")
+GEOD = pyproj.Geod(ellps="WGS84")
+
+
+def geod_area(rings):
+    """Area of a polygon (shell, *holes) by pyproj"""
+    shell, *holes = rings
+    area = abs(GEOD.polygon_area_perimeter(*zip(*shell))[0])
+    return area - sum(abs(GEOD.polygon_area_perimeter(*zip(*hole))[0]) for hole in holes)
+
+
+@pytest.mark.parametrize("start, end", [
+    ((0.0, 0.0), (1.0, 0.0)),
+    ((2.35, 48.85), (-0.13, 51.51)),  # Paris - London
+    ((-74.0, 40.7), (139.7, 35.7)),  # New York - Tokyo
+    ((0.0, -89.5), (179.0, 89.5)),
+    ((10.0, 10.0), (10.0, 10.0)),
+])
+def test_vincenty_distance_matches_geod(start, end):
+    expected = GEOD.inv(start[0], start[1], end[0], end[1])[2]
+    distance = geodesy.vincenty_distance(
+        np.array([start[0]]), np.array([start[1]]), np.array([end[0]]), np.array([end[1]])
+    )[0]
+    assert distance == pytest.approx(expected, rel=1e-9, abs=1e-6)
+
+
+def test_path_lengths_per_part():
+    lines = [
+        [(6.0, 46.0), (6.1, 46.05), (6.2, 46.0)],
+        [(-3.7, 40.4), (-3.6, 40.5)],
+    ]
+    coords = np.array([p for line in lines for p in line])
+    lengths = geodesy.path_lengths(coords, np.array([0, 3]))
+    for line, length in zip(lines, lengths):
+        lons, lats = zip(*line)
+        assert length == pytest.approx(GEOD.line_length(lons, lats), rel=1e-9)
+
+
+def test_path_lengths_with_height():
+    coords = np.array([(6.0, 46.0, 100.0), (6.01, 46.0, 400.0)])
+    horizontal = GEOD.inv(6.0, 46.0, 6.01, 46.0)[2]
+    assert geodesy.path_lengths(coords, np.array([0]))[0] == pytest.approx(np.hypot(horizontal, 300.0))
+    assert geodesy.path_lengths(coords, np.array([0]), use_height=False)[0] == pytest.approx(horizontal)
+
+
+@pytest.mark.parametrize("ring", [
+    [(0.0, 0.0), (0.01, 0.0), (0.01, 0.01), (0.0, 0.01), (0.0, 0.0)],
+    [(2.33, 48.85), (2.36, 48.85), (2.36, 48.87), (2.33, 48.87)],  # Open ring
+    [(179.99, -16.0), (-179.99, -16.0), (-179.99, -15.98), (179.99, -15.98), (179.99, -16.0)],
+])
+def test_ring_areas_match_geod(ring):
+    area = geodesy.ring_areas(np.array(ring), np.array([0]))[0]
+    assert area == pytest.approx(geod_area([ring]), rel=1e-6)
+
+
+def test_area_of_polygon_with_hole():
+    shell = [(6.0, 46.0), (6.02, 46.0), (6.02, 46.02), (6.0, 46.02), (6.0, 46.0)]
+    hole = [(6.005, 46.005), (6.005, 46.015), (6.015, 46.015), (6.015, 46.005), (6.005, 46.005)]
+    geometry = {"type": "Polygon", "coordinates": [shell, hole]}
+
+    value, unit = measurements.compute_value(geometry, MeasurementType.AREA)
+    assert unit == MeasurementUnit.SQUARE_METERS
+    assert value == pytest.approx(geod_area([shell, hole]), rel=1e-6)
+
+    hectares, _ = measurements.compute_value(geometry, MeasurementType.AREA, MeasurementUnit.HECTARES)
+    assert hectares == pytest.approx(value / 10000)
+
+
+def test_perimeter_includes_holes():
+    shell = [(6.0, 46.0), (6.02, 46.0), (6.02, 46.02), (6.0, 46.02), (6.0, 46.0)]
+    hole = [(6.005, 46.005), (6.005, 46.015), (6.015, 46.015), (6.015, 46.005), (6.005, 46.005)]
+    geometry = {"type": "MultiPolygon", "coordinates": [[shell, hole], [shell]]}
+
+    value, _ = measurements.compute_value(geometry, MeasurementType.PERIMETER)
+    expected = 2 * GEOD.line_length(*zip(*shell)) + GEOD.line_length(*zip(*hole))
+    assert value == pytest.approx(expected, rel=1e-9)
+
+
+def test_distance_in_kilometers():
+    geometry = {"type": "LineString", "coordinates": [[2.35, 48.85], [-0.13, 51.51]]}
+    value, unit = measurements.compute_value(geometry, MeasurementType.DISTANCE, MeasurementUnit.KILOMETERS)
+    assert unit == MeasurementUnit.KILOMETERS
+    assert value == pytest.approx(GEOD.inv(2.35, 48.85, -0.13, 51.51)[2] / 1000, rel=1e-9)
+
+
+def test_area_of_point_is_an_error():
+    with pytest.raises(measurements.MeasurementError, match="area needs a Polygon or MultiPolygon"):
+        measurements.compute_value({"type": "Point", "coordinates": [6.0, 46.0]}, MeasurementType.AREA)
+
+
+def test_errors_do_not_fail_other_items():
+    line = {"type": "LineString", "coordinates": [[0.0, 0.0], [1.0, 0.0]]}
+    results = measurements.compute_values([
+        ({"type": "Point", "coordinates": [0.0, 0.0]}, MeasurementType.AREA, None),
+        (line, MeasurementType.DISTANCE, None),
+        (line, MeasurementType.DISTANCE, MeasurementUnit.HECTARES),
+    ])
+    assert "error" in results[0]
+    assert results[1]["value"] == pytest.approx(GEOD.inv(0.0, 0.0, 1.0, 0.0)[2])
+    assert "error" in results[2]
@@ -0,0 +1,100 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from app import models
+from app.api import deps
+from app.models.job import JobStatus
+from app.utils.pagination import decode_cursor, encode_cursor, keyset, split_page
+
+# Any table ordered by (created_at, id) will do; jobs has no PostGIS columns
+Model = models.Job
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Model.__table__.create(engine)
+    with Session(engine) as session:
+        # Ids out of creation order and several rows per timestamp, so
+        # only the (created_at, id) pair is a strict order
+        for i in range(23):
+            session.add(Model(
+                id=100 - i,
+                kind="k",
+                status=JobStatus.QUEUED,
+                created_at=START + timedelta(seconds=i // 3),
+            ))
+        session.commit()
+        yield session
+    engine.dispose()
+
+
+def expected_order(db):
+    rows = db.scalars(select(Model)).all()
+    return [row.id for row in sorted(rows, key=lambda row: (row.created_at, row.id))]
+
+
+def page(db, after=None, limit=5, skip=0):
+    rows = db.scalars(keyset(select(Model), Model, after, limit, skip)).all()
+    return split_page(rows, limit)
+
+
+def test_cursor_roundtrip():
+    created_at = datetime(2024, 5, 1, 10, 30, 15, 123456)
+    cursor = encode_cursor(created_at, 42)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "garbage!", encode_cursor(START, 1)[:-3], "MjAyNC0wMS0wMQ"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+    with pytest.raises(HTTPException) as e:
+        deps.parse_cursor(cursor)
+    assert e.value.status_code == 422
+
+
+def test_pages_cover_all_rows_once(db):
+    seen, cursor, pages = [], None, 0
+    while True:
+        rows, cursor = page(db, deps.parse_cursor(cursor))
+        seen += [row.id for row in rows]
+        pages += 1
+        if cursor is None:
+            break
+    assert pages == 5
+    assert seen == expected_order(db)
+
+
+def test_last_page_exactly_full(db):
+    rows, cursor = page(db, limit=23)
+    assert len(rows) == 23
+    assert cursor is None
+    rows, cursor = page(db, limit=22)
+    assert cursor == encode_cursor(rows[-1].created_at, rows[-1].id)
+
+
+def test_skip_only_applies_without_cursor(db):
+    order = expected_order(db)
+    rows, cursor = page(db, skip=4)
+    assert [row.id for row in rows] == order[4:9]
+    # A cursor already says where the page starts
+    rows, _ = page(db, decode_cursor(cursor), skip=4)
+    assert [row.id for row in rows] == order[9:14]
+
+
+def test_keyset_query():
+    stmt = keyset(select(Model), Model, (START, 7), limit=50)
+    sql = str(stmt.compile(dialect=postgresql.dialect()))
+    assert "(jobs.created_at, jobs.id) > (" in sql
+    assert "ORDER BY jobs.created_at, jobs.id" in sql
+    assert "OFFSET" not in sql
+    # One extra row tells whether there is a next page
+    assert stmt._limit == 51
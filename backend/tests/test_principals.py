@@ -0,0 +1,72 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app import models
+from app.api import deps
+from app.core.cache import TTLCache
+from app.core.principals import Principal, PrincipalCache
+from app.models.user import UserRole
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = PrincipalCache(TTLCache(100, 60), 60)
+    monkeypatch.setattr(deps, "get_principal_cache", lambda: cache)
+    return cache
+
+
+def make_user(**values):
+    fields = dict(
+        id=7, username="ana", email="ana@example.com", full_name="Ana", hashed_password="$secret",
+        is_active=True, is_superuser=False, role=UserRole.USER,
+        created_at=datetime(2026, 1, 2, tzinfo=timezone.utc), updated_at=None,
+    )
+    return models.User(**{**fields, **values})
+
+
+def test_hit_returns_read_only_principal(cache):
+    cache.set("token", make_user(), cache.generation(7))
+    # The database is not used on a hit
+    principal = asyncio.run(deps.get_current_user(db=None, token="token"))
+    assert isinstance(principal, Principal)
+    assert (principal.id, principal.username, principal.role) == (7, "ana", UserRole.USER)
+    assert principal.created_at == datetime(2026, 1, 2, tzinfo=timezone.utc)
+    assert not hasattr(principal, "hashed_password")
+    with pytest.raises(AttributeError):
+        principal.full_name = "Other"
+    assert asyncio.run(deps.get_current_active_user(principal)) is principal
+
+
+def test_password_hash_is_not_cached(cache):
+    cache.set("token", make_user(), 0)
+    assert "hashed_password" not in cache.get("token")
+
+
+def test_user_change_invalidates_entries(cache):
+    cache.set("token", make_user(), cache.generation(7))
+    cache.invalidate_user(7)
+    assert cache.get("token") is None
+
+
+def test_entry_cached_before_a_concurrent_change_is_ignored(cache):
+    generation = cache.generation(7)  # Read before loading the user
+    cache.invalidate_user(7)  # Committed meanwhile
+    cache.set("token", make_user(), generation)
+    assert cache.get("token") is None
+
+
+def test_entries_do_not_outlive_their_token(cache):
+    cache.set("expired", make_user(), 0, expires_at=time.time() - 1)
+    assert cache.get("expired") is None
+
+
+def test_principal_serializes_as_user(cache):
+    from app import schemas
+
+    cache.set("token", make_user(), 0)
+    principal = asyncio.run(deps.get_current_user(db=None, token="token"))
+    data = schemas.user.User.model_validate(principal).model_dump()
+    assert data["id"] == 7 and data["email"] == "ana@example.com"
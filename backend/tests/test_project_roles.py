@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app import models
+from app.api import deps
+from app.core.cache import TTLCache
+from app.models.project import ProjectMemberRole
+
+USER = models.User(id=3, is_superuser=False)
+
+
+class Request:
+    """Stand-in for the request's AsyncSession: only its memo is used"""
+
+    def __init__(self):
+        self.info = {}
+
+
+@pytest.fixture
+def roles(monkeypatch):
+    """{project id: role of USER}; a missing project is deleted"""
+    state = {1: ProjectMemberRole.EDITOR}
+    loads = []
+
+    async def load(db, project_id, user):
+        loads.append(project_id)
+        if project_id not in state:
+            return None, None
+        return models.Project(id=project_id), state[project_id]
+
+    monkeypatch.setattr(deps, "_load_project_role", load)
+    monkeypatch.setattr(deps, "_project_roles", TTLCache(100, 60))
+    return state, loads
+
+
+def role_of(project_id):
+    return asyncio.run(deps.get_project_role(Request(), project_id, USER))[1]
+
+
+def test_role_is_cached_across_requests(roles):
+    state, loads = roles
+    assert role_of(1) == ProjectMemberRole.EDITOR
+    assert role_of(1) == ProjectMemberRole.EDITOR
+    assert loads == [1]
+
+
+def test_membership_change_invalidates_role(roles):
+    state, loads = roles
+    role_of(1)
+    state[1] = ProjectMemberRole.VIEWER
+    deps.invalidate_project_roles(1, USER.id)
+    assert role_of(1) == ProjectMemberRole.VIEWER
+    assert loads == [1, 1]
+
+
+def test_other_members_keep_their_cached_role(roles):
+    state, loads = roles
+    role_of(1)
+    deps.invalidate_project_roles(1, USER.id + 1)
+    role_of(1)
+    assert loads == [1]
+
+
+def test_deleted_project_is_not_found(roles):
+    state, loads = roles
+    role_of(1)
+    del state[1]
+    deps.invalidate_project_roles(1)
+    with pytest.raises(HTTPException) as e:
+        role_of(1)
+    assert e.value.status_code == 404
+
+
+def test_require_project_role(roles):
+    role = asyncio.run(deps.require_project_role(Request(), 1, USER, ProjectMemberRole.VIEWER))
+    assert role == ProjectMemberRole.EDITOR
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(deps.require_project_role(Request(), 1, USER, ProjectMemberRole.OWNER))
+    assert e.value.status_code == 400
@@ -0,0 +1,170 @@
+import os
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services import storage
+from app.services.storage import S3Storage, StorageError
+
+boto3 = pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+requests = pytest.importorskip("requests")
+
+BUCKET = "geovisor-test"
+PART = 5 * 1024 * 1024  # S3 minimum part size
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    for name, value in {
+        "AWS_ACCESS_KEY_ID": "testing", "AWS_SECRET_ACCESS_KEY": "testing", "AWS_DEFAULT_REGION": "us-east-1",
+    }.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(settings, "S3_BUCKET", BUCKET)
+    monkeypatch.setattr(settings, "S3_PREFIX", "uploads")
+    monkeypatch.setattr(settings, "S3_REGION", "us-east-1")
+    monkeypatch.setattr(settings, "S3_ENDPOINT_URL", "")
+    monkeypatch.setattr(settings, "UPLOAD_PART_SIZE", PART)
+    with moto.mock_aws():
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield S3Storage(str(tmp_path / "cache"))
+
+
+def put_bytes(s3, tmp_path, key, data):
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    s3.put(str(source), key)
+
+
+def test_put_keeps_cached_copy(s3, tmp_path):
+    data = os.urandom(PART + 1234)  # Multipart with the managed transfer
+    put_bytes(s3, tmp_path, "abc/file.las", data)
+    path = s3.local_path("abc/file.las")
+    assert open(path, "rb").read() == data
+    head = s3.client.head_object(Bucket=BUCKET, Key="uploads/abc/file.las")
+    assert head["ContentLength"] == len(data)
+    assert s3.size("abc/file.las") == len(data)
+    assert s3.exists("abc/file.las")
+
+
+def test_fetch_downloads_missing_copy(s3, tmp_path):
+    put_bytes(s3, tmp_path, "a.tif", b"raster")
+    os.remove(s3.local_path("a.tif"))
+    path = s3.fetch("a.tif")
+    assert path == s3.local_path("a.tif")
+    assert open(path, "rb").read() == b"raster"
+
+
+def test_delete(s3, tmp_path):
+    put_bytes(s3, tmp_path, "a.tif", b"raster")
+    s3.delete("a.tif")
+    assert not s3.exists("a.tif")
+    assert s3.size("a.tif") is None
+    assert not os.path.exists(s3.local_path("a.tif"))
+
+
+def test_ranged_reads(s3, tmp_path):
+    data = bytes(range(256)) * 100
+    put_bytes(s3, tmp_path, "cloud.laz", data)
+    assert s3.read_range("cloud.laz", 10, 5) == data[10:15]
+    with s3.open("cloud.laz") as f:
+        assert f.read(4) == data[:4]
+        f.seek(-6, os.SEEK_END)
+        assert f.read() == data[-6:]
+        f.seek(5000)
+        assert f.read(100) == data[5000:5100]
+    with pytest.raises(FileNotFoundError):
+        s3.open("missing.laz")
+
+
+def test_presigned_download(s3, tmp_path):
+    put_bytes(s3, tmp_path, "doc.kml", b"<kml/>")
+    url = s3.download_url("doc.kml", filename="Site plan.kml")
+    assert "X-Amz-Signature=" in url
+    response = requests.get(url)
+    assert response.status_code == 200
+    assert response.content == b"<kml/>"
+    assert response.headers["Content-Disposition"] == "attachment; filename*=UTF-8''Site%20plan.kml"
+
+
+def test_direct_multipart_upload(s3):
+    key = ".partial/upload.tif"
+    parts_data = [os.urandom(PART), b"last part"]
+    upload_id = s3.create_multipart(key)
+    urls = s3.part_urls(key, upload_id, [1, 2])
+    assert len(urls) == 2
+
+    # As a client does, with the presigned URLs only
+    etags = {}
+    for number, (url, data) in enumerate(zip(urls, parts_data), start=1):
+        response = requests.put(url, data=data)
+        assert response.status_code == 200
+        etags[number] = response.headers["ETag"]
+
+    parts = s3.uploaded_parts(key, upload_id)
+    assert {number: part["size"] for number, part in parts.items()} == {1: PART, 2: len(b"last part")}
+    s3.complete_multipart(key, upload_id, {number: part["etag"] for number, part in parts.items()})
+    assert s3.size(key) == PART + len(b"last part")
+    assert s3.read_range(key, PART, 9) == b"last part"
+    head = s3.client.head_object(Bucket=BUCKET, Key="uploads/" + key)
+    assert head["ContentType"] == "image/tiff"
+
+
+def test_complete_multipart_with_wrong_etag(s3):
+    key = ".partial/upload.bin"
+    upload_id = s3.create_multipart(key)
+    requests.put(s3.part_urls(key, upload_id, [1])[0], data=b"data")
+    with pytest.raises(StorageError):
+        s3.complete_multipart(key, upload_id, {1: '"0000"'})
+
+
+def test_abort_multipart(s3):
+    key = ".partial/upload.bin"
+    upload_id = s3.create_multipart(key)
+    s3.abort_multipart(key, upload_id)
+    # Aborting twice (or an unknown upload) is not an error
+    s3.abort_multipart(key, upload_id)
+    assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+
+
+def test_copy(s3, tmp_path):
+    put_bytes(s3, tmp_path, "src.geojson", b"{}")
+    s3.copy("src.geojson", "blobs/dst.geojson")
+    assert s3.read_range("blobs/dst.geojson", 0, 2) == b"{}"
+
+
+def test_trim_cache_evicts_least_recently_used(s3, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_CACHE_MAX_BYTES", 1 << 30)
+    old = time.time() - storage.CACHE_MIN_AGE - 100
+    for index, key in enumerate(["a.bin", "b.bin", "c.bin"]):
+        put_bytes(s3, tmp_path, key, b"x" * 1000)
+        os.utime(s3.local_path(key), (old + index, old + index))
+    os.makedirs(os.path.join(s3.cache_dir, ".partial"))
+    partial = os.path.join(s3.cache_dir, ".partial", "upload.part")
+    with open(partial, "wb") as f:
+        f.write(b"x" * 5000)
+
+    s3.fetch("a.bin")  # Used again: now the most recent
+    assert s3.trim_cache(max_bytes=1500) == 2000
+    assert os.path.exists(s3.local_path("a.bin"))
+    assert not os.path.exists(s3.local_path("b.bin"))
+    assert not os.path.exists(s3.local_path("c.bin"))
+    assert os.path.exists(partial)
+
+    # Evicted copies are still in the bucket
+    assert open(s3.fetch("b.bin"), "rb").read() == b"x" * 1000
+
+
+def test_trim_cache_keeps_recent_copies(s3, tmp_path):
+    put_bytes(s3, tmp_path, "a.bin", b"x" * 1000)
+    assert s3.trim_cache(max_bytes=0) == 0
+    assert os.path.exists(s3.local_path("a.bin"))
+
+
+def test_s3_requires_shared_processed_dir(monkeypatch):
+    monkeypatch.setattr(storage, "_storage", None)
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "s3")
+    monkeypatch.setattr(settings, "SHARED_PROCESSED_DIR", False)
+    with pytest.raises(StorageError):
+        storage.get_storage()
@@ -0,0 +1,68 @@
+import os
+import time
+
+import pytest
+
+from app.services import tile_cache
+from app.services.tile_cache import DiskLRUCache
+
+
+def age(cache, key, seconds):
+    path = os.path.join(cache.root, key)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def disk_size(root):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(root) for f in files)
+
+
+def test_put_get(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1000)
+    assert cache.get("1/mvt-1/0/0/0.pbf") is None
+    cache.put("1/mvt-1/0/0/0.pbf", b"tile")
+    assert cache.get("1/mvt-1/0/0/0.pbf") == b"tile"
+    assert cache.size == 4
+    with pytest.raises(ValueError):
+        cache.put("../outside", b"x")
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 300)
+    for index, key in enumerate(["a", "b", "c"]):
+        cache.put(key, b"x" * 100)
+        age(cache, key, 100 - index)
+    cache._load()  # Order from the file times
+    assert cache.get("a") is not None  # Now the most recent
+    cache.put("d", b"x" * 100)
+    assert cache.get("b") is None
+    assert all(cache.get(key) for key in ("a", "c", "d"))
+
+
+def test_tiles_of_another_process_are_found(tmp_path):
+    writer = DiskLRUCache(str(tmp_path), 1000)
+    reader = DiskLRUCache(str(tmp_path), 1000)
+    assert reader.get("t") is None  # Index loaded while empty
+    writer.put("t", b"tile")
+    assert reader.get("t") == b"tile"
+    assert reader.size == 4
+
+
+def test_size_bound_is_shared(tmp_path, monkeypatch):
+    monkeypatch.setattr(tile_cache, "RESCAN_INTERVAL", 0.0)
+    first = DiskLRUCache(str(tmp_path), 1000)
+    second = DiskLRUCache(str(tmp_path), 1000)
+    for index in range(8):
+        first.put(f"first/{index}", b"x" * 100)
+        second.put(f"second/{index}", b"x" * 100)
+    assert disk_size(str(tmp_path)) <= 1000
+
+
+def test_invalidate_prefix(tmp_path):
+    cache = DiskLRUCache(str(tmp_path), 1000)
+    cache.put("1/mvt-1/0/0/0.pbf", b"one")
+    cache.put("2/mvt-1/0/0/0.pbf", b"two")
+    cache.invalidate_prefix("1")
+    assert cache.get("1/mvt-1/0/0/0.pbf") is None
+    assert cache.get("2/mvt-1/0/0/0.pbf") == b"two"
+    assert cache.size == 3
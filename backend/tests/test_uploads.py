@@ -0,0 +1,115 @@
+import asyncio
+import hashlib
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import DBAPIError
+
+from app import models
+from app.api import uploads as uploads_api
+from app.core.config import settings
+from app.services import uploads
+
+DATA = bytes(range(256)) * 8192  # 2 MB, more than one write buffer
+
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(uploads, "_hash_states", {})
+
+
+async def body(*chunks, fail_after=None):
+    for index, chunk in enumerate(chunks):
+        if fail_after is not None and index == fail_after:
+            raise ConnectionError("client went away")
+        yield chunk
+
+
+def append(offset, *chunks, upload_id="u1", total=len(DATA), **kwargs):
+    return asyncio.run(uploads.append_chunk(upload_id, offset, total, body(*chunks, **kwargs)))
+
+
+def test_chunks_and_checksum():
+    assert append(0, DATA[:700000]) == 700000
+    assert append(700000, DATA[700000:1500000], DATA[1500000:]) == len(DATA)
+    path, sha256 = uploads.finish_chunked("u1")
+    assert open(path, "rb").read() == DATA
+    assert sha256 == hashlib.sha256(DATA).hexdigest()
+
+
+def test_checksum_after_restart():
+    append(0, DATA[:1000])
+    uploads._hash_states.clear()  # Hash state lost: rebuilt from the partial file
+    append(1000, DATA[1000:])
+    assert uploads.finish_chunked("u1")[1] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_offset_mismatch_tells_where_to_resume():
+    append(0, DATA[:1000])
+    with pytest.raises(uploads.OffsetMismatch) as e:
+        append(500, DATA[500:1500])
+    assert e.value.expected == 1000
+    assert uploads.received_bytes("u1") == 1000
+
+
+def test_interrupted_chunk_keeps_received_bytes():
+    with pytest.raises(ConnectionError):
+        append(0, DATA[:300], DATA[300:600], DATA[600:900], fail_after=2)
+    assert uploads.received_bytes("u1") == 600
+    append(600, DATA[600:])
+    assert uploads.finish_chunked("u1")[1] == hashlib.sha256(DATA).hexdigest()
+
+
+def test_chunk_larger_than_declared_size():
+    with pytest.raises(uploads.UploadTooLarge):
+        append(0, DATA[:100], DATA[:100], total=150)
+    assert uploads.received_bytes("u1") == 100
+
+
+def test_concurrent_chunk_in_process_is_busy():
+    async def run():
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def slow():
+            yield DATA[:10]
+            started.set()
+            await release.wait()
+
+        first = asyncio.create_task(uploads.append_chunk("u1", 0, len(DATA), slow()))
+        await started.wait()
+        with pytest.raises(uploads.UploadBusy):
+            await uploads.append_chunk("u1", 10, len(DATA), body(DATA[10:20]))
+        release.set()
+        return await first
+
+    assert asyncio.run(run()) == 10
+
+
+def test_discard():
+    append(0, DATA[:10])
+    uploads.discard_chunked("u1")
+    assert uploads.received_bytes("u1") == 0
+
+
+class LockedSession:
+    """AsyncSession whose NOWAIT lock fails with the given SQLSTATE"""
+
+    def __init__(self, pgcode):
+        self.pgcode = pgcode
+
+    async def execute(self, statement):
+        assert statement._for_update_arg.nowait
+        orig = Exception("could not obtain lock")
+        orig.pgcode = self.pgcode
+        raise DBAPIError(str(statement), {}, orig)
+
+
+def test_upload_locked_by_another_process():
+    upload = models.UploadSession(id="u1")
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(uploads_api.lock_upload_session(LockedSession("55P03"), upload))
+    assert e.value.status_code == 409
+    with pytest.raises(DBAPIError):
+        asyncio.run(uploads_api.lock_upload_session(LockedSession("57014"), upload))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services import volume
+
+rasterio = pytest.importorskip("rasterio")
+pyproj = pytest.importorskip("pyproj")
+
+CRS = "EPSG:32632"
+X0, Y0 = 500000.0, 5100000.0  # Top-left corner, 1 m pixels
+
+
+@pytest.fixture
+def dem(tmp_path):
+    """Flat ground at 100 m with a 10 x 10 m stockpile 5 m high"""
+    from rasterio.transform import from_origin
+
+    data = np.full((100, 100), 100.0, dtype=np.float32)
+    data[40:50, 40:50] = 105.0
+    path = str(tmp_path / "dem.tif")
+    with rasterio.open(
+        path, "w", driver="GTiff", width=100, height=100, count=1, dtype="float32",
+        crs=CRS, transform=from_origin(X0, Y0, 1.0, 1.0),
+    ) as dst:
+        dst.write(data, 1)
+    return {"kind": "raster", "path": path, "crs": CRS}
+
+
+@pytest.fixture(autouse=True)
+def no_pool(monkeypatch):
+    monkeypatch.setattr(settings, "VOLUME_WORKERS", 0)
+
+
+def polygon(minx, miny, maxx, maxy):
+    """WGS84 polygon of a box in DEM coordinates (meters from the top-left corner)"""
+    to_wgs84 = pyproj.Transformer.from_crs(CRS, "EPSG:4326", always_xy=True)
+    ring = [(minx, miny), (maxx, miny), (maxx, maxy), (minx, maxy), (minx, miny)]
+    return {"type": "Polygon", "coordinates": [[list(to_wgs84.transform(X0 + x, Y0 - y)) for x, y in ring]]}
+
+
+def test_stockpile_over_lowest_point_is_cut(dem):
+    result = volume.compute_volume(polygon(10, 10, 90, 90), dem, {"lowest": True})
+    assert result["cut"] == pytest.approx(500.0)
+    assert result["fill"] == 0.0
+    assert result["net"] == pytest.approx(500.0)
+    assert result["base_elevation"] == 100.0
+    assert result["max_elevation"] == 105.0
+
+
+def test_cut_above_and_fill_below_plane(dem):
+    result = volume.compute_volume(polygon(10, 10, 90, 90), dem, {"plane": 102.0})
+    assert result["cut"] == pytest.approx(3.0 * 100)
+    assert result["fill"] == pytest.approx(2.0 * (result["area"] - 100))
+    assert result["net"] == pytest.approx(result["cut"] - result["fill"])
+
+
+def test_polygon_outside_surface(dem):
+    with pytest.raises(volume.VolumeError):
+        volume.compute_volume(polygon(500, 500, 600, 600), dem, {"plane": 100.0})